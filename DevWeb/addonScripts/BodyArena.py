@@ -0,0 +1,98 @@
+"""
+On disk arena for the bodies of buffered HAR entries, used to keep HarWriter within a memory budget.
+
+HarWriter hands every buffered HarEntry to the arena, which tracks the memory of the body texts it holds.
+Once the budget is exceeded, the large response and request body texts of the oldest entries are moved to a
+temporary file and the entries keep only their offset and length (an ArenaRef). They are read back one at a
+time when the HAR is written.
+This module does not depend on mitmproxy.
+"""
+import collections
+import sys
+import tempfile
+
+# Smaller texts are not worth spilling
+SPILL_MIN_SIZE = 1024
+
+
+class ArenaRef:
+    __slots__ = ("offset", "length")
+
+    def __init__(self, offset: int, length: int):
+        self.offset = offset
+        self.length = length
+
+
+def get_text_memory(text) -> int:
+    """
+    Bytes of memory of a body text, not its length: CPython stores 1, 2 or 4 bytes per character (the widest
+    character of the text decides), so a non-ASCII text takes up to 4 times its length
+    """
+    return sys.getsizeof(text) if isinstance(text, str) else 0
+
+
+def get_held_memory(entry) -> int:
+    memory = get_text_memory(entry.content_text)
+    if entry.request_post_data is not None:
+        memory += get_text_memory(entry.request_post_data.get("text"))
+    return memory
+
+
+class BodyArena:
+    def __init__(self, memory_budget: int, directory: str = None):
+        self.memory_budget = memory_budget
+        self.arena_file = tempfile.TemporaryFile(prefix="har_arena_", dir=directory)
+        self.arena_size = 0
+        self.held_memory = 0
+        # Entries that may still be spilled, oldest first
+        self.held_entries = collections.deque()
+        self.spilled_counter = 0
+        self.spilled_bytes = 0
+
+    def add_entry(self, entry):
+        """
+        Tracks a buffered HarEntry.HarEntry and spills the oldest bodies while the budget is exceeded
+        """
+        self.held_memory += get_held_memory(entry)
+        self.held_entries.append(entry)
+        while self.held_memory > self.memory_budget and self.held_entries:
+            self.spill_entry(self.held_entries.popleft())
+
+    def spill_entry(self, entry):
+        if get_text_memory(entry.content_text) >= SPILL_MIN_SIZE:
+            self.held_memory -= get_text_memory(entry.content_text)
+            entry.content_text = self.write_text(entry.content_text)
+        post_data = entry.request_post_data
+        if post_data is not None and get_text_memory(post_data.get("text")) >= SPILL_MIN_SIZE:
+            self.held_memory -= get_text_memory(post_data["text"])
+            post_data["text"] = self.write_text(post_data["text"])
+
+    def write_text(self, text: str) -> ArenaRef:
+        # surrogatepass round trips any str, including undecodable bytes kept as surrogates
+        data = text.encode("utf8", "surrogatepass")
+        self.arena_file.seek(self.arena_size)
+        self.arena_file.write(data)
+        reference = ArenaRef(self.arena_size, len(data))
+        self.arena_size += len(data)
+        self.spilled_counter += 1
+        self.spilled_bytes += len(data)
+        return reference
+
+    def read_text(self, reference: ArenaRef) -> str:
+        self.arena_file.seek(reference.offset)
+        return self.arena_file.read(reference.length).decode("utf8", "surrogatepass")
+
+    def load_har_entry(self, har_entry: dict):
+        """
+        Reads the spilled texts back into a HAR entry object created by HarEntry.to_har
+        """
+        content = har_entry["response"]["content"]
+        if isinstance(content.get("text"), ArenaRef):
+            content["text"] = self.read_text(content["text"])
+        post_data = har_entry["request"].get("postData")
+        if post_data is not None and isinstance(post_data.get("text"), ArenaRef):
+            # The post data object is shared with the HarEntry, which keeps its reference
+            har_entry["request"]["postData"] = dict(post_data, text=self.read_text(post_data["text"]))
+
+    def close(self):
+        self.arena_file.close()
@@ -0,0 +1,158 @@
+"""
+Content addressed store of recorded bodies, kept next to the HAR file.
+
+Every body is stored once, keyed by its SHA-256, and HAR entries point at it with a reference
+("sha256:<hex digest>"). Two layouts are supported:
+    directory - <har path>.bodies/<hex digest>, a file per body
+    pack      - <har path>.bodies.pack, a single file of records: 32 bytes digest, 8 bytes length (big endian), body
+
+A pack is self describing so it can be read even if the recording did not end properly.
+This module does not depend on mitmproxy.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+BODY_STORE_NONE = "none"
+BODY_STORE_DIRECTORY = "directory"
+BODY_STORE_PACK = "pack"
+BODY_STORES = [BODY_STORE_NONE, BODY_STORE_DIRECTORY, BODY_STORE_PACK]
+
+BODY_REF_PREFIX = "sha256:"
+PACK_RECORD_HEADER = struct.Struct(">32sQ")
+
+
+def get_body_store_path(har_file_path: str, store_type: str) -> str:
+    if store_type == BODY_STORE_PACK:
+        return har_file_path + ".bodies.pack"
+    return har_file_path + ".bodies"
+
+
+class BodyStore:
+    def __init__(self, store_path: str, store_type: str, append: bool = False):
+        self.store_path = store_path
+        self.store_type = store_type
+        self.stored_digests = set()
+        self.bodies_counter = 0
+        self.stored_bytes = 0
+        self.duplicated_bytes = 0
+        self.pack_file = None
+        # Bodies may be stored from several threads (the HAR entry builder threads)
+        self.lock = threading.Lock()
+        if store_type == BODY_STORE_PACK:
+            if append and os.path.isfile(store_path):
+                self.pack_file = open(store_path, mode="r+b")
+                self.load_pack_digests()
+            else:
+                self.pack_file = open(store_path, mode="wb")
+        else:
+            os.makedirs(store_path, exist_ok=True)
+
+    def load_pack_digests(self):
+        """
+        Reads the digests of the bodies already in the pack (of a resumed HAR) so they are not stored again, only the
+        record headers are read. A truncated last record (the recording did not end properly) is cut off.
+        """
+        pack_size = os.fstat(self.pack_file.fileno()).st_size
+        offset = 0
+        while offset + PACK_RECORD_HEADER.size <= pack_size:
+            self.pack_file.seek(offset)
+            digest, length = PACK_RECORD_HEADER.unpack(self.pack_file.read(PACK_RECORD_HEADER.size))
+            if offset + PACK_RECORD_HEADER.size + length > pack_size:
+                break
+            self.stored_digests.add(digest)
+            offset += PACK_RECORD_HEADER.size + length
+        self.pack_file.seek(offset)
+        self.pack_file.truncate()
+
+    def store(self, body: bytes) -> str:
+        """
+        Stores the body (unless already stored) and returns its reference
+        """
+        digest = hashlib.sha256(body).digest()
+        with self.lock:
+            self.bodies_counter += 1
+            if digest in self.stored_digests:
+                self.duplicated_bytes += len(body)
+            else:
+                self.stored_digests.add(digest)
+                self.stored_bytes += len(body)
+                if self.pack_file is not None:
+                    self.pack_file.write(PACK_RECORD_HEADER.pack(digest, len(body)))
+                    self.pack_file.write(body)
+                else:
+                    body_path = os.path.join(self.store_path, digest.hex())
+                    if not os.path.exists(body_path):
+                        with open(body_path, mode="wb") as body_file:
+                            body_file.write(body)
+        return BODY_REF_PREFIX + digest.hex()
+
+    def close(self):
+        if self.pack_file is not None:
+            self.pack_file.close()
+            self.pack_file = None
+
+
+class BodyStoreReader:
+    """
+    Resolves body references of a store, the pack file is memory mapped and indexed once when opened
+    """
+
+    def __init__(self, store_path: str):
+        self.store_path = store_path
+        self.pack_file = None
+        self.pack_map = None
+        self.pack_index = {}
+        if os.path.isfile(store_path):
+            self.open_pack()
+
+    def open_pack(self):
+        self.pack_file = open(self.store_path, mode="rb")
+        if os.fstat(self.pack_file.fileno()).st_size == 0:
+            return
+        self.pack_map = mmap.mmap(self.pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = 0
+        pack_size = len(self.pack_map)
+        while offset + PACK_RECORD_HEADER.size <= pack_size:
+            digest, length = PACK_RECORD_HEADER.unpack_from(self.pack_map, offset)
+            offset += PACK_RECORD_HEADER.size
+            if offset + length > pack_size:
+                # Truncated last record
+                break
+            self.pack_index[digest.hex()] = (offset, length)
+            offset += length
+
+    def __contains__(self, body_ref: str) -> bool:
+        hex_digest = body_ref[len(BODY_REF_PREFIX):]
+        if self.pack_file is not None:
+            return hex_digest in self.pack_index
+        return os.path.isfile(os.path.join(self.store_path, hex_digest))
+
+    def get(self, body_ref: str):
+        """
+        Returns the body of the reference
+        :raise KeyError: if the reference is not in the store
+        """
+        if not body_ref.startswith(BODY_REF_PREFIX):
+            raise KeyError(body_ref)
+        hex_digest = body_ref[len(BODY_REF_PREFIX):]
+        if self.pack_file is not None:
+            if hex_digest not in self.pack_index:
+                raise KeyError(body_ref)
+            offset, length = self.pack_index[hex_digest]
+            return self.pack_map[offset:offset + length]
+        body_path = os.path.join(self.store_path, hex_digest)
+        if not os.path.isfile(body_path):
+            raise KeyError(body_ref)
+        with open(body_path, mode="rb") as body_file:
+            return body_file.read()
+
+    def close(self):
+        if self.pack_map is not None:
+            self.pack_map.close()
+            self.pack_map = None
+        if self.pack_file is not None:
+            self.pack_file.close()
+            self.pack_file = None
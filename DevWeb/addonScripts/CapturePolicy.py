@@ -0,0 +1,114 @@
+"""
+Body capture policy, deciding per body whether it is recorded in full, truncated or not at all.
+
+The policy is read from a YAML file listing rules, the first rule matching a body applies and bodies matching no
+rule are captured in full:
+    rules:
+      - mimeTypes: ['image/.*', 'video/.*']   # regular expressions matched against the Content-Type header
+        hosts: []                             # regular expressions matched against the request host
+        minSize: 0                            # the rule applies to bodies of at least this size (bytes)
+        bodies: ['response']                  # the bodies the rule applies to: response and/or request
+        action: metadata                      # full, truncate or metadata
+        truncateSize: 65536                   # bytes kept by the truncate action
+An empty mimeTypes or hosts list matches everything. A truncated body keeps its first truncateSize bytes along with
+the SHA-256 and the size of the whole body, a metadata only body keeps no content at all (only its size and MIME
+type, it is not even decoded so its size is the size on the wire), in both cases only the kept part of the body goes
+through the charset detection and encoding.
+Request bodies are needed to replay the requests, so rules apply to response bodies only unless stated otherwise.
+"""
+import collections
+import hashlib
+import re
+import threading
+
+CAPTURE_FULL = "full"
+CAPTURE_TRUNCATE = "truncate"
+CAPTURE_METADATA = "metadata"
+CAPTURE_ACTIONS = [CAPTURE_FULL, CAPTURE_TRUNCATE, CAPTURE_METADATA]
+
+BODY_RESPONSE = "response"
+BODY_REQUEST = "request"
+
+DEFAULT_TRUNCATE_SIZE = 64 * 1024
+
+
+def compile_patterns(patterns):
+    if not patterns:
+        return None
+    return re.compile("|".join("(?:%s)" % pattern for pattern in patterns), re.IGNORECASE)
+
+
+def load_capture_policy(policy_path: str):
+    # ruamel.yaml is a mitmproxy dependency
+    from ruamel.yaml import YAML
+    with open(policy_path, mode="r", encoding="utf8") as policy_file:
+        config = YAML(typ="safe", pure=True).load(policy_file) or {}
+    return CapturePolicy(config)
+
+
+class CaptureRule:
+    def __init__(self, rule: dict):
+        self.mime_types = compile_patterns(rule.get("mimeTypes"))
+        self.hosts = compile_patterns(rule.get("hosts"))
+        self.min_size = int(rule.get("minSize", 0))
+        self.bodies = frozenset(rule.get("bodies") or [BODY_RESPONSE])
+        self.action = rule.get("action", CAPTURE_FULL)
+        if self.action not in CAPTURE_ACTIONS:
+            raise ValueError("unknown capture action '%s', expected one of %s" % (self.action, CAPTURE_ACTIONS))
+        self.truncate_size = int(rule.get("truncateSize", DEFAULT_TRUNCATE_SIZE))
+
+    def matches(self, body: str, host: str, mime_type: str, size: int) -> bool:
+        return body in self.bodies and size >= self.min_size and \
+            (self.mime_types is None or self.mime_types.match(mime_type) is not None) and \
+            (self.hosts is None or self.hosts.match(host) is not None)
+
+
+class CapturePolicy:
+    def __init__(self, config: dict):
+        self.rules = [CaptureRule(rule) for rule in config.get("rules") or []]
+        self.action_counters = collections.Counter()
+        self.skipped_bytes = 0
+        # Bodies may be captured from several threads (the HAR entry builder threads)
+        self.lock = threading.Lock()
+
+    def get_rule(self, body: str, host: str, mime_type: str, size: int):
+        """
+        Returns the rule applying to a body, or None when the body is captured in full
+        """
+        for rule in self.rules:
+            if rule.matches(body, host, mime_type or "", size):
+                if rule.action == CAPTURE_FULL:
+                    return None
+                return rule
+        return None
+
+    def capture(self, rule: CaptureRule, content: bytes):
+        """
+        Applies a truncate rule to a body.
+        :return: the content to keep and the capture fields to add to the HAR content (None when kept whole)
+        """
+        if len(content) <= rule.truncate_size:
+            return content, None
+        with self.lock:
+            self.action_counters[CAPTURE_TRUNCATE] += 1
+            self.skipped_bytes += len(content) - rule.truncate_size
+        capture_fields = collections.OrderedDict()
+        capture_fields["_capture"] = CAPTURE_TRUNCATE
+        capture_fields["_originalSize"] = len(content)
+        capture_fields["_sha256"] = hashlib.sha256(content).hexdigest()
+        return content[:rule.truncate_size], capture_fields
+
+    def capture_metadata(self, size: int) -> collections.OrderedDict:
+        with self.lock:
+            self.action_counters[CAPTURE_METADATA] += 1
+            self.skipped_bytes += size
+        capture_fields = collections.OrderedDict()
+        capture_fields["_capture"] = CAPTURE_METADATA
+        return capture_fields
+
+    def get_statistics(self) -> collections.OrderedDict:
+        statistics = collections.OrderedDict()
+        statistics["truncated"] = self.action_counters[CAPTURE_TRUNCATE]
+        statistics["metadataOnly"] = self.action_counters[CAPTURE_METADATA]
+        statistics["skippedBytes"] = self.skipped_bytes
+        return statistics
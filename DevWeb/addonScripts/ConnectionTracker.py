@@ -0,0 +1,125 @@
+"""
+Lifecycle statistics of the server connections seen while recording, written as the _connections section.
+
+Connections are tracked by their id only, no reference to mitmproxy's connection objects is kept, so a closed
+connection is released as soon as mitmproxy drops it. Every connection keeps a small record:
+    id, address, tls, startedDateTime                 - the connection and its first request
+    connectTime, tlsSetupTime                         - in milliseconds, -1 when not applicable
+    requests, requestBytes, responseBytes             - headers and (raw) bodies
+    idleTime, maxIdleTime                             - in milliseconds, the gaps between a response and the next
+                                                        request on the connection
+The section also holds the totals and the reuse ratio (the share of the requests sent on an already used connection).
+At most max_connections records are kept: past it, the least recently used connection is folded into the folded
+aggregate (count, requests, requestBytes, responseBytes), which still counts in the totals. A folded connection that
+sees another request gets a new record, its setup times are then reported again.
+This module does not depend on mitmproxy.
+"""
+import collections
+
+
+def to_milliseconds(seconds) -> int:
+    # Negative durations mean not applicable
+    return int(1000 * seconds) if seconds is not None and seconds >= 0 else -1
+
+
+class ConnectionStats:
+    __slots__ = ("id", "address", "tls", "started_date_time", "connect_time", "tls_setup_time", "requests",
+                 "request_bytes", "response_bytes", "idle_time", "max_idle_time", "last_response_end")
+
+    def __init__(self, connection_id: str, address: str, tls: bool, started_date_time: str, connect_time: float,
+                 tls_setup_time: float):
+        self.id = connection_id
+        self.address = address
+        self.tls = tls
+        self.started_date_time = started_date_time
+        self.connect_time = connect_time
+        self.tls_setup_time = tls_setup_time
+        self.requests = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.idle_time = 0.0
+        self.max_idle_time = 0.0
+        self.last_response_end = None
+
+    def to_har(self) -> collections.OrderedDict:
+        connection = collections.OrderedDict()
+        connection["id"] = self.id
+        connection["address"] = self.address
+        connection["tls"] = self.tls
+        connection["startedDateTime"] = self.started_date_time
+        connection["connectTime"] = to_milliseconds(self.connect_time)
+        connection["tlsSetupTime"] = to_milliseconds(self.tls_setup_time)
+        connection["requests"] = self.requests
+        connection["requestBytes"] = self.request_bytes
+        connection["responseBytes"] = self.response_bytes
+        connection["idleTime"] = to_milliseconds(self.idle_time)
+        connection["maxIdleTime"] = to_milliseconds(self.max_idle_time)
+        return connection
+
+
+class ConnectionTracker:
+    def __init__(self, max_connections: int = 0):
+        """
+        :param max_connections: connection records kept, 0 for no limit
+        """
+        self.max_connections = max_connections
+        # Least recently used first
+        self.connections = collections.OrderedDict()
+        self.folded_count = 0
+        self.folded_requests = 0
+        self.folded_request_bytes = 0
+        self.folded_response_bytes = 0
+
+    def is_new(self, connection_id: str) -> bool:
+        """
+        Tells whether no request was recorded on the connection yet (its setup times belong to the next request)
+        """
+        return connection_id not in self.connections
+
+    def add_request(self, connection_id: str, address: str, tls: bool, started_date_time: str,
+                    connect_time: float, tls_setup_time: float, request_start: float, response_end: float,
+                    request_bytes: int, response_bytes: int):
+        stats = self.connections.get(connection_id)
+        if stats is None:
+            stats = self.connections[connection_id] = ConnectionStats(connection_id, address, tls, started_date_time,
+                                                                      connect_time, tls_setup_time)
+            if 0 < self.max_connections < len(self.connections):
+                self.fold_connection(self.connections.popitem(last=False)[1])
+        else:
+            self.connections.move_to_end(connection_id)
+            if stats.last_response_end is not None and request_start is not None:
+                # Requests multiplexed on the connection (HTTP/2) overlap, they have no idle gap
+                idle_gap = max(request_start - stats.last_response_end, 0.0)
+                stats.idle_time += idle_gap
+                stats.max_idle_time = max(stats.max_idle_time, idle_gap)
+        stats.requests += 1
+        stats.request_bytes += request_bytes
+        stats.response_bytes += response_bytes
+        if response_end is not None and (stats.last_response_end is None or response_end > stats.last_response_end):
+            stats.last_response_end = response_end
+
+    def fold_connection(self, stats: ConnectionStats):
+        self.folded_count += 1
+        self.folded_requests += stats.requests
+        self.folded_request_bytes += stats.request_bytes
+        self.folded_response_bytes += stats.response_bytes
+
+    def get_count(self) -> int:
+        return len(self.connections) + self.folded_count
+
+    def get_section(self) -> collections.OrderedDict:
+        count = self.get_count()
+        requests = self.folded_requests + sum(stats.requests for stats in self.connections.values())
+        section = collections.OrderedDict()
+        section["count"] = count
+        section["requests"] = requests
+        section["reuseRatio"] = round((requests - count) / requests, 3) if requests else 0
+        if self.folded_count > 0:
+            folded = collections.OrderedDict()
+            folded["count"] = self.folded_count
+            folded["requests"] = self.folded_requests
+            folded["requestBytes"] = self.folded_request_bytes
+            folded["responseBytes"] = self.folded_response_bytes
+            section["folded"] = folded
+        section["connections"] = [stats.to_har() for stats in self.connections.values()]
+        return section
@@ -0,0 +1,158 @@
+"""
+Batched control events (transactions, actions, steps and logs).
+
+Besides one proxied request per event, the control hosts accept an NDJSON batch body (Content-Type
+application/x-ndjson), and an optional local listener receives the same batches over UDP (one batch per datagram)
+or a Unix socket (a stream of lines per connection). Every line is a JSON object:
+    {"event": "log.info", "content": "...", "timestamp": 1650000000000}
+    event     - the control host of the event, defaults to the host the batch was posted to (required by the listener)
+    name      - transactions and actions
+    content   - steps and logs
+    timestamp - milliseconds since the epoch, defaults to the time the batch was received
+The listener only parses the batches, its events wait in pending_events until HttpHarDumper adds them from the
+master thread.
+This module does not depend on mitmproxy.
+"""
+import collections
+import json
+import os
+import socketserver
+import threading
+import time
+
+# Control host -> event type
+EVENT_TYPES = {
+    "transaction.start": "start",
+    "transaction.end": "stop",
+    "action.start": "start",
+    "action.end": "end",
+    "step.description": "description",
+    "step.comment": "comment",
+    "log.info": "info",
+    "log.debug": "debug",
+    "log.warning": "warning",
+    "log.error": "error",
+}
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson")
+
+LISTENER_UDP = "udp://"
+LISTENER_UNIX = "unix://"
+MAX_DATAGRAM_SIZE = 65535
+
+
+class ControlEvent:
+    __slots__ = ("host", "fields", "received_time")
+
+    def __init__(self, host: str, fields: dict, received_time: float):
+        self.host = host
+        self.fields = fields
+        self.received_time = received_time
+
+
+def is_batch(content_type: str) -> bool:
+    return content_type.split(";", 1)[0].strip().lower() in NDJSON_CONTENT_TYPES
+
+
+def parse_batch(data: bytes, default_host: str = None, received_time: float = None):
+    """
+    Parses an NDJSON batch, lines that are not an event object or name no known event are skipped.
+    :return: the events and the number of skipped lines
+    """
+    if received_time is None:
+        received_time = time.time()
+    events = []
+    invalid_counter = 0
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            fields = json.loads(line)
+        except ValueError:
+            invalid_counter += 1
+            continue
+        host = fields.get("event", default_host) if isinstance(fields, dict) else None
+        if host not in EVENT_TYPES:
+            invalid_counter += 1
+            continue
+        events.append(ControlEvent(host, fields, received_time))
+    return events, invalid_counter
+
+
+class ControlEventListener:
+    def __init__(self, address: str):
+        """
+        :param address: udp://HOST:PORT or unix://PATH
+        """
+        self.address = address
+        self.pending_events = collections.deque()
+        self.messages_counter = 0
+        self.invalid_counter = 0
+        # Unix socket connections are handled on threads of their own
+        self.lock = threading.Lock()
+        self.unix_path = None
+        listener = self
+
+        if address.startswith(LISTENER_UDP):
+            host, _, port = address[len(LISTENER_UDP):].rpartition(":")
+
+            class DatagramHandler(socketserver.BaseRequestHandler):
+                def handle(self):
+                    listener.add_batch(self.request[0])
+
+            self.server = socketserver.UDPServer((host or "127.0.0.1", int(port)), DatagramHandler)
+            self.server.max_packet_size = MAX_DATAGRAM_SIZE
+        elif address.startswith(LISTENER_UNIX):
+            if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+                raise ValueError("Unix sockets are not supported on this platform, use %sHOST:PORT" % LISTENER_UDP)
+            self.unix_path = address[len(LISTENER_UNIX):]
+            if os.path.exists(self.unix_path):
+                # Left over by a previous recording
+                os.remove(self.unix_path)
+
+            class StreamHandler(socketserver.StreamRequestHandler):
+                def handle(self):
+                    for line in self.rfile:
+                        listener.add_batch(line)
+
+            self.server = socketserver.ThreadingUnixStreamServer(self.unix_path, StreamHandler)
+            self.server.daemon_threads = True
+        else:
+            raise ValueError("unsupported control listener address '%s', expected %sHOST:PORT or %sPATH" %
+                             (address, LISTENER_UDP, LISTENER_UNIX))
+        self.thread = threading.Thread(target=self.server.serve_forever, name="ControlEventListener", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def get_address(self) -> str:
+        if self.unix_path is not None:
+            return LISTENER_UNIX + self.unix_path
+        return "%s%s:%s" % ((LISTENER_UDP,) + self.server.server_address[:2])
+
+    def add_batch(self, data: bytes):
+        events, invalid_counter = parse_batch(data)
+        # deque extend is thread safe, the events are taken from the master thread
+        self.pending_events.extend(events)
+        with self.lock:
+            self.messages_counter += 1
+            self.invalid_counter += invalid_counter
+
+    def take_events(self) -> list:
+        events = []
+        while self.pending_events:
+            events.append(self.pending_events.popleft())
+        return events
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.unix_path is not None and os.path.exists(self.unix_path):
+            os.remove(self.unix_path)
+
+    def get_statistics(self) -> collections.OrderedDict:
+        statistics = collections.OrderedDict()
+        statistics["address"] = self.address
+        statistics["messages"] = self.messages_counter
+        statistics["invalid"] = self.invalid_counter
+        return statistics
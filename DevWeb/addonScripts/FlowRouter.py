@@ -0,0 +1,69 @@
+"""
+Routing of the proxied flows, each flow is classified once with a single lookup on its request host:
+    control - DevWeb control-plane requests (shutdown, metrics, transactions, actions, steps and logs), answered by
+              NetworkDumper and turned into events by HttpHarDumper
+    ignored - hosts matching the ignore_hosts option, they are not recorded
+    record  - all the other flows
+The ignore_hosts patterns are compiled to a single regular expression and the route of every host is cached, so the
+patterns run once per host rather than once per flow. The route is kept in the flow metadata and reused by all the
+addons.
+This module does not depend on mitmproxy.
+"""
+import re
+
+ROUTE_CONTROL = "control"
+ROUTE_IGNORED = "ignored"
+ROUTE_RECORD = "record"
+
+CONTROL_SHUTDOWN = "shutdown"
+CONTROL_METRICS = "metrics"
+CONTROL_TRANSACTION = "Transaction"
+CONTROL_ACTION = "Action"
+CONTROL_STEP = "Step"
+CONTROL_LOG = "Log"
+
+METRICS_HOST = "metrics.devweb"
+
+# Control host -> control kind
+CONTROL_HOSTS = {
+    "shutdown.devweb": CONTROL_SHUTDOWN,
+    METRICS_HOST: CONTROL_METRICS,
+    "transaction.start": CONTROL_TRANSACTION,
+    "transaction.end": CONTROL_TRANSACTION,
+    "action.start": CONTROL_ACTION,
+    "action.end": CONTROL_ACTION,
+    "step.description": CONTROL_STEP,
+    "step.comment": CONTROL_STEP,
+    "log.info": CONTROL_LOG,
+    "log.debug": CONTROL_LOG,
+    "log.warning": CONTROL_LOG,
+    "log.error": CONTROL_LOG,
+}
+
+ROUTE_METADATA_KEY = "devweb_route"
+# Beyond it the routes of new hosts are no longer cached
+MAX_CACHED_HOSTS = 10000
+
+
+class FlowRouter:
+    def __init__(self, ignore_hosts):
+        self.ignore_hosts = re.compile("|".join("(?:%s)" % pattern for pattern in ignore_hosts), re.IGNORECASE) \
+            if ignore_hosts else None
+        self.routes = dict.fromkeys(CONTROL_HOSTS, ROUTE_CONTROL)
+
+    def get_host_route(self, host: str) -> str:
+        route = self.routes.get(host)
+        if route is None:
+            route = ROUTE_IGNORED if self.ignore_hosts is not None and self.ignore_hosts.match(host) else ROUTE_RECORD
+            if len(self.routes) < MAX_CACHED_HOSTS:
+                self.routes[host] = route
+        return route
+
+    def get_route(self, flow) -> str:
+        """
+        Returns the route of an HTTP flow, classified on its first call
+        """
+        route = flow.metadata.get(ROUTE_METADATA_KEY)
+        if route is None:
+            route = flow.metadata[ROUTE_METADATA_KEY] = self.get_host_route(flow.request.host)
+        return route
@@ -1,7 +1,8 @@
 import collections
 import json
+import ControlEvents
+import FlowRouter
 import util
-from mitmproxy import ctx
 from mitmproxy import http
 
 '''
@@ -12,8 +13,14 @@ send special data that will be dumped into the HAR file.
 
 def transaction_event_handler(trans_type):
     def handle_transaction(self, flow: http.HTTPFlow):
+        if is_batch_request(flow):
+            handle_batch_request(self, flow)
+            return
         entry = handle_get_request("Transaction", trans_type, flow)
         self.transactions.append(entry)
+        self.har_writer.add_event("_transactions", entry)
+        if trans_type == "stop":
+            self.har_writer.transaction_ended()
         return
 
     return handle_transaction
@@ -21,8 +28,12 @@ def transaction_event_handler(trans_type):
 
 def action_event_handler(action_type):
     def handle_action(self, flow: http.HTTPFlow):
+        if is_batch_request(flow):
+            handle_batch_request(self, flow)
+            return
         entry = handle_get_request("Action", action_type, flow)
         self.actions.append(entry)
+        self.har_writer.add_event("_actions", entry)
         return
 
     return handle_action
@@ -30,8 +41,12 @@ def action_event_handler(action_type):
 
 def step_event_handler(step_type):
     def handle_step(self, flow: http.HTTPFlow):
+        if is_batch_request(flow):
+            handle_batch_request(self, flow)
+            return
         entry = handle_post_request("Step", step_type, flow)
         self.steps.append(entry)
+        self.har_writer.add_event("_steps", entry)
         return
 
     return handle_step
@@ -39,18 +54,73 @@ def step_event_handler(step_type):
 
 def log_event_handler(log_type):
     def handle_log(self, flow: http.HTTPFlow):
+        if is_batch_request(flow):
+            handle_batch_request(self, flow)
+            return
         entry = handle_post_request("Log", log_type, flow)
         self.logs.append(entry)
+        self.har_writer.add_event("_logs", entry)
         return
 
     return handle_log
 
 
+# Control event kind -> (dumper list attribute, HAR section)
+EVENT_SECTIONS = {
+    FlowRouter.CONTROL_TRANSACTION: ("transactions", "_transactions"),
+    FlowRouter.CONTROL_ACTION: ("actions", "_actions"),
+    FlowRouter.CONTROL_STEP: ("steps", "_steps"),
+    FlowRouter.CONTROL_LOG: ("logs", "_logs"),
+}
+
+
+def is_batch_request(flow: http.HTTPFlow) -> bool:
+    return flow.request.method == "POST" and ControlEvents.is_batch(flow.request.headers.get("Content-Type", ""))
+
+
+def handle_batch_request(self, flow: http.HTTPFlow):
+    events, invalid_counter = ControlEvents.parse_batch(util.get_content_safely(flow.request), flow.request.host,
+                                                        flow.request.timestamp_start)
+    invalid_counter += add_control_events(self, events)
+    util.log_debug('Control events batch: {} events, {} invalid', len(events), invalid_counter)
+
+
+def add_control_events(self, events) -> int:
+    """
+    Adds the events of a batch (see ControlEvents) to the dumper lists and the HAR writer
+    :return: the number of events skipped for lack of a name (transactions and actions)
+    """
+    invalid_counter = 0
+    for event in events:
+        kind = FlowRouter.CONTROL_HOSTS[event.host]
+        event_type = ControlEvents.EVENT_TYPES[event.host]
+        entry = collections.OrderedDict()
+        if kind in (FlowRouter.CONTROL_TRANSACTION, FlowRouter.CONTROL_ACTION):
+            if event.fields.get("name") is None:
+                invalid_counter += 1
+                continue
+            entry['name'] = event.fields["name"]
+            entry['type'] = event_type
+        else:
+            entry['type'] = event_type
+            entry['content'] = event.fields.get("content", '')
+        if event.fields.get("timestamp") is not None:
+            entry['startedDateTime'] = util.format_unix_timestamp(event.fields["timestamp"])
+        else:
+            entry['startedDateTime'] = util.format_datetime(event.received_time)
+        list_attribute, section = EVENT_SECTIONS[kind]
+        getattr(self, list_attribute).append(entry)
+        self.har_writer.add_event(section, entry)
+        if kind == FlowRouter.CONTROL_TRANSACTION and event_type == "stop":
+            self.har_writer.transaction_ended()
+    return invalid_counter
+
+
 def handle_get_request(event, event_type, flow: http.HTTPFlow):
     if f'{flow.request.host}/?name' in flow.request.url:
         if flow.request.query.get("name") is not None:
             name = flow.request.query.get("name")
-            ctx.log.debug(f'{event} {event_type} \"{name}\"')
+            util.log_debug('{} {} "{}"', event, event_type, name)
             entry = collections.OrderedDict()
             entry['name'] = name
             entry['type'] = event_type
@@ -63,10 +133,11 @@ def handle_get_request(event, event_type, flow: http.HTTPFlow):
 
 
 def handle_post_request(event, event_type, flow: http.HTTPFlow):
-    if flow.request.text != '':
-        detect_data = util.get_content_as_string(util.get_content_safely(flow.request))
-        content = json.loads(detect_data['content'])
-        ctx.log.debug(f'{event} {event_type}: {detect_data["content"]}')
+    request_content = util.get_content_safely(flow.request)
+    if request_content:
+        # The body is JSON, json.loads detects its UTF-8/16/32 encoding, no charset detection is needed
+        content = json.loads(request_content)
+        util.log_debug('{} {}: {}', event, event_type, content)
         entry = collections.OrderedDict()
         entry['type'] = event_type
         entry['content'] = ''
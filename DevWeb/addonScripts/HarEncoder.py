@@ -0,0 +1,132 @@
+"""
+HAR document encoders.
+
+A HAR document is encoded in three parts so it can be written in a single pass or streamed while recording:
+the header (the 'log' fields up to the opening of the 'entries' array), the entries, and the trailer
+(the closing of the 'entries' array followed by the rest of the 'log' fields such as _transactions and _settings).
+All the parts are returned as utf8 bytes.
+
+This module does not depend on mitmproxy.
+"""
+import json
+from json import encoder as json_encoder
+
+import HarEntry
+
+JSON_STYLE_INDENTED = "indented"
+JSON_STYLE_LINES = "lines"
+JSON_STYLE_COMPACT = "compact"
+JSON_STYLES = [JSON_STYLE_INDENTED, JSON_STYLE_LINES, JSON_STYLE_COMPACT]
+
+# Keys of the 'log' section that are written before the entries array
+HAR_HEADER_KEYS = ("version", "creator", "pages")
+
+
+class IndentedHarEncoder:
+    """
+    The original HAR output, identical to json.JSONEncoder(indent=2).
+    Note that python falls back to its pure python encoder whenever indent is set.
+    """
+
+    def __init__(self):
+        self.json_encoder = json.JSONEncoder(indent=2, default=str, ensure_ascii=False)
+
+    def encode_value(self, value, indent: int) -> bytes:
+        # JSON strings never hold raw new lines, so re-indenting the encoded text is safe
+        return self.json_encoder.encode(value).replace("\n", "\n" + " " * indent).encode("utf8")
+
+    def encode_log_item(self, key: str, value, is_first: bool) -> bytes:
+        return (b"\n    " if is_first else b",\n    ") + self.encode_value(key, 4) + b": " + self.encode_value(value, 4)
+
+    def encode_header(self, log: dict) -> bytes:
+        parts = [b'{\n  "log": {']
+        for index, (key, value) in enumerate(log.items()):
+            parts.append(self.encode_log_item(key, value, index == 0))
+        parts.append(b',\n    "entries": [')
+        return b"".join(parts)
+
+    def encode_entry(self, entry: dict, index: int) -> bytes:
+        return (b"\n      " if index == 0 else b",\n      ") + self.encode_value(entry, 6)
+
+    def encode_trailer(self, entries_count: int, log: dict) -> bytes:
+        parts = [b"\n    ]" if entries_count > 0 else b"]"]
+        for key, value in log.items():
+            parts.append(self.encode_log_item(key, value, False))
+        parts.append(b"\n  }\n}")
+        return b"".join(parts)
+
+
+class CompactHarEncoder:
+    """
+    Compact HAR output using the C accelerated json encoder.
+    Every entry is handed to the C encoder in a single call (measured faster than assembling it out of
+    precomputed key fragments), only the document structure around the entries is built here.
+    """
+    newline = b""
+
+    def __init__(self):
+        self.json_encoder = json.JSONEncoder(separators=(",", ":"), default=str, ensure_ascii=False)
+        # c_encode_basestring when the C accelerator is available
+        self.encode_string = json_encoder.encode_basestring
+
+    def encode_value(self, value) -> bytes:
+        if type(value) is str:
+            return self.encode_string(value).encode("utf8")
+        return self.json_encoder.encode(value).encode("utf8")
+
+    def encode_log_item(self, key: str, value, is_first: bool) -> bytes:
+        return (b"" if is_first else b",") + self.newline + self.encode_value(key) + b":" + self.encode_value(value)
+
+    def encode_header(self, log: dict) -> bytes:
+        parts = [b'{"log":{']
+        for index, (key, value) in enumerate(log.items()):
+            parts.append(self.encode_log_item(key, value, index == 0))
+        parts.append(b"," + self.newline + b'"entries":[')
+        return b"".join(parts)
+
+    def encode_entry(self, entry: dict, index: int) -> bytes:
+        return (b"" if index == 0 else b",") + self.newline + self.encode_value(entry)
+
+    def encode_trailer(self, entries_count: int, log: dict) -> bytes:
+        parts = [self.newline + b"]" if entries_count > 0 else b"]"]
+        for key, value in log.items():
+            parts.append(self.encode_log_item(key, value, False))
+        parts.append(self.newline + b"}}" + self.newline)
+        return b"".join(parts)
+
+
+class LinesHarEncoder(CompactHarEncoder):
+    """
+    Lightly indented HAR output, every entry and every 'log' field is written compact on its own line
+    """
+    newline = b"\n"
+
+
+def create_har_encoder(json_style: str = JSON_STYLE_INDENTED):
+    if json_style == JSON_STYLE_COMPACT:
+        return CompactHarEncoder()
+    if json_style == JSON_STYLE_LINES:
+        return LinesHarEncoder()
+    return IndentedHarEncoder()
+
+
+def encode_entries(json_style: str, entries: list, first_index: int) -> list:
+    """
+    Encodes a chunk of entries (HAR objects or HarEntry records) starting at first_index in the entries array.
+    Runs in the HAR finalization worker processes.
+    """
+    har_encoder = create_har_encoder(json_style)
+    return [har_encoder.encode_entry(HarEntry.to_har_object(entry), first_index + offset)
+            for offset, entry in enumerate(entries)]
+
+
+# Entries of the HAR being written, set before the finalization worker processes are forked so they inherit them
+# instead of receiving them pickled
+inherited_entries = None
+
+
+def encode_inherited_entries(json_style: str, start: int, end: int, first_index: int) -> list:
+    """
+    Encodes the entries start to end of inherited_entries, in a forked finalization worker process
+    """
+    return encode_entries(json_style, inherited_entries[start:end], first_index)
@@ -0,0 +1,92 @@
+"""
+Compact record of a recorded HTTP flow.
+
+HttpHarDumper fills a HarEntry (a single object with __slots__, name/value pairs kept as tuples) instead of a tree
+of OrderedDict objects, the HAR entry object is only created by HarWriter when the entry is written.
+This module does not depend on mitmproxy.
+"""
+import collections
+
+
+def to_name_value_list(pairs):
+    return [{"name": name, "value": value} for name, value in pairs]
+
+
+class HarEntry:
+    __slots__ = ("started_date_time", "time", "server_connection_id",
+                 "request_method", "request_url", "request_http_version", "request_headers", "request_query_string",
+                 "request_cookies", "request_headers_size", "request_body_size", "request_post_data",
+                 "response_status", "response_status_text", "response_http_version", "response_headers",
+                 "response_cookies", "response_redirect_url", "response_headers_size", "response_body_size",
+                 "content_size", "content_mime_type", "content_compression", "content_text", "content_encoding",
+                 "content_body_ref", "content_capture", "timings", "server_ip_address")
+
+    # The HAR timings keys, in the order of the timings tuple
+    TIMINGS_KEYS = ("send", "receive", "wait", "connect", "ssl")
+
+    def __init__(self):
+        for slot in HarEntry.__slots__:
+            setattr(self, slot, None)
+
+    def to_har(self) -> collections.OrderedDict:
+        """
+        Returns the HAR entry object (the same object HttpHarDumper.parse_response used to build)
+        """
+        entry = collections.OrderedDict()
+        entry["startedDateTime"] = self.started_date_time
+        entry["time"] = self.time
+        entry["_serverConnectionId"] = self.server_connection_id
+
+        request = entry["request"] = collections.OrderedDict()
+        request["method"] = self.request_method
+        request["url"] = self.request_url
+        request["httpVersion"] = self.request_http_version
+        if isinstance(self.request_headers, tuple):
+            request["headers"] = to_name_value_list(self.request_headers)
+        else:
+            request["headers"] = self.request_headers
+        request["queryString"] = to_name_value_list(self.request_query_string)
+        request["cookies"] = self.request_cookies
+        request["headersSize"] = self.request_headers_size
+        request["bodySize"] = self.request_body_size
+        if self.request_post_data is not None:
+            request["postData"] = self.request_post_data
+
+        response = entry["response"] = collections.OrderedDict()
+        response["status"] = self.response_status
+        response["statusText"] = self.response_status_text
+        response["httpVersion"] = self.response_http_version
+        response["headers"] = to_name_value_list(self.response_headers)
+        response["cookies"] = self.response_cookies
+        response["redirectURL"] = self.response_redirect_url
+        response["headersSize"] = self.response_headers_size
+        response["bodySize"] = self.response_body_size
+
+        content = response["content"] = collections.OrderedDict()
+        content["size"] = self.content_size
+        content["mimeType"] = self.content_mime_type
+        content["compression"] = self.content_compression
+        if self.content_body_ref is not None:
+            content["_bodyRef"] = self.content_body_ref
+        elif self.content_text is not None:
+            content["text"] = self.content_text
+            if self.content_encoding is not None:
+                content["encoding"] = self.content_encoding
+        if self.content_capture is not None:
+            # The fields of a truncated or metadata only body, see CapturePolicy
+            content.update(self.content_capture)
+
+        entry["cache"] = {}
+        entry["timings"] = dict(zip(HarEntry.TIMINGS_KEYS, self.timings))
+        if self.server_ip_address is not None:
+            entry["serverIPAddress"] = self.server_ip_address
+        return entry
+
+
+def to_har_object(entry):
+    """
+    Returns the HAR object of an entry, which is either a HarEntry or already a HAR object
+    """
+    if isinstance(entry, HarEntry):
+        return entry.to_har()
+    return entry
@@ -0,0 +1,146 @@
+"""
+Binary index of the entries of a HAR file, for random access into large recordings.
+
+The index (<har path>.idx) starts with a header (magic and record size) followed by a fixed size record per entry:
+    offset (8 bytes)           - byte offset of the entry JSON object in the HAR file
+    length (4 bytes)           - byte length of the entry JSON object
+    started (8 bytes, double)  - entry start time (seconds since epoch)
+    status (2 bytes)           - response status code
+    method (8 bytes)           - request method, zero padded
+    host hash (8 bytes)        - 64 bit BLAKE2b hash of the request host
+    url hash (8 bytes)         - 64 bit BLAKE2b hash of the request url
+All the numbers are big endian. Only plain (not compressed) HAR files can be indexed.
+
+This module does not depend on mitmproxy.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+from datetime import datetime
+from urllib.parse import urlsplit
+
+INDEX_MAGIC = b"HARIDX1\0"
+INDEX_HEADER = struct.Struct(">8sI")
+INDEX_RECORD = struct.Struct(">QIdH8sQQ")
+
+
+def get_index_path(har_file_path: str) -> str:
+    return har_file_path + ".idx"
+
+
+def hash_text(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf8"), digest_size=8).digest(), "big")
+
+
+def parse_started_date_time(started_date_time: str) -> float:
+    # util.format_datetime writes the local time followed by 'Z'
+    try:
+        if started_date_time.endswith("Z"):
+            started_date_time = started_date_time[:-1]
+        return datetime.fromisoformat(started_date_time).timestamp()
+    except (AttributeError, ValueError):
+        return 0.0
+
+
+class HarIndexWriter:
+    def __init__(self, index_path: str, append: bool = False):
+        """
+        :param append: add the records to an existing index (of a resumed HAR file)
+        """
+        self.index_path = index_path
+        if append:
+            self.index_file = open(index_path, mode="ab")
+        else:
+            self.index_file = open(index_path, mode="wb")
+            self.index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_RECORD.size))
+
+    def add_entry(self, entry: dict, offset: int, length: int):
+        request = entry.get("request") or {}
+        response = entry.get("response") or {}
+        url = request.get("url", "")
+        self.index_file.write(INDEX_RECORD.pack(offset,
+                                                length,
+                                                parse_started_date_time(entry.get("startedDateTime")),
+                                                response.get("status", 0) or 0,
+                                                request.get("method", "").encode("ascii", "replace")[:8],
+                                                hash_text(urlsplit(url).hostname or ""),
+                                                hash_text(url)))
+
+    def close(self):
+        self.index_file.close()
+
+
+class HarIndexRecord:
+    __slots__ = ("offset", "length", "started", "status", "method", "host_hash", "url_hash")
+
+    def __init__(self, offset, length, started, status, method, host_hash, url_hash):
+        self.offset = offset
+        self.length = length
+        self.started = started
+        self.status = status
+        self.method = method.rstrip(b"\0").decode("ascii")
+        self.host_hash = host_hash
+        self.url_hash = url_hash
+
+
+class HarIndexReader:
+    """
+    Finds entries through the index and reads only them from the HAR file
+    """
+
+    def __init__(self, har_file_path: str, index_path: str = None):
+        self.har_file_path = har_file_path
+        self.index_path = index_path or get_index_path(har_file_path)
+        with open(self.index_path, mode="rb") as index_file:
+            index_data = index_file.read()
+        magic, record_size = INDEX_HEADER.unpack_from(index_data, 0)
+        if magic != INDEX_MAGIC or record_size != INDEX_RECORD.size:
+            raise ValueError("%s is not a HAR index" % self.index_path)
+        records_data = memoryview(index_data)[INDEX_HEADER.size:]
+        # A truncated last record (the recording did not end properly) is ignored
+        records_data = records_data[:len(records_data) - len(records_data) % INDEX_RECORD.size]
+        self.records = [HarIndexRecord(*fields) for fields in INDEX_RECORD.iter_unpack(records_data)]
+        self.har_file = open(self.har_file_path, mode="rb")
+        self.har_map = mmap.mmap(self.har_file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if os.fstat(self.har_file.fileno()).st_size > 0 else None
+
+    def __len__(self):
+        return len(self.records)
+
+    def find(self, host: str = None, url: str = None, method: str = None, status: int = None,
+             started_from: float = None, started_to: float = None):
+        """
+        Yields the index records matching all the given criteria, the host is matched case insensitively
+        """
+        # The writer indexes urlsplit(url).hostname, which is lower case
+        host_hash = hash_text(host.lower()) if host is not None else None
+        url_hash = hash_text(url) if url is not None else None
+        for record in self.records:
+            if host_hash is not None and record.host_hash != host_hash:
+                continue
+            if url_hash is not None and record.url_hash != url_hash:
+                continue
+            if method is not None and record.method != method:
+                continue
+            if status is not None and record.status != status:
+                continue
+            if started_from is not None and record.started < started_from:
+                continue
+            if started_to is not None and record.started > started_to:
+                continue
+            yield record
+
+    def read_entry(self, record: HarIndexRecord) -> dict:
+        return json.loads(self.har_map[record.offset:record.offset + record.length])
+
+    def read_entries(self, **criteria):
+        for record in self.find(**criteria):
+            yield self.read_entry(record)
+
+    def close(self):
+        if self.har_map is not None:
+            self.har_map.close()
+            self.har_map = None
+        self.har_file.close()
@@ -0,0 +1,223 @@
+"""
+Append-only NDJSON journal of a HAR recording and the recovery of a HAR file out of a (partial) journal.
+
+Every line of the journal is a single JSON record:
+    {"type": "header", "data": {...}}                                       - the 'log' fields written before entries
+    {"type": "entry", "data": {...}}                                        - a single HAR entry
+    {"type": "event", "section": "_transactions", "group": null, "data": {...}}  - a control / websocket event
+    {"type": "section", "section": "_logs", "data": [...]}                  - a complete trailing section
+    {"type": "settings", "key": "_proxy", "data": {...}}                    - a '_settings' item
+    {"type": "resume", "data": {...}}                                       - the resume point of an existing HAR file
+                                                                              the entries are appended to (HarResume)
+
+This module does not depend on mitmproxy so a HAR can be recovered with a plain python interpreter:
+    python HarJournal.py <journal path> [<har path> [<resumed har path>]]
+The recovered HAR is a new file, an existing file is never overwritten. The recovered HAR of a recording appended to an
+existing HAR file starts with the entries of that file (it is copied up to its resume point), the resumed HAR path
+defaults to the path it had when the recording started.
+"""
+import collections
+import json
+import os
+import sys
+import time
+
+import HarEncoder
+import HarResume
+
+JOURNAL_SUFFIX = ".journal"
+RESUME_RECORD_PREFIX = '{"type":"resume"'
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def get_journal_path(har_file_path: str) -> str:
+    return har_file_path + JOURNAL_SUFFIX
+
+
+def rotate_journal(journal_path: str):
+    """
+    Moves a journal left over by a recording that did not end (not recovered yet) to the first free
+    <journal path>.1, .2... so starting a new recording never destroys it
+    :return: the path the journal was moved to, None if there was no journal
+    """
+    if not os.path.exists(journal_path):
+        return None
+    index = 1
+    while os.path.exists("%s.%s" % (journal_path, index)):
+        index += 1
+    rotated_path = "%s.%s" % (journal_path, index)
+    os.rename(journal_path, rotated_path)
+    return rotated_path
+
+
+class HarJournal:
+    def __init__(self, journal_path: str, fsync_interval: float):
+        self.journal_path = journal_path
+        self.fsync_interval = fsync_interval
+        self.rotated_path = rotate_journal(journal_path)
+        self.journal_file = open(journal_path, mode="x", encoding="utf8")
+        self.last_sync_time = time.monotonic()
+        self.records_counter = 0
+
+    def write_header(self, log: dict):
+        self.write_record({"type": "header", "data": log})
+
+    def write_entry(self, entry: dict):
+        self.write_record({"type": "entry", "data": entry})
+
+    def write_event(self, section: str, entry, group: str = None):
+        self.write_record({"type": "event", "section": section, "group": group, "data": entry})
+
+    def write_section(self, section: str, entries):
+        self.write_record({"type": "section", "section": section, "data": entries})
+
+    def write_settings(self, settings_key: str, description):
+        self.write_record({"type": "settings", "key": settings_key, "data": description})
+
+    def write_resume(self, resume_record: dict):
+        self.write_record({"type": "resume", "data": resume_record})
+
+    def write_record(self, record: dict):
+        # Flushing every record hands it to the OS so a killed process loses nothing,
+        # fsync (surviving a machine crash) is paid only once per interval.
+        self.journal_file.write(json.dumps(record, default=str, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.journal_file.flush()
+        self.records_counter += 1
+        if time.monotonic() - self.last_sync_time >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        os.fsync(self.journal_file.fileno())
+        self.last_sync_time = time.monotonic()
+
+    def close(self, remove: bool = False):
+        self.sync()
+        self.journal_file.close()
+        if remove:
+            os.remove(self.journal_path)
+
+
+def read_journal(journal_path: str):
+    """
+    Yields the records of the journal, a truncated last line (the process was killed mid-write) is skipped
+    """
+    with open(journal_path, mode="r", encoding="utf8") as journal_file:
+        for line_number, line in enumerate(journal_file, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line, object_pairs_hook=collections.OrderedDict)
+            except ValueError:
+                print("Skipping corrupted journal record at line %s" % line_number, file=sys.stderr)
+
+
+def find_resume_record(journal_path: str):
+    """
+    Returns the resume record of the journal, None when the recording did not append to an existing HAR file.
+    Only the start of the lines is compared, the other records are not parsed.
+    """
+    with open(journal_path, mode="r", encoding="utf8") as journal_file:
+        for line in journal_file:
+            if line.startswith(RESUME_RECORD_PREFIX):
+                return json.loads(line, object_pairs_hook=collections.OrderedDict)["data"]
+    return None
+
+
+def copy_resumed_entries(resumed_har_path: str, entries_end: int, har_file):
+    """
+    Copies the resumed HAR file up to its resume point (its header and entries)
+    """
+    with open(resumed_har_path, mode="rb") as resumed_file:
+        if os.fstat(resumed_file.fileno()).st_size < entries_end:
+            raise ValueError("%s is shorter than its resume point, it is not the resumed HAR file" % resumed_har_path)
+        remaining = entries_end
+        while remaining > 0:
+            chunk = resumed_file.read(min(COPY_CHUNK_SIZE, remaining))
+            har_file.write(chunk)
+            remaining -= len(chunk)
+
+
+def recover_har(journal_path: str, har_file_path: str, json_style: str = HarEncoder.JSON_STYLE_INDENTED,
+                resumed_har_path: str = None) -> int:
+    """
+    Rebuilds a valid HAR file out of a journal. Entries are streamed to the HAR file, only the trailing
+    sections are held in memory.
+    :param har_file_path: the recovered HAR, must not exist
+    :param resumed_har_path: the HAR file the recording appended to, when it was moved since
+    :return: the number of recovered entries
+    """
+    header = None
+    sections = collections.OrderedDict()
+    settings = collections.OrderedDict()
+    resume_record = find_resume_record(journal_path)
+    if resume_record is not None:
+        json_style = resume_record["json_style"]
+        resumed_har_path = resumed_har_path or resume_record["har_file_path"]
+        if not os.path.isfile(resumed_har_path):
+            raise ValueError("the recording appended to %s, which is not found" % resumed_har_path)
+    har_encoder = HarEncoder.create_har_encoder(json_style)
+    # The first entry of a file is encoded without a separator
+    first_index = 1 if resume_record is not None and resume_record["has_entries"] else 0
+
+    entries_counter = 0
+    with open(har_file_path, mode="xb") as har_file:
+        if resume_record is not None:
+            copy_resumed_entries(resumed_har_path, resume_record["entries_end"], har_file)
+        for record in read_journal(journal_path):
+            record_type = record.get("type")
+            if record_type == "header":
+                header = record["data"]
+                if resume_record is None:
+                    har_file.write(har_encoder.encode_header(header))
+            elif record_type == "entry":
+                if header is None:
+                    raise ValueError("journal %s has no header record" % journal_path)
+                har_file.write(har_encoder.encode_entry(record["data"], first_index + entries_counter))
+                entries_counter += 1
+            elif record_type == "event":
+                if record.get("group") is None:
+                    sections.setdefault(record["section"], []).append(record["data"])
+                else:
+                    section = sections.setdefault(record["section"], collections.OrderedDict())
+                    section.setdefault(record["group"], []).append(record["data"])
+            elif record_type == "section":
+                sections[record["section"]] = record["data"]
+            elif record_type == "settings":
+                settings[record["key"]] = record["data"]
+
+        if header is None:
+            raise ValueError("journal %s has no header record" % journal_path)
+        if len(settings) > 0:
+            sections["_settings"] = settings
+        if resume_record is not None:
+            sections = HarResume.merge_trailing_sections(resume_record["trailing_sections"], sections)
+        har_file.write(har_encoder.encode_trailer(first_index + entries_counter, sections))
+
+    return entries_counter
+
+
+def get_default_har_path(journal_path: str) -> str:
+    """
+    Returns the HAR path of a journal, also of a journal moved aside when a new recording started (.journal.1)
+    """
+    base_path, _, rotation = journal_path.rpartition(".")
+    if rotation.isdigit() and base_path.endswith(JOURNAL_SUFFIX):
+        journal_path = base_path
+    if journal_path.endswith(JOURNAL_SUFFIX):
+        return journal_path[:-len(JOURNAL_SUFFIX)]
+    return journal_path + ".har"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python HarJournal.py <journal path> [<har path> [<resumed har path>]]", file=sys.stderr)
+        sys.exit(2)
+    source_journal_path = sys.argv[1]
+    target_har_path = sys.argv[2] if len(sys.argv) > 2 else get_default_har_path(source_journal_path)
+    if os.path.exists(target_har_path):
+        print("%s already exists and is never overwritten, give the path of the recovered HAR: "
+              "python HarJournal.py %s <har path>" % (target_har_path, source_journal_path), file=sys.stderr)
+        sys.exit(1)
+    recovered = recover_har(source_journal_path, target_har_path,
+                            resumed_har_path=sys.argv[3] if len(sys.argv) > 3 else None)
+    print("Recovered %s entries to %s" % (recovered, target_har_path))
@@ -0,0 +1,225 @@
+"""
+Resume point of an existing HAR file, so a new recording can append its entries in place.
+
+The end of the entries array is found by scanning the file backwards from its end over the trailing sections
+(_transactions, _settings, ...), the entries themselves are never read except for the last one. Right before the
+first new bytes are written, the resume point (with the trailing sections) is saved to <har path>.resume and the file
+is truncated right after the last entry, the new entries are appended and the trailing sections are written again,
+merged with the ones of the previous recordings. The .resume file is removed once the file is closed.
+If the recording does not end, the file can be closed again as it was before it was resumed (the entries of the
+unfinished recording are dropped, recover them from its journal first, see HarJournal):
+    python HarResume.py <har path>
+This module does not depend on mitmproxy.
+"""
+import collections
+import json
+import mmap
+import os
+import sys
+
+import HarEncoder
+
+RESUME_SUFFIX = ".resume"
+
+WHITESPACE = b" \t\r\n"
+# Bytes that end a number, true, false or null when scanning backwards
+SCALAR_DELIMITERS = b",:[{" + WHITESPACE
+
+
+def get_resume_path(har_file_path: str) -> str:
+    return har_file_path + RESUME_SUFFIX
+
+
+class HarResumePoint:
+    def __init__(self, entries_end: int, has_entries: bool, trailing_sections: collections.OrderedDict):
+        # Offset right after the last entry (or after the opening of an empty entries array)
+        self.entries_end = entries_end
+        self.has_entries = has_entries
+        self.trailing_sections = trailing_sections
+
+    def to_record(self, har_file_path: str, json_style: str) -> collections.OrderedDict:
+        """
+        Returns what closes the file again at the resume point, saved to the .resume file and to the journal
+        """
+        record = collections.OrderedDict()
+        record["har_file_path"] = os.path.abspath(har_file_path)
+        record["entries_end"] = self.entries_end
+        record["has_entries"] = self.has_entries
+        record["json_style"] = json_style
+        record["trailing_sections"] = self.trailing_sections
+        return record
+
+
+def save_resume_record(record: dict, resume_path: str):
+    """
+    Writes the record of a resume point to disk (synced) before the resumed file is truncated
+    """
+    temporary_path = resume_path + ".tmp"
+    with open(temporary_path, mode="w", encoding="utf8") as resume_file:
+        json.dump(record, resume_file, default=str, ensure_ascii=False)
+        resume_file.flush()
+        os.fsync(resume_file.fileno())
+    os.replace(temporary_path, resume_path)
+
+
+def load_resume_record(resume_path: str) -> collections.OrderedDict:
+    with open(resume_path, mode="r", encoding="utf8") as resume_file:
+        return json.load(resume_file, object_pairs_hook=collections.OrderedDict)
+
+
+def restore_har(har_file_path: str) -> int:
+    """
+    Closes a resumed file whose recording did not end as it was before it was resumed, out of its .resume file
+    :return: the size of the restored file
+    """
+    resume_path = get_resume_path(har_file_path)
+    record = load_resume_record(resume_path)
+    har_encoder = HarEncoder.create_har_encoder(record["json_style"])
+    with open(har_file_path, mode="r+b") as har_file:
+        if os.fstat(har_file.fileno()).st_size < record["entries_end"]:
+            raise ValueError("%s is shorter than its resume point, it is not the resumed file" % har_file_path)
+        har_file.seek(record["entries_end"])
+        har_file.truncate()
+        har_file.write(har_encoder.encode_trailer(1 if record["has_entries"] else 0, record["trailing_sections"]))
+        har_file.flush()
+        os.fsync(har_file.fileno())
+        size = har_file.tell()
+    os.remove(resume_path)
+    return size
+
+
+def skip_whitespace_back(data, position: int) -> int:
+    while position >= 0 and data[position] in WHITESPACE:
+        position -= 1
+    return position
+
+
+def expect_back(data, position: int, expected: bytes) -> int:
+    position = skip_whitespace_back(data, position)
+    if position < 0 or data[position] != expected[0]:
+        raise ValueError("expected %r at offset %s" % (expected, position))
+    return position
+
+
+def find_string_start(data, end: int) -> int:
+    """
+    Returns the offset of the opening quote of the string closed by the quote at end
+    """
+    position = end - 1
+    while True:
+        position = data.rfind(b'"', 0, position + 1)
+        if position < 0:
+            raise ValueError("unterminated string ending at offset %s" % end)
+        backslashes = 0
+        while position - backslashes > 0 and data[position - backslashes - 1] == ord("\\"):
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return position
+        position -= 1
+
+
+def find_value_start(data, end: int) -> int:
+    """
+    Returns the offset of the first byte of the JSON value whose last byte is at end
+    """
+    last = data[end]
+    if last == ord('"'):
+        return find_string_start(data, end)
+    if last not in b"]}":
+        position = end
+        while position > 0 and data[position - 1] not in SCALAR_DELIMITERS:
+            position -= 1
+        return position
+    depth = 0
+    position = end
+    while position >= 0:
+        byte = data[position]
+        if byte == ord('"'):
+            position = find_string_start(data, position)
+        elif byte in b"]}":
+            depth += 1
+        elif byte in b"[{":
+            depth -= 1
+            if depth == 0:
+                return position
+        position -= 1
+    raise ValueError("unbalanced value ending at offset %s" % end)
+
+
+def read_key_back(data, value_start: int):
+    """
+    Returns the key of the object member whose value starts at value_start, and the offset before the key
+    """
+    colon = expect_back(data, value_start - 1, b":")
+    key_end = expect_back(data, colon - 1, b'"')
+    key_start = find_string_start(data, key_end)
+    return json.loads(bytes(data[key_start:key_end + 1]).decode("utf8")), key_start - 1
+
+
+def find_entries_end(data, array_end: int):
+    """
+    Checks whether the 'log' member array closed at array_end is the entries array.
+    Returns (entries end offset, has entries), or None when it is another (trailing) array.
+    """
+    last = skip_whitespace_back(data, array_end - 1)
+    if data[last] == ord("["):
+        key, _ = read_key_back(data, last)
+        return (last + 1, False) if key == "entries" else None
+    if data[last] != ord("}"):
+        return None
+    # A HAR entry, unlike the items of the trailing arrays, has a request and a response
+    last_item = json.loads(bytes(data[find_value_start(data, last):last + 1]).decode("utf8"))
+    if "request" in last_item and "response" in last_item:
+        return last + 1, True
+    return None
+
+
+def find_resume_point(har_file_path: str) -> HarResumePoint:
+    """
+    :raise ValueError: if the file is not a complete HAR file
+    """
+    with open(har_file_path, mode="rb") as har_file:
+        with mmap.mmap(har_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            log_end = expect_back(data, expect_back(data, len(data) - 1, b"}") - 1, b"}")
+            position = log_end - 1
+            # Every 'log' member after the entries array is passed over backwards: value, ':', key and ','
+            while True:
+                value_end = skip_whitespace_back(data, position)
+                if value_end < 0:
+                    raise ValueError("no entries array found")
+                if data[value_end] == ord("]"):
+                    entries_end = find_entries_end(data, value_end)
+                    if entries_end is not None:
+                        break
+                _, position = read_key_back(data, find_value_start(data, value_end))
+                position = expect_back(data, position, b",") - 1
+            trailer = bytes(data[value_end + 1:log_end + 1]).decode("utf8").strip()
+    trailing_sections = collections.OrderedDict()
+    if trailer.startswith(","):
+        trailing_sections = json.loads("{" + trailer[1:], object_pairs_hook=collections.OrderedDict)
+    return HarResumePoint(entries_end[0], entries_end[1], trailing_sections)
+
+
+def merge_trailing_sections(previous: dict, current: dict) -> collections.OrderedDict:
+    """
+    Merges the trailing sections of the previous recordings with the ones of the current recording:
+    lists are concatenated, objects are merged (recursively) and other values are replaced.
+    """
+    merged = collections.OrderedDict(previous)
+    for key, value in current.items():
+        previous_value = merged.get(key)
+        if isinstance(previous_value, list) and isinstance(value, list):
+            merged[key] = previous_value + value
+        elif isinstance(previous_value, dict) and isinstance(value, dict):
+            merged[key] = merge_trailing_sections(previous_value, value)
+        else:
+            merged[key] = value
+    return merged
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python HarResume.py <har path>", file=sys.stderr)
+        sys.exit(2)
+    restored_size = restore_har(sys.argv[1])
+    print("Restored %s (%s bytes)" % (sys.argv[1], restored_size))
@@ -0,0 +1,77 @@
+"""
+Manifest of a sharded HAR recording.
+
+A sharded recording is written as a series of complete HAR files (<base>.0001.har, <base>.0002.har, ...)
+and a manifest (<base>.manifest.json) listing every shard with its entries count, time range and hosts,
+so tools can open only the shards they need. The trailing sections (_transactions, _settings, ...) are
+written to the last shard.
+
+This module does not depend on mitmproxy.
+"""
+import collections
+import json
+import os
+from urllib.parse import urlsplit
+
+MANIFEST_VERSION = 1
+
+
+class HarShardManifest:
+    def __init__(self, har_file_path: str, har_dump_format: str):
+        suffix = "." + har_dump_format
+        self.base_path = har_file_path[:-len(suffix)] if har_file_path.endswith(suffix) else har_file_path
+        self.har_dump_format = har_dump_format
+        self.manifest_path = self.base_path + ".manifest.json"
+        self.shards = []
+        self.current_shard = None
+
+    def open_shard(self) -> str:
+        """
+        Starts a new shard and returns its path
+        """
+        shard_path = "%s.%04d.%s" % (self.base_path, len(self.shards) + 1, self.har_dump_format)
+        self.current_shard = collections.OrderedDict()
+        self.current_shard["file"] = os.path.basename(shard_path)
+        self.current_shard["entries"] = 0
+        self.current_shard["startedDateTime"] = None
+        self.current_shard["lastStartedDateTime"] = None
+        self.current_shard["hosts"] = set()
+        self.shards.append(self.current_shard)
+        return shard_path
+
+    def add_entry(self, entry: dict):
+        shard = self.current_shard
+        shard["entries"] += 1
+        # The ISO formatted dates are compared as strings
+        started_date_time = entry.get("startedDateTime")
+        if started_date_time is not None:
+            if shard["startedDateTime"] is None or started_date_time < shard["startedDateTime"]:
+                shard["startedDateTime"] = started_date_time
+            if shard["lastStartedDateTime"] is None or started_date_time > shard["lastStartedDateTime"]:
+                shard["lastStartedDateTime"] = started_date_time
+        request = entry.get("request")
+        if request is not None:
+            host = urlsplit(request["url"]).hostname
+            if host:
+                shard["hosts"].add(host)
+
+    def close_shard(self, shard_size: int, has_trailing_sections: bool):
+        self.current_shard["bytes"] = shard_size
+        if has_trailing_sections:
+            self.current_shard["trailingSections"] = True
+        self.current_shard = None
+        self.write_manifest()
+
+    def write_manifest(self):
+        manifest = collections.OrderedDict()
+        manifest["version"] = MANIFEST_VERSION
+        manifest["format"] = self.har_dump_format
+        manifest["entries"] = sum(shard["entries"] for shard in self.shards)
+        manifest["shards"] = [collections.OrderedDict((key, sorted(value) if key == "hosts" else value)
+                                                      for key, value in shard.items())
+                              for shard in self.shards]
+        # Written aside and renamed so readers never see a partial manifest
+        temporary_manifest_path = self.manifest_path + ".tmp"
+        with open(temporary_manifest_path, mode="w", encoding="utf8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, ensure_ascii=False)
+        os.replace(temporary_manifest_path, self.manifest_path)
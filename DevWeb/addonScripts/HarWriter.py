@@ -1,16 +1,67 @@
 import collections
-import json
+import concurrent.futures
+import gzip
+import lzma
+import multiprocessing
 import os
+import pickle
+import sys
 from collections import OrderedDict
 
+import BodyArena
+import BodyStore
+import HarEncoder
+import HarEntry
+import HarIndex
+import HarJournal
+import HarResume
+import HarShards
+import HarWriterQueue
 from mitmproxy import ctx
 from mitmproxy import version
 from mitmproxy import addonmanager
 
+from HarEncoder import HAR_HEADER_KEYS
+
+HAR_DUMP_FORMAT_PLAIN = "har"
+HAR_DUMP_FORMAT_GZIP = "har.gz"
+HAR_DUMP_FORMAT_XZ = "har.xz"
+HAR_DUMP_FORMATS = [HAR_DUMP_FORMAT_PLAIN, HAR_DUMP_FORMAT_GZIP, HAR_DUMP_FORMAT_XZ]
+
+# Entries handed to a finalization worker process at once
+FINALIZE_CHUNK_SIZE = 1000
+# Measured memory of a buffered HarEntry record without its bodies, used to estimate the memory of the HAR
+ENTRY_MEMORY_ESTIMATE = 900
+
+
+def get_finalize_context():
+    """
+    Returns the multiprocessing context of the finalization workers, None when they cannot be used.
+    Only forked workers are used: a spawned worker starts the recorder executable again to import its main module,
+    which a frozen mitmdump (no freeze_support) or a spawn only platform (Windows) cannot do for an addon script.
+    """
+    if getattr(sys, "frozen", False) or "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context("fork")
+
 
 class HarWriter:
     entry_counter: int = None
     HAR: OrderedDict = None
+    har_file = None
+    har_file_path: str = None
+    har_encoder = None
+    har_index: HarIndex.HarIndexWriter = None
+    bytes_written: int = None
+    file_entry_counter: int = None
+    resume_point: HarResume.HarResumePoint = None
+    resume_truncate_pending: bool = None
+    shards: HarShards.HarShardManifest = None
+    journal: HarJournal.HarJournal = None
+    body_store: BodyStore.BodyStore = None
+    body_arena: BodyArena.BodyArena = None
+    writer_queue: HarWriterQueue.HarWriterQueue = None
+    held_body_memory: int = None
 
     def __init__(self):
         self.HAR: OrderedDict = collections.OrderedDict()
@@ -22,49 +73,533 @@ class HarWriter:
         self.HAR['log']['pages'] = []
         self.HAR['log']['entries'] = []
         self.entry_counter = 0
+        self.har_file = None
+        self.har_file_path = None
+        self.har_encoder = None
+        self.har_index = None
+        self.bytes_written = 0
+        self.file_entry_counter = 0
+        self.resume_point = None
+        self.resume_truncate_pending = False
+        self.shards = None
+        self.journal = None
+        self.body_store = None
+        self.body_arena = None
+        self.writer_queue = None
+        self.held_body_memory = 0
 
     def load(self, loader: addonmanager.Loader):
         loader.add_option(name="har_dump_file_path",
                           typespec=str,
                           default=os.path.join(os.getcwd(), 'tmp.har'),
                           help="HAR dump path.", )
+        loader.add_option(name="har_dump_streaming",
+                          typespec=bool,
+                          default=False,
+                          help="Write HAR entries to disk as flows complete instead of holding them in memory.", )
+        loader.add_option(name="har_dump_json_style",
+                          typespec=str,
+                          default=HarEncoder.JSON_STYLE_INDENTED,
+                          choices=HarEncoder.JSON_STYLES,
+                          help="HAR JSON layout: indented (2 spaces), lines (an entry per line) or compact. "
+                               "The lines and compact layouts are much faster to write.", )
+        loader.add_option(name="har_dump_format",
+                          typespec=str,
+                          default=HAR_DUMP_FORMAT_PLAIN,
+                          choices=HAR_DUMP_FORMATS,
+                          help="HAR dump format: har (plain text), har.gz (gzip) or har.xz (xz). "
+                               "The matching extension is appended to the HAR dump path if missing.", )
+        loader.add_option(name="har_dump_compression_level",
+                          typespec=int,
+                          default=6,
+                          help="Compression level (0-9) of the har.gz and har.xz formats.", )
+        loader.add_option(name="har_dump_index",
+                          typespec=bool,
+                          default=False,
+                          help="Write a binary index of the entries (offset, length, start time, status, method, "
+                               "host and url hashes) next to every plain HAR file, see HarIndex.HarIndexReader.", )
+        loader.add_option(name="har_dump_resume",
+                          typespec=bool,
+                          default=False,
+                          help="Append the entries to an existing plain HAR file at har_dump_file_path instead of "
+                               "overwriting it. A file that cannot be resumed is moved aside to <path>.bak.", )
+        loader.add_option(name="har_shard_max_entries",
+                          typespec=int,
+                          default=0,
+                          help="Roll over to a new HAR shard after this many entries (0 to disable). "
+                               "Sharding streams the entries and writes a manifest of the shards.", )
+        loader.add_option(name="har_shard_max_bytes",
+                          typespec=int,
+                          default=0,
+                          help="Roll over to a new HAR shard after this many (uncompressed) bytes (0 to disable).", )
+        loader.add_option(name="har_shard_on_transaction_end",
+                          typespec=bool,
+                          default=False,
+                          help="Roll over to a new HAR shard on every transaction end event.", )
+        loader.add_option(name="har_body_store",
+                          typespec=str,
+                          default=BodyStore.BODY_STORE_NONE,
+                          choices=BodyStore.BODY_STORES,
+                          help="Store response bodies once per content (SHA-256) next to the HAR dump path, "
+                               "as a directory or a single pack file, instead of inlining them in the HAR. "
+                               "Entries refer to the stored body by their content '_bodyRef' field.", )
+        loader.add_option(name="har_body_store_min_size",
+                          typespec=int,
+                          default=1024,
+                          help="Minimal size in bytes of a body to be moved to the body store.", )
+        loader.add_option(name="har_writer_thread",
+                          typespec=bool,
+                          default=False,
+                          help="Encode and write HAR entries on a dedicated thread instead of the addon hooks.", )
+        loader.add_option(name="har_writer_queue_size",
+                          typespec=int,
+                          default=1000,
+                          help="Maximal number of pending operations of the HAR writer thread, "
+                               "hooks block when the queue is full.", )
+        loader.add_option(name="har_journal",
+                          typespec=bool,
+                          default=False,
+                          help="Keep a crash-safe journal of the recording next to the HAR dump path "
+                               "(recover with: python HarJournal.py <journal path>).", )
+        loader.add_option(name="har_journal_fsync_interval",
+                          typespec=int,
+                          default=1000,
+                          help="Interval in milliseconds between journal syncs to disk.", )
+        loader.add_option(name="har_memory_budget",
+                          typespec=int,
+                          default=0,
+                          help="Memory in bytes of the bodies held until the HAR is written, the large bodies above it "
+                               "are moved to a temporary file next to the HAR. 0 for no budget.", )
+        loader.add_option(name="har_finalize_workers",
+                          typespec=int,
+                          default=0,
+                          help="Processes encoding the entries when a buffered (not streamed) HAR is written, they "
+                               "are forked so a frozen or Windows recorder encodes them in the recorder process. "
+                               "0 to encode them in the recorder process.", )
         ctx.log.debug("AddOn: HAR File Writer - Loaded")
 
-    def add_single_entry(self, entry: OrderedDict):
-        self.HAR["log"]["entries"].append(entry)
+    def running(self):
+        if ctx.options.har_body_store != BodyStore.BODY_STORE_NONE and self.body_store is None:
+            self.start_body_store()
+        if ctx.options.har_journal and self.journal is None:
+            self.start_journal()
+        if (ctx.options.har_dump_streaming or self.is_sharding()) and self.har_file is None and self.shards is None:
+            self.start_streaming()
+        if ctx.options.har_memory_budget > 0 and self.har_file is None and self.shards is None and \
+                self.body_arena is None:
+            # Only the buffered mode holds the entries in memory
+            directory = os.path.dirname(os.path.abspath(os.path.expanduser(ctx.options.har_dump_file_path)))
+            self.body_arena = BodyArena.BodyArena(ctx.options.har_memory_budget, directory)
+            ctx.log.debug("HAR memory budget of %s bytes (arena in %s)" % (ctx.options.har_memory_budget, directory))
+        if ctx.options.har_writer_thread and self.writer_queue is None:
+            self.writer_queue = HarWriterQueue.HarWriterQueue(ctx.options.har_writer_queue_size)
+            self.writer_queue.start()
+            ctx.log.debug("HAR writer thread started (queue size %s)" % ctx.options.har_writer_queue_size)
+
+    # The next operations run on the writer thread when enabled (in the order they were called)
+    def run_in_writer(self, function, *args):
+        if self.writer_queue is None:
+            function(*args)
+            return
+        self.writer_queue.submit(function, *args)
+        self.report_writer_messages()
+
+    def add_single_entry(self, entry):
+        """
+        Adds an entry, either a HAR object or a compact HarEntry.HarEntry record
+        """
+        self.run_in_writer(self.write_entry, entry)
+
+    def write_entry(self, entry):
+        streaming = self.har_file is not None or self.shards is not None
+        if streaming or self.journal is not None:
+            # Compact entry records are turned into HAR objects only when written
+            har_entry = HarEntry.to_har_object(entry)
+            if self.journal is not None:
+                self.journal.write_entry(har_entry)
+            if streaming:
+                self.write_streamed_entry(har_entry)
+        if not streaming:
+            self.HAR["log"]["entries"].append(entry)
+            if isinstance(entry, HarEntry.HarEntry):
+                if self.body_arena is not None:
+                    self.body_arena.add_entry(entry)
+                else:
+                    self.held_body_memory += BodyArena.get_held_memory(entry)
         self.entry_counter += 1
 
+    def transaction_ended(self):
+        self.run_in_writer(self.roll_over_transaction)
+
+    def roll_over_transaction(self):
+        if self.shards is not None and ctx.options.har_shard_on_transaction_end and self.har_file is not None:
+            self.close_har_file(with_trailing_sections=False)
+
     def add_entries(self, key: str, entries: OrderedDict):
+        self.run_in_writer(self.set_entries, key, entries)
+
+    def set_entries(self, key: str, entries: OrderedDict):
+        if self.journal is not None:
+            self.journal.write_section(key, entries)
         self.HAR['log'][key] = entries
 
+    def add_event(self, key: str, entry: OrderedDict, group: str = None):
+        """
+        Records a single event of a section that is added with add_entries on final (transactions, logs,
+        websocket messages...), so the event can be recovered from the journal if final never runs.
+        """
+        if self.journal is not None:
+            self.run_in_writer(self.write_event, key, entry, group)
+
+    def write_event(self, key: str, entry: OrderedDict, group: str = None):
+        if self.journal is not None:
+            self.journal.write_event(key, entry, group)
+
+    def store_body(self, body: bytes):
+        """
+        Moves the body to the body store
+        :return: the body reference, or None if the body should be written in the HAR
+        """
+        if self.body_store is None or len(body) < ctx.options.har_body_store_min_size:
+            return None
+        return self.body_store.store(body)
+
     def add_settings(self, settings_key: str, description: OrderedDict):
+        self.run_in_writer(self.set_settings, settings_key, description)
+
+    def set_settings(self, settings_key: str, description: OrderedDict):
+        if self.journal is not None:
+            self.journal.write_settings(settings_key, description)
         if not self.HAR['log'].__contains__("_settings"):
             self.HAR['log']['_settings'] = collections.OrderedDict()
         self.HAR['log']['_settings'][settings_key] = description
 
     def final(self):
         ctx.log.debug("finalizing har writer")
+        self.stop_writer_thread()
         self.write_file_to_disk()
 
+    def stop_writer_thread(self):
+        if self.writer_queue is None:
+            return
+        statistics = self.writer_queue.get_statistics()
+        self.writer_queue.stop()
+        self.report_writer_messages()
+        self.writer_queue = None
+        ctx.log.debug("HAR writer thread finished (queue depth on final %s, high-water mark %s of %s, "
+                      "%s operations, blocked %s times for %s ms)" %
+                      (statistics["queueDepth"], statistics["highWaterMark"], statistics["queueSize"],
+                       statistics["submitted"], statistics["blocked"], statistics["blockedTime"]))
+        self.add_settings("_writerQueue", statistics)
+
+    def report_writer_messages(self):
+        # mitmproxy's log must be used from the master thread, the writer thread messages are reported here
+        for level, message in self.writer_queue.pop_messages():
+            if level == "error":
+                ctx.log.error(message)
+            else:
+                ctx.log.debug(message)
+
+    def log_debug(self, message: str):
+        if self.writer_queue is not None and self.writer_queue.is_writer_thread():
+            self.writer_queue.add_message("debug", message)
+        else:
+            ctx.log.debug(message)
+
     def write(self):
         ctx.log.debug("finalizing the har file")
+        self.stop_writer_thread()
         self.write_file_to_disk()
 
     def write_file_to_disk(self):
-        from pathlib import Path
+        if self.shards is not None:
+            if self.har_file is None:
+                # The last shard was just rolled over, the trailing sections are written to a shard of their own
+                self.open_har_file(self.shards.open_shard())
+        elif self.har_file is None:
+            # Buffered mode, the whole HAR is written in a single pass
+            self.open_har_file(self.get_har_file_path())
+            entries = self.HAR["log"]["entries"]
+            if ctx.options.har_finalize_workers > 0 and len(entries) > FINALIZE_CHUNK_SIZE:
+                finalize_context = get_finalize_context()
+                if finalize_context is None:
+                    self.log_debug("HAR parallel encoding needs forked worker processes, which a frozen or spawn "
+                                   "only interpreter does not have, writing the entries in this process")
+                else:
+                    self.write_har_entries_in_parallel(entries, ctx.options.har_finalize_workers, finalize_context)
+            for entry in entries[self.file_entry_counter:]:
+                self.write_har_entry(entry)
+        self.close_har_file(with_trailing_sections=True)
+        if self.body_arena is not None:
+            self.body_arena.close()
+            ctx.log.debug("HAR memory budget arena finished (%s bodies, %s bytes spilled)" %
+                          (self.body_arena.spilled_counter, self.body_arena.spilled_bytes))
+            self.body_arena = None
+        if self.body_store is not None:
+            self.body_store.close()
+            ctx.log.debug("HAR body store finished (%s bodies, stored %s bytes, %s duplicated bytes skipped)" %
+                          (self.body_store.bodies_counter, self.body_store.stored_bytes,
+                           self.body_store.duplicated_bytes))
+            self.body_store = None
+        if self.journal is not None:
+            # The HAR is complete, the journal is no longer needed
+            self.journal.close(remove=True)
+            self.journal = None
+
+    def start_body_store(self):
+        store_type = ctx.options.har_body_store
+        store_path = BodyStore.get_body_store_path(os.path.expanduser(ctx.options.har_dump_file_path), store_type)
+        # A resumed HAR keeps the references to the bodies of the previous recordings
+        self.body_store = BodyStore.BodyStore(store_path, store_type, append=ctx.options.har_dump_resume)
+        ctx.log.debug("HAR body store started (%s %s)" % (store_type, store_path))
+
+    def start_journal(self):
         target_file_path = os.path.expanduser(ctx.options.har_dump_file_path)
-        with open(target_file_path, mode="w", encoding="utf8") as har_file:
-            json_encoder = json.JSONEncoder(indent=2, default=str, ensure_ascii=False)
-            for chunk in json_encoder.iterencode(self.HAR):
-                har_file.write(chunk)
-            har_file.flush()
+        journal_path = HarJournal.get_journal_path(target_file_path)
+        self.journal = HarJournal.HarJournal(journal_path, ctx.options.har_journal_fsync_interval / 1000.0)
+        if self.journal.rotated_path is not None:
+            ctx.log.warn("HAR journal of a previous recording was not recovered, moved it to %s "
+                         "(recover with: python HarJournal.py %s <har path>)" %
+                         (self.journal.rotated_path, self.journal.rotated_path))
+        self.journal.write_header(self.get_log_items(header=True))
+        ctx.log.debug("HAR journal started (file %s)" % journal_path)
+
+    # Streaming mode:
+    # The HAR header (up to the opening of the entries array) is written when recording starts, every entry is
+    # written as it arrives and the trailing sections (_transactions, _settings, ...) are written on final.
+    # The buffered mode goes through the same steps at once when the recording ends.
+    # When sharding, every shard is streamed the same way and rolled over once it reaches its limits.
+    def start_streaming(self):
+        if self.is_sharding():
+            self.shards = HarShards.HarShardManifest(self.get_har_file_path(), ctx.options.har_dump_format)
+            ctx.log.debug("HAR sharding started (manifest %s)" % self.shards.manifest_path)
+        else:
+            self.open_har_file(self.get_har_file_path())
+            ctx.log.debug("HAR streaming started (file %s)" % self.har_file_path)
+
+    def write_streamed_entry(self, entry: OrderedDict):
+        if self.har_file is None:
+            # Shards are opened on their first entry, so no shard is left empty
+            self.open_har_file(self.shards.open_shard())
+        self.write_har_entry(entry)
+        if self.shards is not None:
+            self.shards.add_entry(entry)
+            max_entries = ctx.options.har_shard_max_entries
+            max_bytes = ctx.options.har_shard_max_bytes
+            if (0 < max_entries <= self.file_entry_counter) or (0 < max_bytes <= self.bytes_written):
+                self.close_har_file(with_trailing_sections=False)
+
+    def is_sharding(self) -> bool:
+        return ctx.options.har_shard_max_entries > 0 or ctx.options.har_shard_max_bytes > 0 or \
+            ctx.options.har_shard_on_transaction_end
+
+    def get_har_file_path(self) -> str:
+        har_dump_format = ctx.options.har_dump_format
+        har_file_path = os.path.expanduser(ctx.options.har_dump_file_path)
+        if har_dump_format != HAR_DUMP_FORMAT_PLAIN and not har_file_path.endswith(har_dump_format):
+            har_file_path += har_dump_format[len(HAR_DUMP_FORMAT_PLAIN):]
+        return har_file_path
+
+    def open_har_file(self, har_file_path: str):
+        har_dump_format = ctx.options.har_dump_format
+        self.har_file_path = har_file_path
+        if self.har_encoder is None:
+            self.har_encoder = HarEncoder.create_har_encoder(ctx.options.har_dump_json_style)
+        self.bytes_written = 0
+        self.file_entry_counter = 0
+        self.resume_point = self.find_resume_point(har_file_path)
+        # The compressed formats compress in the same pass the HAR is encoded
+        if har_dump_format == HAR_DUMP_FORMAT_GZIP:
+            self.har_file = gzip.open(self.har_file_path, mode="wb",
+                                      compresslevel=ctx.options.har_dump_compression_level)
+        elif har_dump_format == HAR_DUMP_FORMAT_XZ:
+            self.har_file = lzma.open(self.har_file_path, mode="wb", preset=ctx.options.har_dump_compression_level)
+        elif self.resume_point is not None:
+            # The previous trailing sections are cut off right before the first new bytes are written (see
+            # write_har_bytes), they are written again (merged) when the file is closed
+            self.har_file = open(self.har_file_path, mode="r+b")
+            self.har_file.seek(self.resume_point.entries_end)
+            self.bytes_written = self.resume_point.entries_end
+            self.resume_truncate_pending = True
+            if self.journal is not None:
+                self.journal.write_resume(self.get_resume_record())
+        else:
+            if os.path.isfile(HarResume.get_resume_path(self.har_file_path)):
+                # Left over by an unfinished recording that resumed the file now overwritten
+                os.remove(HarResume.get_resume_path(self.har_file_path))
+            self.har_file = open(self.har_file_path, mode="wb")
+        if self.resume_point is None:
+            self.write_har_bytes(self.har_encoder.encode_header(self.get_log_items(header=True)))
+        if ctx.options.har_dump_index:
+            index_path = HarIndex.get_index_path(har_file_path)
+            if har_dump_format != HAR_DUMP_FORMAT_PLAIN:
+                self.log_debug("HAR index is not written for the %s format" % har_dump_format)
+            elif self.resume_point is None:
+                self.har_index = HarIndex.HarIndexWriter(index_path)
+            elif os.path.isfile(index_path):
+                self.har_index = HarIndex.HarIndexWriter(index_path, append=True)
+            else:
+                self.log_debug("HAR index is not written, the resumed file %s has no index" % har_file_path)
+
+    def find_resume_point(self, har_file_path: str):
+        """
+        Returns the point the entries are appended at when resuming an existing HAR file, None to write a new file
+        """
+        if not ctx.options.har_dump_resume or self.shards is not None or not os.path.isfile(har_file_path) or \
+                os.path.getsize(har_file_path) == 0:
+            return None
+        resume_path = HarResume.get_resume_path(har_file_path)
+        backup_path = har_file_path + ".bak"
+        try:
+            if ctx.options.har_dump_format != HAR_DUMP_FORMAT_PLAIN:
+                raise ValueError("only plain HAR files can be resumed")
+            if os.path.isfile(resume_path):
+                raise ValueError("the recording that resumed it did not end, restore it with: "
+                                 "python HarResume.py %s" % backup_path)
+            resume_point = HarResume.find_resume_point(har_file_path)
+        except ValueError as error:
+            os.replace(har_file_path, backup_path)
+            if os.path.isfile(resume_path):
+                os.replace(resume_path, HarResume.get_resume_path(backup_path))
+            ctx.log.error("Cannot resume the HAR file %s (%s), it was moved to %s" %
+                          (har_file_path, error, backup_path))
+            return None
+        self.log_debug("HAR file %s resumed at offset %s" % (har_file_path, resume_point.entries_end))
+        return resume_point
+
+    def get_resume_record(self) -> dict:
+        return self.resume_point.to_record(self.har_file_path, ctx.options.har_dump_json_style)
+
+    def truncate_resumed_file(self):
+        """
+        Cuts off the previous trailing sections of the resumed file, after saving them to <har path>.resume: a
+        recording that does not end leaves the file without them, HarResume.restore_har puts them back
+        """
+        HarResume.save_resume_record(self.get_resume_record(), HarResume.get_resume_path(self.har_file_path))
+        self.har_file.truncate()
+        self.resume_truncate_pending = False
+
+    def get_file_entry_index(self) -> int:
+        """
+        Returns the index of the next entry of the file for the encoder (only its first entry is encoded differently)
+        """
+        if self.resume_point is not None and self.resume_point.has_entries:
+            return self.file_entry_counter + 1
+        return self.file_entry_counter
+
+    def write_har_entry(self, entry):
+        entry = self.load_har_entry(entry)
+        self.write_encoded_har_entry(entry, self.har_encoder.encode_entry(entry, self.get_file_entry_index()))
+
+    def load_har_entry(self, entry):
+        entry = HarEntry.to_har_object(entry)
+        if self.body_arena is not None:
+            self.body_arena.load_har_entry(entry)
+        return entry
+
+    def write_encoded_har_entry(self, entry, data: bytes):
+        if self.har_index is not None:
+            # The encoded entry starts with its separator, the entry object starts at the first '{'
+            entry_start = data.index(b"{")
+            self.har_index.add_entry(HarEntry.to_har_object(entry), self.bytes_written + entry_start,
+                                     len(data) - entry_start)
+        self.write_har_bytes(data)
+        self.file_entry_counter += 1
+
+    def write_har_entries_in_parallel(self, entries: list, workers: int, finalize_context):
+        """
+        Encodes the entries in chunks in forked worker processes and writes the chunks in order.
+        On failure (processes cannot be started or die) the entries left are written by the caller.
+        """
+        json_style = ctx.options.har_dump_json_style
+        first_index = self.get_file_entry_index()
+        # The workers inherit the entries when forked, only the chunks holding spilled texts are sent to them
+        HarEncoder.inherited_entries = entries
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=finalize_context) as executor:
+                pending_chunks = collections.deque()
+                for start in range(0, len(entries), FINALIZE_CHUNK_SIZE):
+                    end = start + FINALIZE_CHUNK_SIZE
+                    if self.body_arena is None:
+                        chunk = entries[start:end]
+                        future = executor.submit(HarEncoder.encode_inherited_entries, json_style, start, end,
+                                                 first_index + start)
+                    else:
+                        # The arena is private to this process, the spilled texts are read here
+                        chunk = [self.load_har_entry(entry) for entry in entries[start:end]]
+                        future = executor.submit(HarEncoder.encode_entries, json_style, chunk, first_index + start)
+                    pending_chunks.append((chunk, future))
+                    # Bounds the encoded chunks held in memory
+                    if len(pending_chunks) >= 2 * workers:
+                        self.write_encoded_chunk(*pending_chunks.popleft())
+                while pending_chunks:
+                    self.write_encoded_chunk(*pending_chunks.popleft())
+        except (OSError, pickle.PicklingError, concurrent.futures.BrokenExecutor) as error:
+            self.log_debug("HAR parallel encoding failed after %s entries, writing the rest in this process: %r" %
+                           (self.file_entry_counter, error))
+        finally:
+            HarEncoder.inherited_entries = None
+
+    def write_encoded_chunk(self, chunk: list, future: concurrent.futures.Future):
+        for entry, data in zip(chunk, future.result()):
+            self.write_encoded_har_entry(entry, data)
+
+    def write_har_bytes(self, data: bytes):
+        if self.resume_truncate_pending:
+            self.truncate_resumed_file()
+        self.har_file.write(data)
+        self.bytes_written += len(data)
+
+    def close_har_file(self, with_trailing_sections: bool):
+        trailing_sections = self.get_log_items(header=False) if with_trailing_sections else {}
+        if self.resume_point is not None:
+            trailing_sections = HarResume.merge_trailing_sections(self.resume_point.trailing_sections,
+                                                                  trailing_sections)
+        self.write_har_bytes(self.har_encoder.encode_trailer(self.get_file_entry_index(), trailing_sections))
+        if self.resume_point is not None:
+            # The file is complete again, the saved resume point is no longer needed
+            self.har_file.flush()
+            os.fsync(self.har_file.fileno())
+            os.remove(HarResume.get_resume_path(self.har_file_path))
+        self.har_file.close()
+        self.har_file = None
+        if self.har_index is not None:
+            self.har_index.close()
+            self.har_index = None
+
+        total = os.path.getsize(self.har_file_path)
+        if self.shards is not None:
+            self.shards.close_shard(total, with_trailing_sections)
+        if ctx.options.har_dump_format == HAR_DUMP_FORMAT_PLAIN:
+            self.log_debug("HAR dump finished (wrote %s entries, %s bytes to file %s)" %
+                           (self.file_entry_counter, total, self.har_file_path))
+        else:
+            self.log_debug("HAR dump finished (wrote %s entries, %s bytes compressed to %s bytes, ratio %.2f, "
+                           "to file %s)" % (self.file_entry_counter, self.bytes_written, total,
+                                            self.bytes_written / max(total, 1), self.har_file_path))
 
-        total = Path(target_file_path).stat().st_size
+    def get_log_items(self, header: bool) -> OrderedDict:
+        """
+        Returns the 'log' fields written before the entries array (header) or after it
+        """
+        return collections.OrderedDict((key, value) for key, value in self.HAR['log'].items()
+                                       if key != "entries" and (key in HAR_HEADER_KEYS) == header)
 
-        ctx.log.debug("HAR dump finished (wrote %s bytes to file %s)" % (total, target_file_path))
+    def get_memory_statistics(self) -> OrderedDict:
+        """
+        Returns the entries held in memory (buffered mode) and an estimate of their memory, for the recorder metrics
+        """
+        held_entries = len(self.HAR["log"]["entries"])
+        body_arena, writer_queue = self.body_arena, self.writer_queue
+        held_body_memory = body_arena.held_memory if body_arena is not None else self.held_body_memory
+        statistics = collections.OrderedDict()
+        statistics["heldEntries"] = held_entries
+        statistics["estimatedMemory"] = held_entries * ENTRY_MEMORY_ESTIMATE + held_body_memory
+        statistics["writerQueueDepth"] = writer_queue.queue.qsize() if writer_queue is not None else 0
+        return statistics
 
     def get_har_entries_size(self):
-        return len(self.HAR["log"]["entries"])
+        return self.entry_counter
 
     def is_empty(self):
         return self.get_har_entries_size() == 0
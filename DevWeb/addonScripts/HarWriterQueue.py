@@ -0,0 +1,80 @@
+"""
+Bounded queue and thread running HarWriter operations (encoding, journaling and disk writes) off the addon hooks.
+
+Operations are executed in the order they were submitted. When the queue is full the submitting hook blocks
+(backpressure), the time spent blocked is measured along with the queue high-water mark.
+This module does not depend on mitmproxy, so it is safe to use from the writer thread.
+"""
+import collections
+import queue
+import threading
+import time
+
+
+class HarWriterQueue:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.queue = queue.Queue(maxsize=max_size)
+        self.thread = threading.Thread(target=self.run, name="HarWriterQueue", daemon=True)
+        # Messages and errors of the writer thread, reported by the caller thread (deque append is thread safe)
+        self.pending_messages = collections.deque()
+        self.submitted_counter = 0
+        self.high_water_mark = 0
+        self.blocked_counter = 0
+        self.blocked_time = 0.0
+
+    def start(self):
+        self.thread.start()
+
+    def is_writer_thread(self) -> bool:
+        return threading.current_thread() is self.thread
+
+    def submit(self, function, *args):
+        item = (function, args)
+        if self.queue.full():
+            start_time = time.perf_counter()
+            self.queue.put(item)
+            self.blocked_time += time.perf_counter() - start_time
+            self.blocked_counter += 1
+        else:
+            self.queue.put(item)
+        self.submitted_counter += 1
+        depth = self.queue.qsize()
+        if depth > self.high_water_mark:
+            self.high_water_mark = depth
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            function, args = item
+            try:
+                function(*args)
+            except Exception as error:
+                self.pending_messages.append(("error", "HAR writer thread failed on %s: %r" %
+                                              (function.__name__, error)))
+
+    def stop(self):
+        """
+        Waits for all the submitted operations to complete and stops the thread
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+    def add_message(self, level: str, message: str):
+        self.pending_messages.append((level, message))
+
+    def pop_messages(self):
+        while self.pending_messages:
+            yield self.pending_messages.popleft()
+
+    def get_statistics(self) -> collections.OrderedDict:
+        statistics = collections.OrderedDict()
+        statistics["queueSize"] = self.max_size
+        statistics["queueDepth"] = self.queue.qsize()
+        statistics["highWaterMark"] = self.high_water_mark
+        statistics["submitted"] = self.submitted_counter
+        statistics["blocked"] = self.blocked_counter
+        statistics["blockedTime"] = int(1000 * self.blocked_time)
+        return statistics
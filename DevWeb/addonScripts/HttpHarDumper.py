@@ -1,8 +1,17 @@
 """
 This inline script can be used to dump flows as HAR files.
 """
+import concurrent.futures
+import functools
 import urllib.parse
+import CapturePolicy
+import ConnectionTracker
+import ControlEvents
+import FlowRouter
+import HarEntry
 import HTTPHandlers
+import RecordFilter
+import StreamedBodies
 import util
 from HarWriter import *
 from mitmproxy import addonmanager
@@ -11,11 +20,20 @@ from mitmproxy import http
 from mitmproxy.net.http import cookies
 
 
-def name_value(obj):
+# Entries being built on the entry builder threads, above it the response hook waits for the oldest one
+MAX_PENDING_ENTRIES = 1000
+# Flow metadata key of a request body streamed to the uploads sidecar directory (StreamedBodies.StreamedBody)
+STREAMED_REQUEST_KEY = "devweb_streamed_request"
+# Flow metadata key of a response body streamed through and recorded as its hash only
+STREAMED_RESPONSE_KEY = "devweb_streamed_response"
+FORM_URLENCODED = "application/x-www-form-urlencoded"
+
+
+def name_value_pairs(obj):
     """
-        Convert (key, value) pairs to HAR format.
+        Convert (key, value) pairs to the compact HarEntry format.
     """
-    return [{"name": k, "value": v} for k, v in obj.items()]
+    return tuple(obj.items())
 
 
 def format_response_cookies(fields):
@@ -86,15 +104,61 @@ class HttpHarDumper:
 
     def __init__(self, har_writer: HarWriter):
         self.har_writer = har_writer
-        self.SERVERS_SEEN = set()
+        self.connection_tracker = ConnectionTracker.ConnectionTracker()
         self.transactions_counter = 0
         self.transactions = []
         self.actions = []
         self.steps = []
         self.logs = []
         self.handlers = {}
+        self.record_filter = None
+        self.capture_policy = None
+        self.entry_builder = None
+        self.pending_entries = collections.deque()
+        self.control_listener = None
+        self.request_spool = None
+        # Flows whose response body is still streaming, they are recorded once it went through
+        self.streaming_flows = []
 
     def load(self, loader: addonmanager.Loader):
+        loader.add_option(name="har_record_filter",
+                          typespec=str,
+                          default="",
+                          help="Path of a generator_config.yml file, the flows excluded by its filter section "
+                               "are not recorded. Empty to record all the flows.", )
+        loader.add_option(name="har_capture_policy",
+                          typespec=str,
+                          default="",
+                          help="Path of a YAML file of body capture rules (full, truncate or metadata only per MIME "
+                               "type, host and size), see CapturePolicy. Empty to capture all the bodies in full.", )
+        loader.add_option(name="har_entry_workers",
+                          typespec=int,
+                          default=0,
+                          help="Threads building the HAR entries (body decoding, charset detection and encoding) "
+                               "off the proxy's master thread. 0 to build them in the response hook.", )
+        loader.add_option(name="har_request_stream_size",
+                          typespec=int,
+                          default=0,
+                          help="Request bodies larger than this size (bytes, from Content-Length) are streamed to a "
+                               "sidecar file (<har path>.uploads) rather than held in memory, their postData "
+                               "records the file, the SHA-256 and the size. 0 to keep all the request bodies.", )
+        loader.add_option(name="har_response_stream_size",
+                          typespec=int,
+                          default=0,
+                          help="Response bodies larger than this size (bytes, from Content-Length) are streamed "
+                               "through without being buffered, their entry records the size and the SHA-256 but no "
+                               "text. 0 to keep all the response bodies.", )
+        loader.add_option(name="har_max_connections",
+                          typespec=int,
+                          default=10000,
+                          help="Server connections listed in the _connections section, past it the least recently "
+                               "used ones are folded into its aggregate counters. 0 for no limit.", )
+        loader.add_option(name="har_control_listener",
+                          typespec=str,
+                          default="",
+                          help="Local address receiving NDJSON batches of control events (transactions, actions, "
+                               "steps and logs), udp://HOST:PORT or unix://PATH, see ControlEvents. "
+                               "Empty to receive them through the proxy only.", )
         ctx.log.debug("AddOn: HTTP/S Dumper - Loaded")
         # Registering the special HTTP handlers to the corresponding host.
         self.handlers["transaction.start"] = HTTPHandlers.transaction_event_handler("start")
@@ -108,122 +172,334 @@ class HttpHarDumper:
         self.handlers["log.warning"] = HTTPHandlers.log_event_handler("warning")
         self.handlers["log.error"] = HTTPHandlers.log_event_handler("error")
 
+    def running(self):
+        self.connection_tracker.max_connections = ctx.options.har_max_connections
+        if ctx.options.har_record_filter and self.record_filter is None:
+            config_path = os.path.expanduser(ctx.options.har_record_filter)
+            try:
+                self.record_filter = RecordFilter.RecordFilter(RecordFilter.load_filter_config(config_path))
+                ctx.log.debug("Record filter loaded from %s" % config_path)
+            except Exception as error:
+                ctx.log.error("Failed to load the record filter from %s: %r" % (config_path, error))
+        if ctx.options.har_capture_policy and self.capture_policy is None:
+            policy_path = os.path.expanduser(ctx.options.har_capture_policy)
+            try:
+                self.capture_policy = CapturePolicy.load_capture_policy(policy_path)
+                ctx.log.debug("Body capture policy loaded from %s (%s rules)" %
+                              (policy_path, len(self.capture_policy.rules)))
+            except Exception as error:
+                ctx.log.error("Failed to load the body capture policy from %s: %r" % (policy_path, error))
+        if ctx.options.har_entry_workers > 0 and self.entry_builder is None:
+            self.entry_builder = concurrent.futures.ThreadPoolExecutor(max_workers=ctx.options.har_entry_workers,
+                                                                       thread_name_prefix="HarEntryBuilder")
+            ctx.log.debug("HAR entry builder started (%s threads)" % ctx.options.har_entry_workers)
+        if ctx.options.har_request_stream_size > 0 and self.request_spool is None:
+            spool_path = StreamedBodies.get_spool_path(os.path.expanduser(ctx.options.har_dump_file_path))
+            self.request_spool = StreamedBodies.RequestSpool(spool_path)
+            ctx.log.debug("Request bodies above %s bytes are streamed to %s" %
+                          (ctx.options.har_request_stream_size, spool_path))
+        if ctx.options.har_control_listener and self.control_listener is None:
+            try:
+                self.control_listener = ControlEvents.ControlEventListener(ctx.options.har_control_listener)
+                self.control_listener.start()
+                ctx.log.debug("Control event listener started on %s" % self.control_listener.get_address())
+            except Exception as error:
+                ctx.log.error("Failed to start the control event listener on %s: %r" %
+                              (ctx.options.har_control_listener, error))
+
+    def requestheaders(self, flow: http.HTTPFlow):
+        """
+           Called when the headers of a request have been received, before its body.
+        """
+        if self.request_spool is None or flow.request.stream or \
+                util.get_flow_route(flow) != FlowRouter.ROUTE_RECORD:
+            return
+        content_length = flow.request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > ctx.options.har_request_stream_size:
+            # The body goes upstream chunk by chunk through the spool, the flow never holds it
+            body = flow.metadata[STREAMED_REQUEST_KEY] = StreamedBodies.StreamedBody()
+            flow.request.stream = functools.partial(self.request_spool.spool_chunks, body)
+
     def request(self, flow: http.HTTPFlow):
         """
            Called when a server response has been received.
         """
-        if util.is_ignore_hosts(flow.request.host):
+        if self.control_listener is not None and self.control_listener.pending_events:
+            self.add_listener_events()
+        if self.streaming_flows:
+            self.write_streamed_responses()
+        if self.pending_entries:
+            # Entries built since the last response are written without waiting for the next one
+            self.write_built_entries()
+
+        route = util.get_flow_route(flow)
+        if route == FlowRouter.ROUTE_IGNORED:
             # if hosts is exist and matches one of the ignore_hosts list values,
             # we want to return without writing him in the HAR file.
             return
 
-        url = flow.request.url
-        ctx.log.debug("Request {} '{}'".format(flow.request.method, url))
+        util.log_debug("Request {} '{}'", flow.request.method, flow.request.url)
 
-        if flow.request.host in self.handlers:
-            self.handlers[flow.request.host](self, flow)
+        if route == FlowRouter.ROUTE_CONTROL:
+            handler = self.handlers.get(flow.request.host)
+            if handler is not None:
+                handler(self, flow)
 
     def response(self, flow: http.HTTPFlow):
         """
            Called when a server response has been received.
         """
-        if util.is_ignore_hosts(flow.request.host):
-            # if hosts is exist and matches one of the ignore_hosts list values,
-            # we want to return without writing him in the HAR file.
+        if util.get_flow_route(flow) != FlowRouter.ROUTE_RECORD:
+            # Hosts matching one of the ignore_hosts list values and control requests are not written in the HAR file
             return
 
-        if flow.request.host in self.handlers:
+        if self.record_filter is not None and \
+                self.record_filter.get_skip_reason(flow.request.host, flow.request.url, flow.request.method,
+                                                   flow.response.status_code) is not None:
             return
 
         if flow.server_conn and flow.server_conn.address:
+            if STREAMED_RESPONSE_KEY in flow.metadata:
+                # The response hook runs before a streamed body goes through, the flow is recorded once it did
+                self.streaming_flows.append(flow)
+            else:
+                self.record_flow(flow)
+
+    def responseheaders(self, flow: http.HTTPFlow):
+        """
+           Called when the headers of a server response have been received, before its body.
+        """
+        if ctx.options.har_response_stream_size <= 0 or flow.response.stream or \
+                util.get_flow_route(flow) != FlowRouter.ROUTE_RECORD:
+            return
+        content_length = flow.response.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > ctx.options.har_response_stream_size:
+            body = flow.metadata[STREAMED_RESPONSE_KEY] = StreamedBodies.StreamedBody()
+            flow.response.stream = functools.partial(StreamedBodies.hash_chunks, body)
+
+    def record_flow(self, flow: http.HTTPFlow):
+        if self.entry_builder is None:
             entry = self.parse_response(flow)
             self.har_writer.add_single_entry(entry)
+        else:
+            # Only the snapshot of the flow is taken here, the bodies are handled on the entry builder threads
+            entry, bodies = self.snapshot_flow(flow)
+            self.pending_entries.append(self.entry_builder.submit(self.build_entry, entry, bodies))
+            self.write_built_entries()
+
+    def write_streamed_responses(self, wait: bool = False):
+        """
+        Records the flows whose streamed response body went through (all of them when waiting, on final)
+        """
+        streaming_flows = self.streaming_flows
+        self.streaming_flows = []
+        for flow in streaming_flows:
+            body = flow.metadata[STREAMED_RESPONSE_KEY]
+            if not body.finished and not wait:
+                self.streaming_flows.append(flow)
+                continue
+            if body.finished:
+                # mitmproxy set timestamp_end once the headers were read, and sets it again only after the body was
+                # sent to the client (on the connection thread, possibly after this point)
+                flow.response.timestamp_end = body.end_time
+            self.record_flow(flow)
 
     def parse_response(self, flow: http.HTTPFlow):
+        entry, bodies = self.snapshot_flow(flow)
+        return self.build_entry(entry, bodies)
+
+    def snapshot_flow(self, flow: http.HTTPFlow):
+        """
+        Reads everything the entry needs out of the flow, runs in the response hook (on the master thread).
+        Returns the entry without its bodies and the bodies to complete it with (see build_entry).
+        """
         # -1 indicates that these values do not apply to current request
         ssl_time = -1
         connect_time = -1
 
-        if flow.server_conn and flow.server_conn not in self.SERVERS_SEEN:
-            connect_time = (flow.server_conn.timestamp_tcp_setup - flow.server_conn.timestamp_start)
+        # Only the first request on a connection (TLS or not) pays for its setup
+        if flow.server_conn and self.connection_tracker.is_new(flow.server_conn.id):
+            if flow.server_conn.timestamp_tcp_setup is not None:
+                connect_time = (flow.server_conn.timestamp_tcp_setup - flow.server_conn.timestamp_start)
 
             if flow.server_conn.timestamp_tls_setup is not None:
                 ssl_time = (flow.server_conn.timestamp_tls_setup - flow.server_conn.timestamp_tcp_setup)
-
-                self.SERVERS_SEEN.add(flow.server_conn)
-        timings_raw = {'send': flow.request.timestamp_end - flow.request.timestamp_start,
-                       'receive': flow.response.timestamp_end - flow.response.timestamp_start,
-                       'wait': flow.response.timestamp_start - flow.request.timestamp_end, 'connect': connect_time,
-                       'ssl': ssl_time, }
-        timings = dict([(k, int(1000 * v)) for k, v in timings_raw.items()])
-        full_time = sum(v for v in timings.values() if v > -1)
-        started_date_time = util.format_datetime(flow.request.timestamp_start)
-        # Response body size and encoding
-        response_body_size = len(flow.response.raw_content)
-        response_body_decoded_size = len(flow.response.content)
-        response_body_compression = response_body_decoded_size - response_body_size
-        entry = collections.OrderedDict()
-        entry["startedDateTime"] = started_date_time
-        entry["time"] = full_time
-        entry["_serverConnectionId"] = flow.server_conn.id
-        entry["request"] = collections.OrderedDict()
-        entry["request"]["method"] = flow.request.method
-        entry["request"]["url"] = flow.request.url
-        entry["request"]["httpVersion"] = flow.request.http_version
+        timings_raw = (flow.request.timestamp_end - flow.request.timestamp_start,
+                       flow.response.timestamp_end - flow.response.timestamp_start,
+                       flow.response.timestamp_start - flow.request.timestamp_end,
+                       connect_time,
+                       ssl_time)
+        timings = tuple(int(1000 * v) for v in timings_raw)
+        full_time = sum(v for v in timings if v > -1)
+        streamed_response = flow.metadata.get(STREAMED_RESPONSE_KEY)
+        if streamed_response is not None:
+            response_body_size = streamed_response.size
+        else:
+            response_body_size = len(flow.response.raw_content)
+
+        entry = HarEntry.HarEntry()
+        entry.started_date_time = util.format_datetime(flow.request.timestamp_start)
+        entry.time = full_time
+        entry.server_connection_id = flow.server_conn.id
+        entry.request_method = flow.request.method
+        entry.request_url = flow.request.url
+        entry.request_http_version = flow.request.http_version
         if isinstance(flow.request.headers, list):
-            entry["request"]["headers"] = flow.request.headers
+            entry.request_headers = flow.request.headers
         else:
-            entry['request']['headers'] = name_value(flow.request.headers)
-
-        entry["request"]["queryString"] = name_value(flow.request.query or {})
-        entry["request"]["cookies"] = format_request_cookies(flow.request.cookies.fields)
-        entry["request"]["headersSize"] = len(str(flow.request.headers))
-        entry["request"]["bodySize"] = len(flow.request.get_content(strict=False))
-
-        entry["response"] = collections.OrderedDict()
-        entry["response"]["status"] = flow.response.status_code
-        entry["response"]["statusText"] = flow.response.reason
-        entry["response"]["httpVersion"] = flow.response.http_version
-        entry["response"]["headers"] = name_value(flow.response.headers)
-        entry["response"]["cookies"] = format_response_cookies(flow.response.cookies.fields)
-
-        content_object = collections.OrderedDict()
-        content_object["size"] = response_body_size
-        content_object["mimeType"] = \
+            entry.request_headers = name_value_pairs(flow.request.headers)
+
+        entry.request_query_string = name_value_pairs(flow.request.query or {})
+        entry.request_cookies = format_request_cookies(flow.request.cookies.fields)
+        entry.request_headers_size = util.get_headers_size(flow.request.headers)
+
+        entry.response_status = flow.response.status_code
+        entry.response_status_text = flow.response.reason
+        entry.response_http_version = flow.response.http_version
+        entry.response_headers = name_value_pairs(flow.response.headers)
+        entry.response_cookies = format_response_cookies(flow.response.cookies.fields)
+        entry.response_redirect_url = \
+            flow.response.headers.get('Location', flow.response.headers.get('location', ''))
+        entry.response_headers_size = util.get_headers_size(flow.response.headers)
+        entry.response_body_size = response_body_size
+
+        entry.content_size = response_body_size
+        entry.content_mime_type = \
             flow.response.headers.get('Content-Type',
                                       flow.response.headers.get('Content-type',
                                                                 flow.response.headers.get('content-type', None)))
-        content_object["compression"] = response_body_compression
-        entry["response"]["redirectURL"] = \
-            flow.response.headers.get('Location', flow.response.headers.get('location', ''))
-        entry["response"]["headersSize"] = len(str(flow.response.headers))
-        entry["response"]["bodySize"] = response_body_size
+        entry.timings = timings
 
-        entry["cache"] = {}
-        entry["timings"] = timings
+        if flow.server_conn.connected():
+            entry.server_ip_address = str(flow.server_conn.ip_address[0])
+
+        streamed_body = flow.metadata.get(STREAMED_REQUEST_KEY)
+        request_body_bytes = streamed_body.size if streamed_body is not None else len(flow.request.raw_content or b"")
+        self.connection_tracker.add_request(flow.server_conn.id,
+                                            "%s:%s" % tuple(flow.server_conn.address[:2]),
+                                            bool(flow.server_conn.tls_established) or ssl_time != -1,
+                                            entry.started_date_time,
+                                            connect_time,
+                                            ssl_time,
+                                            flow.request.timestamp_start,
+                                            flow.response.timestamp_end,
+                                            entry.request_headers_size + request_body_bytes,
+                                            entry.response_headers_size + response_body_size)
+
+        bodies = FlowBodies()
+        bodies.host = flow.request.host
+        bodies.response_raw_content = flow.response.raw_content
+        bodies.response_content_encoding = flow.response.headers.get("content-encoding")
+        bodies.request_raw_content = flow.request.raw_content
+        bodies.request_content_encoding = flow.request.headers.get("content-encoding")
+        bodies.request_mime_type = flow.request.headers.get("Content-Type", "")
+        bodies.request_form = None
+        bodies.request_streamed_body = streamed_body
+        bodies.response_streamed_body = streamed_response
+        if flow.request.method in ["POST", "PUT", "PATCH"]:
+            bodies.request_form = ()
+            if bodies.request_streamed_body is None and FORM_URLENCODED in bodies.request_mime_type.lower():
+                bodies.request_form = tuple(flow.request.urlencoded_form.items(multi=True))
+        return entry, bodies
 
-        # Store binary data as base64
-        detect_data = util.get_content_as_string(util.get_content_safely(flow.response))
-        content_object["text"] = detect_data['content']
-        if detect_data['is_binary']:
-            content_object["encoding"] = detect_data['detected_encoding']['encoding']
-        entry["response"]["content"] = content_object
+    def build_entry(self, entry: HarEntry.HarEntry, bodies):
+        """
+        Completes the entry with its bodies (decoding, capture policy, charset detection and encoding).
+        It does not touch the flow, so it runs on the entry builder threads when enabled.
+        """
+        # The capture rules are resolved on the raw sizes first: a body kept as metadata only is never decoded, its
+        # size is the raw one. Every other body is decoded once, the decoded content serves the sizes, the detection
+        # and the text.
+        response_capture_rule = self.get_capture_rule(CapturePolicy.BODY_RESPONSE, bodies.host,
+                                                      entry.content_mime_type, entry.response_body_size)
+        request_raw_size = len(bodies.request_raw_content or b"")
+        request_capture_rule = self.get_capture_rule(CapturePolicy.BODY_REQUEST, bodies.host,
+                                                     bodies.request_mime_type, request_raw_size)
+        request_content = None
+        if bodies.request_streamed_body is not None:
+            entry.request_body_size = bodies.request_streamed_body.size
+        elif request_capture_rule is not None and request_capture_rule.action == CapturePolicy.CAPTURE_METADATA:
+            entry.request_body_size = request_raw_size
+        else:
+            request_content = util.decode_content(bodies.request_raw_content, bodies.request_content_encoding)
+            entry.request_body_size = len(request_content)
+
+        if bodies.response_streamed_body is not None:
+            # Hash only, the body went through without being kept
+            entry.content_compression = 0
+            entry.content_capture = collections.OrderedDict(_capture=StreamedBodies.CAPTURE_STREAMED)
+            entry.content_capture.update(bodies.response_streamed_body.to_har())
+        elif response_capture_rule is not None and response_capture_rule.action == CapturePolicy.CAPTURE_METADATA:
+            entry.content_compression = 0
+            entry.content_capture = self.capture_policy.capture_metadata(entry.response_body_size)
+        else:
+            response_content = util.decode_content(bodies.response_raw_content, bodies.response_content_encoding)
+            entry.content_compression = len(response_content) - entry.response_body_size
+            if response_capture_rule is not None:
+                response_content, entry.content_capture = self.capture_policy.capture(response_capture_rule,
+                                                                                      response_content)
+            entry.content_body_ref = self.har_writer.store_body(response_content)
+            if entry.content_body_ref is None:
+                # Store binary data as base64
+                detect_data = util.get_content_as_string(response_content)
+                entry.content_text = detect_data['content']
+                if detect_data['is_binary']:
+                    entry.content_encoding = detect_data['detected_encoding']['encoding']
+
+        if bodies.request_form is not None:
+            entry.request_post_data = self.parse_post_data(bodies, request_content, request_capture_rule)
+        return entry
 
-        if flow.request.method in ["POST", "PUT", "PATCH"]:
-            params = [{"name": a, "value": b} for a, b in flow.request.urlencoded_form.items(multi=True)]
-            detect_data = util.get_content_as_string(util.get_content_safely(flow.request))
-            entry["request"]["postData"] = {
-                "mimeType": flow.request.headers.get("Content-Type", ""),
-                "text": detect_data['content'],
-                "params": params
-            }
-            if detect_data['is_binary']:
-                entry["request"]["postData"]["encoding"] = detect_data['detected_encoding']['encoding']
+    def get_capture_rule(self, body: str, host: str, mime_type: str, size: int):
+        if self.capture_policy is None:
+            return None
+        return self.capture_policy.get_rule(body, host, mime_type, size)
 
-        if flow.server_conn.connected():
-            entry["serverIPAddress"] = str(flow.server_conn.ip_address[0])
+    def parse_post_data(self, bodies, request_content: bytes, capture_rule) -> dict:
+        """
+        :param request_content: the decoded request body, None when it is streamed or kept as metadata only
+        :param capture_rule: the capture rule of the request body, resolved on its raw size (see build_entry)
+        """
+        mime_type = bodies.request_mime_type
+        if bodies.request_streamed_body is not None:
+            post_data = {"mimeType": mime_type, "text": ""}
+            post_data.update(bodies.request_streamed_body.to_har())
+            return post_data
+        if capture_rule is not None and capture_rule.action == CapturePolicy.CAPTURE_METADATA:
+            post_data = {"mimeType": mime_type}
+            post_data.update(self.capture_policy.capture_metadata(len(bodies.request_raw_content or b"")))
+            return post_data
+
+        params = [{"name": a, "value": b} for a, b in bodies.request_form]
+        capture_fields = None
+        if capture_rule is not None:
+            request_content, capture_fields = self.capture_policy.capture(capture_rule, request_content)
+        detect_data = util.get_content_as_string(request_content)
+        post_data = {
+            "mimeType": mime_type,
+            "text": detect_data['content'],
+            "params": params
+        }
+        if detect_data['is_binary']:
+            post_data["encoding"] = detect_data['detected_encoding']['encoding']
+        if capture_fields is not None:
+            post_data.update(capture_fields)
+        return post_data
 
-        return entry
+    def write_built_entries(self, wait: bool = False):
+        """
+        Hands the entries built on the entry builder threads to the writer, in the order their flows completed
+        (an entry still being built holds back the ones after it). Waits for the oldest entries while too many
+        are pending, and for all of them when wait is set.
+        """
+        while self.pending_entries and (wait or self.pending_entries[0].done() or
+                                        len(self.pending_entries) > MAX_PENDING_ENTRIES):
+            future = self.pending_entries.popleft()
+            try:
+                self.har_writer.add_single_entry(future.result())
+            except Exception as error:
+                ctx.log.error("Failed to build the HAR entry of a flow: %r" % error)
+        util.report_pending_log_messages()
 
     # Gets the proxy configurations from mitmproxy's ctx.options
     # Writes these settings to the HAR file if they exist.
@@ -261,8 +537,39 @@ class HttpHarDumper:
         elif ctx.options.upstream_auth is not None:
             proxy_settings["proxyAuthenticationType"] = "basic"
 
+    def add_listener_events(self):
+        invalid_counter = HTTPHandlers.add_control_events(self, self.control_listener.take_events())
+        if invalid_counter > 0:
+            ctx.log.debug("Control event listener skipped %s events without a name" % invalid_counter)
+
     def final(self):
+        if self.streaming_flows:
+            self.write_streamed_responses(wait=True)
+        if self.entry_builder is not None:
+            self.write_built_entries(wait=True)
+            self.entry_builder.shutdown()
+            self.entry_builder = None
+        if self.control_listener is not None:
+            self.control_listener.stop()
+            self.add_listener_events()
+            statistics = self.control_listener.get_statistics()
+            ctx.log.debug("Control event listener received %s messages (%s invalid lines)" %
+                          (statistics["messages"], statistics["invalid"]))
+            self.har_writer.add_settings("_controlListener", statistics)
+            self.control_listener = None
         self.parse_proxy_settings()
+        if self.connection_tracker.get_count() > 0:
+            self.har_writer.add_entries("_connections", self.connection_tracker.get_section())
+        if self.record_filter is not None:
+            statistics = self.record_filter.get_statistics()
+            ctx.log.debug("Record filter skipped %s of %s flows %s" %
+                          (statistics["skipped"], statistics["checked"], dict(statistics["skippedBy"])))
+            self.har_writer.add_settings("_recordFilter", statistics)
+        if self.capture_policy is not None:
+            statistics = self.capture_policy.get_statistics()
+            ctx.log.debug("Body capture policy truncated %s bodies and kept %s as metadata only (%s bytes skipped)" %
+                          (statistics["truncated"], statistics["metadataOnly"], statistics["skippedBytes"]))
+            self.har_writer.add_settings("_capturePolicy", statistics)
         if len(self.transactions) > 0:
             self.har_writer.add_entries("_transactions", self.transactions)
         if len(self.actions) > 0:
@@ -274,6 +581,15 @@ class HttpHarDumper:
         ctx.log.debug("Finished creating HTTP / HTTPS / HTTP/2 har report")
 
 
+class FlowBodies:
+    """
+    The bodies of a flow and the request fields needed to record them, copied out of the flow by snapshot_flow
+    """
+    __slots__ = ("host", "response_raw_content", "response_content_encoding", "request_raw_content",
+                 "request_content_encoding", "request_mime_type", "request_form", "request_streamed_body",
+                 "response_streamed_body")
+
+
 class ImpOrderedDict(collections.OrderedDict):
     def last(self):
         k = next(reversed(self))
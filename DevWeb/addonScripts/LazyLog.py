@@ -0,0 +1,96 @@
+"""
+Level gated logging facade of the addon scripts.
+
+Messages are formatted only when their level is logged: the text is a str.format string and its arguments are
+passed along, LazyLog.debug("Request {} '{}'", method, url), so a debug message costs a single comparison at the
+info level. The logged level is the termlog_verbosity option (mitmdump's output), re-read whenever the options
+change; without it (no termlog addon) every level is logged.
+mitmproxy's log must be used from the master (main) thread, the messages logged by other threads (the HAR entry
+builder threads) wait in PENDING_LOG_MESSAGES until report_pending_log_messages is called from the master thread,
+past its capacity the oldest ones are dropped and counted, the count is reported along with the next messages.
+"""
+import collections
+import threading
+
+from mitmproxy import ctx
+
+# Same tiers as mitmproxy.log.log_tier
+LOG_TIERS = {"error": 0, "warn": 1, "info": 2, "alert": 2, "debug": 3}
+DEBUG_TIER = LOG_TIERS["debug"]
+VERBOSITY_OPTION = "termlog_verbosity"
+
+PENDING_LOG_MESSAGES = collections.deque(maxlen=10000)
+PENDING_LOG_LOCK = threading.Lock()
+dropped_log_messages = 0
+
+# Tier of the most verbose level logged
+log_tier = DEBUG_TIER
+
+
+def update_log_tier(*_, **__):
+    global log_tier
+    options = getattr(ctx, "options", None)
+    if options is None or VERBOSITY_OPTION not in options:
+        log_tier = DEBUG_TIER
+    else:
+        log_tier = LOG_TIERS.get(getattr(options, VERBOSITY_OPTION), DEBUG_TIER)
+
+
+def is_enabled(level: str) -> bool:
+    return LOG_TIERS.get(level, 0) <= log_tier
+
+
+def log(text: str, level: str = "info", *args):
+    if LOG_TIERS.get(level, 0) > log_tier:
+        return
+    if args:
+        text = text.format(*args)
+    if threading.current_thread() is threading.main_thread():
+        ctx.log(text, level)
+    else:
+        add_pending_log_message(text, level)
+
+
+def debug(text: str, *args):
+    # Checked before the call to log, debug messages are the hot ones
+    if log_tier >= DEBUG_TIER:
+        log(text, "debug", *args)
+
+
+def info(text: str, *args):
+    log(text, "info", *args)
+
+
+def warn(text: str, *args):
+    log(text, "warn", *args)
+
+
+def error(text: str, *args):
+    log(text, "error", *args)
+
+
+def add_pending_log_message(text: str, level: str):
+    global dropped_log_messages
+    with PENDING_LOG_LOCK:
+        if len(PENDING_LOG_MESSAGES) == PENDING_LOG_MESSAGES.maxlen:
+            # The append drops the oldest message
+            dropped_log_messages += 1
+        PENDING_LOG_MESSAGES.append((text, level))
+
+
+def report_pending_log_messages():
+    global dropped_log_messages
+    if dropped_log_messages:
+        with PENDING_LOG_LOCK:
+            dropped, dropped_log_messages = dropped_log_messages, 0
+        ctx.log.warn("%s log messages of the background threads were dropped (more than %s waiting to be logged)" %
+                     (dropped, PENDING_LOG_MESSAGES.maxlen))
+    while PENDING_LOG_MESSAGES:
+        text, level = PENDING_LOG_MESSAGES.popleft()
+        ctx.log(text, level)
+
+
+update_log_tier()
+if getattr(ctx, "options", None) is not None:
+    # blinker keeps a weak reference, update_log_tier lives as long as the module
+    ctx.options.changed.connect(update_log_tier)
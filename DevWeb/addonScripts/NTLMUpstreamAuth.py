@@ -3,6 +3,7 @@ import binascii
 import socket
 import typing
 
+import LazyLog
 from mitmproxy.proxy.protocol.http import HttpLayer
 from mitmproxy.proxy.protocol.http import UpstreamConnectLayer
 from mitmproxy import http
@@ -64,7 +65,8 @@ def perform_ntlm_authentication(ctx_log: log, ctx_options: options, flow: http.H
             'Proxy NTLM Authentication expected for {} and received {}'.format(
                 status_codes.RESPONSES[status_codes.PROXY_AUTH_REQUIRED],
                 status_codes.RESPONSES[response_message.status_code]), "alert")
-        ctx_log("Proxy NTLM Authentication response headers {}".format(response_message.headers.__str__()), "debug")
+        if LazyLog.is_enabled("debug"):
+            ctx_log("Proxy NTLM Authentication response headers {}".format(response_message.headers.__str__()), "debug")
         return
 
     ctx_log('Challenge Proxy-Authorization id:{}, server id:{}'.format(flow.id, flow.server_conn.id), "debug")
@@ -90,7 +92,8 @@ def perform_ntlm_authentication(ctx_log: log, ctx_options: options, flow: http.H
             'Proxy NTLM Authentication expected for {} or {} and received {}'.format(
                 status_codes.RESPONSES[status_codes.OK], status_codes.RESPONSES[status_codes.UNAUTHORIZED],
                 status_codes.RESPONSES[response_message.status_code]), "alert")
-        ctx_log("Proxy NTLM Authentication response headers {}".format(response_message.headers.__str__()), "debug")
+        if LazyLog.is_enabled("debug"):
+            ctx_log("Proxy NTLM Authentication response headers {}".format(response_message.headers.__str__()), "debug")
         return
 
 
@@ -144,9 +147,10 @@ class NTLMUpstreamAuth:
         context = ctx
 
         def devweb_handle_upstream_connect(self, flow: http.HTTPFlow):
-            self.log(
-                'NTLMUpstreamAuth - in devweb_handle_upstream_connect: {}'.format(flow.request.host),
-                "debug")
+            if LazyLog.is_enabled("debug"):
+                self.log(
+                    'NTLMUpstreamAuth - in devweb_handle_upstream_connect: {}'.format(flow.request.host),
+                    "debug")
             if not flow.response:
                 self.establish_server_connection(
                     flow.request.host,
@@ -217,7 +221,8 @@ class DevWebNTLMContext:
         username = auth_details[0]
         password = auth_details[1]
         workstation = socket.gethostname().upper()
-        ctx_log('ntlm context with the details: "{}\\{}", "{}"'.format(domain, username, password), "debug")
+        if LazyLog.is_enabled("debug"):
+            ctx_log('ntlm context with the details: "{}\\{}", "{}"'.format(domain, username, password), "debug")
 
         self.ctx_log = ctx_log
         self.preferred_type = preferred_type
@@ -234,8 +239,9 @@ class DevWebNTLMContext:
         negotiate_message_base_64_in_bytes = base64.b64encode(negotiate_message)
         negotiate_message_base_64_ascii = negotiate_message_base_64_in_bytes.decode("ascii")
         negotiate_message_base_64_final = u'%s %s' % (self.preferred_type, negotiate_message_base_64_ascii)
-        self.ctx_log('{} Authentication, negotiate message: {}'
-                     .format(self.preferred_type, negotiate_message_base_64_final), "debug")
+        if LazyLog.is_enabled("debug"):
+            self.ctx_log('{} Authentication, negotiate message: {}'
+                         .format(self.preferred_type, negotiate_message_base_64_final), "debug")
         return negotiate_message_base_64_final
 
     # challenge_message come from reading header Proxy-Authenticate
@@ -249,6 +255,7 @@ class DevWebNTLMContext:
         authenticate_message = self.ntlm_context.step(challenge_message_ascii_bytes)
         negotiate_message_base_64 = u'%s %s' % (self.preferred_type,
                                                 base64.b64encode(authenticate_message).decode('ascii'))
-        self.ctx_log('{} Authentication, response to challenge message: {}'
-                     .format(self.preferred_type, negotiate_message_base_64), "debug")
+        if LazyLog.is_enabled("debug"):
+            self.ctx_log('{} Authentication, response to challenge message: {}'
+                         .format(self.preferred_type, negotiate_message_base_64), "debug")
         return negotiate_message_base_64
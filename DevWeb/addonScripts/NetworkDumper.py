@@ -1,8 +1,16 @@
+import FlowRouter
+import RecorderMetrics
+import util
 from mitmproxy import ctx
 from mitmproxy import http
+from mitmproxy import tcp
+from mitmproxy import websocket
 from mitmproxy import addonmanager
 from mitmproxy.exceptions import TcpException
 
+# Addon hooks whose latency is measured
+METRICS_HOOKS = ("request", "response", "websocket_message", "tcp_message")
+
 
 class NetworkDumper:
     ScriptAddons = []
@@ -11,6 +19,9 @@ class NetworkDumper:
     def __init__(self) -> None:
         super().__init__()
         self.counter = 0
+        self.metrics = RecorderMetrics.RecorderMetrics()
+        self.har_writer = None
+        self.http_har_dumper = None
 
     def load(self, entry: addonmanager.Loader):
         # Monkey Patch handle edge case that mitmproxy crash on Reset TCP Connection by client
@@ -56,8 +67,10 @@ class NetworkDumper:
     def request(self, flow: http.HTTPFlow):
         # since special requests are sent as dummy urls, we intercept them
         # and set the status code to 200 with an event message to prevent log file errors.
-        url = flow.request.url
-        if "shutdown.devweb" in url:
+        if util.get_flow_route(flow) != FlowRouter.ROUTE_CONTROL:
+            return
+        control = FlowRouter.CONTROL_HOSTS[flow.request.host]
+        if control == FlowRouter.CONTROL_SHUTDOWN:
             ctx.log.debug("Closing proxy")
             flow.response = http.HTTPResponse.make(
                 200,  # Status OK
@@ -68,34 +81,46 @@ class NetworkDumper:
             ctx.master.addons.trigger("done")
             # End of workaround. issue [3572] (https://github.com/mitmproxy/mitmproxy/issues/3572)
             ctx.master.shutdown()
-        if 'transaction.start' in url or 'transaction.end' in url:
+        elif control == FlowRouter.CONTROL_METRICS:
             flow.response = http.HTTPResponse.make(
                 200,  # Status OK
-                f"Transaction Event: {flow.request.host}",
-                {"Content-Type": "text/html"}
+                self.metrics.render(self.get_metrics_gauges()),
+                {"Content-Type": RecorderMetrics.CONTENT_TYPE}
             )
-            return
-        if 'action.start' in url or 'action.end' in url:
+        else:
+            # Transaction, action, step and log events
             flow.response = http.HTTPResponse.make(
                 200,  # Status OK
-                f"Action Event: {flow.request.host}",
-                {"Content-Type": "text/html"}
-            )
-            return
-        if 'step.description' in url or 'step.comment' in url:
-            flow.response = http.HTTPResponse.make(
-                200,  # Status OK
-                f"Step Event: {flow.request.host}",
-                {"Content-Type": "text/html"}
-            )
-            return
-        if 'log.info' in url or 'log.debug' in url or 'log.warning' in url or 'log.error' in url:
-            flow.response = http.HTTPResponse.make(
-                200,  # Status OK
-                f"Log Event: {flow.request.host}",
+                f"{control} Event: {flow.request.host}",
                 {"Content-Type": "text/html"}
             )
+
+    def response(self, flow: http.HTTPFlow):
+        if util.get_flow_route(flow) == FlowRouter.ROUTE_CONTROL:
+            # The control requests (metrics scrapes and events) are not traffic of the recording
             return
+        self.metrics.add_flow(util.get_headers_size(flow.request.headers) + len(flow.request.raw_content or b""),
+                              util.get_headers_size(flow.response.headers) + len(flow.response.raw_content or b""))
+
+    def websocket_message(self, flow: websocket.WebSocketFlow):
+        self.metrics.add_message("websocket", len(flow.messages[-1].content))
+
+    def tcp_message(self, flow: tcp.TCPFlow):
+        self.metrics.add_message("tcp", len(flow.messages[-1].content))
+
+    def get_metrics_gauges(self) -> list:
+        memory_statistics = self.har_writer.get_memory_statistics()
+        return [
+            ("devweb_recorder_har_entries", "HAR entries recorded", self.har_writer.get_har_entries_size()),
+            ("devweb_recorder_har_entries_held", "HAR entries held in memory (buffered mode)",
+             memory_statistics["heldEntries"]),
+            ("devweb_recorder_har_memory_bytes", "Estimated memory of the HAR entries held (records and bodies)",
+             memory_statistics["estimatedMemory"]),
+            ("devweb_recorder_writer_queue_depth", "Operations waiting in the HAR writer thread queue",
+             memory_statistics["writerQueueDepth"]),
+            ("devweb_recorder_entry_builder_pending", "HAR entries waiting for the entry builder threads",
+             len(self.http_har_dumper.pending_entries)),
+        ]
 
     #  TODO: maybe load dumpers per flag in options
     def running(self):
@@ -106,13 +131,20 @@ class NetworkDumper:
 
     def init_addons(self):
         from WebSocketHarDumper import WebSocketHarDumper
+        from SseHarDumper import SseHarDumper
         from HttpHarDumper import HttpHarDumper
         from HarWriter import HarWriter
 
         writer = HarWriter()
         web_socket_har_dumper = WebSocketHarDumper(writer)
+        # Before HttpHarDumper, its responseheaders hook leaves the event streams to the SSE dumper
+        sse_har_dumper = SseHarDumper(writer)
         http_har_dumper = HttpHarDumper(writer)
-        self.ScriptAddons = [web_socket_har_dumper, http_har_dumper, writer]
+        self.ScriptAddons = [web_socket_har_dumper, sse_har_dumper, http_har_dumper, writer]
+        self.har_writer = writer
+        self.http_har_dumper = http_har_dumper
+        for addon in self.ScriptAddons:
+            self.metrics.time_hooks(addon, METRICS_HOOKS)
 
     def done(self):
         if self.counter > 0:
@@ -0,0 +1,89 @@
+"""
+Record time filter built from the filter section of generator_config.yml.
+
+The code generator drops the flows excluded by the filter keys below, this filter applies the same keys while
+recording so excluded flows are never parsed, encoded or stored:
+    includeHosts               - when not empty, only these hosts are recorded (regular expressions)
+    excludeHosts               - hosts that are not recorded (regular expressions)
+    excludeUrls                - URLs that are not recorded (regular expressions)
+    excludeMethods             - request methods that are not recorded
+    excludeResponseStatusCodes - response status codes that are not recorded
+    extensions                 - URL path extensions that are not recorded
+The patterns are compiled once, skipped flows are counted per filter key.
+"""
+import collections
+import re
+from urllib.parse import urlsplit
+
+FILTER_INCLUDE_HOSTS = "includeHosts"
+FILTER_EXCLUDE_HOSTS = "excludeHosts"
+FILTER_EXCLUDE_URLS = "excludeUrls"
+FILTER_EXCLUDE_METHODS = "excludeMethods"
+FILTER_EXCLUDE_STATUS_CODES = "excludeResponseStatusCodes"
+FILTER_EXTENSIONS = "extensions"
+
+
+def compile_patterns(patterns, flags=0):
+    """
+    Compiles a list of regular expressions to a single one, or None if the list is empty
+    """
+    if not patterns:
+        return None
+    return re.compile("|".join("(?:%s)" % pattern for pattern in patterns), flags)
+
+
+def load_filter_config(config_path: str) -> dict:
+    """
+    Returns the filter section of a generator_config.yml file
+    """
+    # ruamel.yaml is a mitmproxy dependency
+    from ruamel.yaml import YAML
+    with open(config_path, mode="r", encoding="utf8") as config_file:
+        config = YAML(typ="safe", pure=True).load(config_file) or {}
+    return config.get("filter") or {}
+
+
+class RecordFilter:
+    def __init__(self, filter_config: dict):
+        self.include_hosts = compile_patterns(filter_config.get(FILTER_INCLUDE_HOSTS), re.IGNORECASE)
+        self.exclude_hosts = compile_patterns(filter_config.get(FILTER_EXCLUDE_HOSTS), re.IGNORECASE)
+        self.exclude_urls = compile_patterns(filter_config.get(FILTER_EXCLUDE_URLS))
+        self.exclude_methods = frozenset(method.upper() for method in filter_config.get(FILTER_EXCLUDE_METHODS) or [])
+        self.exclude_status_codes = frozenset(int(code) for code in
+                                              filter_config.get(FILTER_EXCLUDE_STATUS_CODES) or [])
+        self.extensions = tuple(extension.lower() for extension in filter_config.get(FILTER_EXTENSIONS) or [])
+        self.skipped_counters = collections.Counter()
+        self.checked_counter = 0
+
+    def get_skip_reason(self, host: str, url: str, method: str, status_code: int):
+        """
+        Returns the filter key excluding the flow, or None if the flow should be recorded
+        """
+        self.checked_counter += 1
+        reason = self.match(host, url, method, status_code)
+        if reason is not None:
+            self.skipped_counters[reason] += 1
+        return reason
+
+    def match(self, host: str, url: str, method: str, status_code: int):
+        # The cheapest checks first
+        if method.upper() in self.exclude_methods:
+            return FILTER_EXCLUDE_METHODS
+        if status_code in self.exclude_status_codes:
+            return FILTER_EXCLUDE_STATUS_CODES
+        if self.include_hosts is not None and not self.include_hosts.match(host):
+            return FILTER_INCLUDE_HOSTS
+        if self.exclude_hosts is not None and self.exclude_hosts.match(host):
+            return FILTER_EXCLUDE_HOSTS
+        if self.extensions and urlsplit(url).path.lower().endswith(self.extensions):
+            return FILTER_EXTENSIONS
+        if self.exclude_urls is not None and self.exclude_urls.match(url):
+            return FILTER_EXCLUDE_URLS
+        return None
+
+    def get_statistics(self) -> collections.OrderedDict:
+        statistics = collections.OrderedDict()
+        statistics["checked"] = self.checked_counter
+        statistics["skipped"] = sum(self.skipped_counters.values())
+        statistics["skippedBy"] = collections.OrderedDict(sorted(self.skipped_counters.items()))
+        return statistics
@@ -0,0 +1,166 @@
+"""
+Recorder metrics served by NetworkDumper on the metrics.devweb control host, in the Prometheus text format.
+
+The metrics are:
+    devweb_recorder_flows_total, devweb_recorder_flows_per_second   - the HTTP flows proxied (the rate is the
+                                                                       average over the last RATE_WINDOW seconds)
+    devweb_recorder_request_bytes_total                              - bytes in: requests received from the clients
+    devweb_recorder_response_bytes_total                             - bytes out: responses sent to the clients
+    devweb_recorder_messages_total, devweb_recorder_message_bytes_total - WebSocket and TCP messages
+    devweb_recorder_hook_duration_seconds                            - histogram of the addon hooks latency, per
+                                                                       addon and hook
+along with the gauges of the recorder state (HAR entries held, estimated HAR memory, queue depths) passed to render.
+Hooks are timed by wrapping them on the addon instances, which costs two clock reads per call.
+This module does not depend on mitmproxy.
+"""
+import bisect
+import collections
+import functools
+import time
+
+# Upper bounds (seconds) of the hook latency histogram buckets, the last bucket is +Inf
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+RATE_WINDOW = 10
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_value(value) -> str:
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                             for name, value in labels.items())
+
+
+class LatencyHistogram:
+    __slots__ = ("bucket_counts", "sum", "count")
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def render(self, name: str, labels: dict) -> list:
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS + ("+Inf",), self.bucket_counts):
+            cumulative += bucket_count
+            lines.append("%s_bucket%s %s" % (name, format_labels(dict(labels, le=bound)), cumulative))
+        lines.append("%s_sum%s %s" % (name, format_labels(labels), format_value(self.sum)))
+        lines.append("%s_count%s %s" % (name, format_labels(labels), self.count))
+        return lines
+
+
+class RecorderMetrics:
+    def __init__(self):
+        self.start_time = time.time()
+        self.flows_counter = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.message_counters = collections.Counter()
+        self.message_bytes = collections.Counter()
+        # Flows per second of the rate window: [second, flows] pairs, oldest first
+        self.flow_seconds = collections.deque()
+        self.hook_histograms = collections.OrderedDict()
+
+    def time_hooks(self, addon, hooks):
+        """
+        Replaces the hooks implemented by the addon with timed ones
+        """
+        for hook in hooks:
+            function = getattr(addon, hook, None)
+            if function is not None:
+                histogram = self.hook_histograms[(type(addon).__name__, hook)] = LatencyHistogram()
+                setattr(addon, hook, self.timed(function, histogram))
+
+    @staticmethod
+    def timed(function, histogram: LatencyHistogram):
+        @functools.wraps(function)
+        def timed_hook(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start_time)
+
+        return timed_hook
+
+    def add_flow(self, request_bytes: int, response_bytes: int):
+        self.flows_counter += 1
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+        second = int(time.time())
+        if self.flow_seconds and self.flow_seconds[-1][0] == second:
+            self.flow_seconds[-1][1] += 1
+        else:
+            self.flow_seconds.append([second, 1])
+            self.expire_flow_seconds(second)
+
+    def add_message(self, protocol: str, size: int):
+        self.message_counters[protocol] += 1
+        self.message_bytes[protocol] += size
+
+    def expire_flow_seconds(self, second: int):
+        while self.flow_seconds and self.flow_seconds[0][0] <= second - RATE_WINDOW:
+            self.flow_seconds.popleft()
+
+    def get_flows_per_second(self) -> float:
+        second = int(time.time())
+        self.expire_flow_seconds(second)
+        # The current second is not over, the window spans the previous RATE_WINDOW seconds and the current one
+        window = min(RATE_WINDOW, max(time.time() - self.start_time, 1.0))
+        return round(sum(flows for _, flows in self.flow_seconds) / window, 3)
+
+    def render(self, gauges) -> str:
+        """
+        Returns the metrics page.
+        :param gauges: (name, help, value) of the recorder state gauges
+        """
+        lines = []
+        self.add_metric(lines, "devweb_recorder_uptime_seconds", "gauge", "Time since the recorder started",
+                        round(time.time() - self.start_time, 3))
+        self.add_metric(lines, "devweb_recorder_flows_total", "counter", "HTTP flows proxied", self.flows_counter)
+        self.add_metric(lines, "devweb_recorder_flows_per_second", "gauge",
+                        "HTTP flows proxied per second over the last %s seconds" % RATE_WINDOW,
+                        self.get_flows_per_second())
+        self.add_metric(lines, "devweb_recorder_request_bytes_total", "counter",
+                        "Bytes in: headers and raw bodies of the requests received from the clients",
+                        self.request_bytes)
+        self.add_metric(lines, "devweb_recorder_response_bytes_total", "counter",
+                        "Bytes out: headers and raw bodies of the responses sent to the clients", self.response_bytes)
+        self.add_labeled_metric(lines, "devweb_recorder_messages_total", "counter", "WebSocket and TCP messages",
+                                "protocol", self.message_counters)
+        self.add_labeled_metric(lines, "devweb_recorder_message_bytes_total", "counter",
+                                "Bytes of the WebSocket and TCP messages", "protocol", self.message_bytes)
+        for name, help_text, value in gauges:
+            self.add_metric(lines, name, "gauge", help_text, value)
+        name = "devweb_recorder_hook_duration_seconds"
+        lines.append("# HELP %s Latency of the addon hooks" % name)
+        lines.append("# TYPE %s histogram" % name)
+        for (addon, hook), histogram in self.hook_histograms.items():
+            lines.extend(histogram.render(name, collections.OrderedDict((("addon", addon), ("hook", hook)))))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def add_metric(lines: list, name: str, metric_type: str, help_text: str, value):
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s %s" % (name, metric_type))
+        lines.append("%s %s" % (name, format_value(value)))
+
+    @staticmethod
+    def add_labeled_metric(lines: list, name: str, metric_type: str, help_text: str, label: str, values: dict):
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s %s" % (name, metric_type))
+        for label_value, value in sorted(values.items()):
+            lines.append("%s%s %s" % (name, format_labels({label: label_value}), format_value(value)))
@@ -0,0 +1,189 @@
+"""
+Incremental capture of Server-Sent Events (text/event-stream responses), written as the _sseEntries section.
+
+An event stream lasts as long as the page that opened it, so it is not buffered until the response ends: the stream
+callable set on the response parses the chunks into events as they go through (the chunks themselves are passed on
+unchanged). The section has a record per stream and a record per event:
+    streams - _serverConnectionId, url, startedDateTime, events, droppedEvents, closed
+    events  - _serverConnectionId, id, event, data, retry (when set), startedDateTime (when the event was received)
+Compressed streams (gzip or deflate) are decompressed incrementally before being parsed. The events kept are capped
+(beyond the cap they are only counted) and so is the size of an event, so the memory of a stream is bounded however
+long it lasts.
+The chunks are parsed on the proxy connection threads, the parsed events wait in pending_events until SseHarDumper
+adds them from the master thread.
+This module does not depend on mitmproxy.
+"""
+import collections
+import re
+import threading
+import time
+import zlib
+
+EVENT_STREAM_MIME_TYPE = "text/event-stream"
+# Bytes of a single event kept, the rest of its data is dropped
+MAX_EVENT_SIZE = 1024 * 1024
+
+LINE_END_PATTERN = re.compile(rb"\r\n|\r|\n")
+# Content encodings decoded as the chunks go through, other encoded streams are recorded as regular responses
+STREAM_ENCODINGS = ("", "identity", "gzip", "deflate")
+
+
+def is_event_stream(content_type: str) -> bool:
+    return content_type.split(";", 1)[0].strip().lower() == EVENT_STREAM_MIME_TYPE
+
+
+def is_stream_encoding(content_encoding: str) -> bool:
+    return content_encoding.strip().lower() in STREAM_ENCODINGS
+
+
+class SseParser:
+    """
+    Event stream parser following the HTML specification (event, data, id and retry fields, comments and the three
+    line endings), fed with chunks split anywhere.
+    """
+
+    def __init__(self):
+        self.buffer = b""
+        self.reset_event()
+        self.last_event_id = ""
+
+    def reset_event(self):
+        self.event_type = ""
+        self.data_lines = []
+        self.data_size = 0
+        self.retry = None
+
+    def feed(self, chunk: bytes) -> list:
+        """
+        :return: the events completed by the chunk, (id, event type, data, retry) tuples
+        """
+        events = []
+        data = self.buffer + chunk
+        position = 0
+        for line_end in LINE_END_PATTERN.finditer(data):
+            if line_end.group() == b"\r" and line_end.end() == len(data):
+                # May be the first half of a CRLF split between two chunks
+                break
+            event = self.parse_line(data[position:line_end.start()])
+            if event is not None:
+                events.append(event)
+            position = line_end.end()
+        self.buffer = data[position:]
+        if len(self.buffer) > MAX_EVENT_SIZE:
+            # A line that never ends, only its beginning is kept
+            self.buffer = self.buffer[:MAX_EVENT_SIZE]
+        return events
+
+    def flush(self) -> list:
+        """
+        Ends the stream: a CR held back at the end of the last chunk was a line end after all (an unterminated last
+        line is discarded, as the specification requires)
+        :return: the events completed by the held CR
+        """
+        data = self.buffer
+        self.buffer = b""
+        if not data.endswith(b"\r"):
+            return []
+        return self.feed(data[:-1] + b"\n")
+
+    def parse_line(self, line: bytes):
+        if not line:
+            return self.dispatch_event()
+        if line.startswith(b":"):
+            # Comment (keep-alive)
+            return None
+        name, _, value = line.partition(b":")
+        if value.startswith(b" "):
+            value = value[1:]
+        if name == b"data":
+            if self.data_size < MAX_EVENT_SIZE:
+                self.data_lines.append(value[:MAX_EVENT_SIZE - self.data_size])
+                self.data_size += len(value)
+        elif name == b"event":
+            self.event_type = value.decode("utf8", "replace")
+        elif name == b"id":
+            if b"\0" not in value:
+                self.last_event_id = value.decode("utf8", "replace")
+        elif name == b"retry":
+            if value.isdigit():
+                self.retry = int(value)
+        return None
+
+    def dispatch_event(self):
+        if not self.data_lines:
+            self.reset_event()
+            return None
+        event = (self.last_event_id, self.event_type or "message",
+                 b"\n".join(self.data_lines).decode("utf8", "replace"), self.retry)
+        self.reset_event()
+        return event
+
+
+class SseStream:
+    __slots__ = ("server_connection_id", "url", "started_date_time", "events_counter", "dropped_counter", "closed")
+
+    def __init__(self, server_connection_id: str, url: str, started_date_time: str):
+        self.server_connection_id = server_connection_id
+        self.url = url
+        self.started_date_time = started_date_time
+        self.events_counter = 0
+        self.dropped_counter = 0
+        self.closed = False
+
+    def to_har(self) -> collections.OrderedDict:
+        stream = collections.OrderedDict()
+        stream["_serverConnectionId"] = self.server_connection_id
+        stream["url"] = self.url
+        stream["startedDateTime"] = self.started_date_time
+        stream["events"] = self.events_counter
+        stream["droppedEvents"] = self.dropped_counter
+        stream["closed"] = self.closed
+        return stream
+
+
+class SseCollector:
+    def __init__(self, max_events: int):
+        self.max_events = max_events
+        self.kept_counter = 0
+        # (stream, event tuple, receive time) of the parsed events, taken from the master thread
+        self.pending_events = collections.deque()
+        # Streams are parsed on several connection threads
+        self.lock = threading.Lock()
+
+    def capture_chunks(self, stream: SseStream, content_encoding: str, chunks):
+        """
+        Stream callable parsing the chunks into events
+        """
+        parser = SseParser()
+        decompressor = None
+        if content_encoding.strip().lower() in ("gzip", "deflate"):
+            # Automatic gzip or zlib header detection
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+        try:
+            for chunk in chunks:
+                if parser is not None:
+                    try:
+                        events = parser.feed(decompressor.decompress(chunk) if decompressor is not None else chunk)
+                    except zlib.error:
+                        # Undecodable stream, the rest of it only goes through
+                        parser = None
+                        events = None
+                    if events:
+                        self.add_events(stream, events)
+                yield chunk
+        finally:
+            if parser is not None:
+                events = parser.flush()
+                if events:
+                    self.add_events(stream, events)
+            stream.closed = True
+
+    def add_events(self, stream: SseStream, events: list):
+        receive_time = time.time()
+        with self.lock:
+            kept = max(min(len(events), self.max_events - self.kept_counter), 0)
+            self.kept_counter += kept
+        stream.events_counter += len(events)
+        stream.dropped_counter += len(events) - kept
+        for event in events[:kept]:
+            self.pending_events.append((stream, event, receive_time))
@@ -0,0 +1,84 @@
+import collections
+import functools
+
+import FlowRouter
+import ServerSentEvents
+import StreamedBodies
+import util
+from HarWriter import *
+from HttpHarDumper import STREAMED_RESPONSE_KEY
+from mitmproxy import addonmanager
+from mitmproxy import ctx
+from mitmproxy import http
+
+
+class SseHarDumper:
+    harWriter: HarWriter
+    streams: list
+    events: list
+
+    def __init__(self, har_writer):
+        self.harWriter = har_writer
+        self.streams = []
+        self.events = []
+        self.collector = None
+        ctx.log.debug("AddOn: Server-Sent Events Dumper - Loaded")
+
+    def load(self, loader: addonmanager.Loader):
+        loader.add_option(name="har_sse_max_events",
+                          typespec=int,
+                          default=10000,
+                          help="Server-Sent Events kept in the _sseEntries section (all the streams together), the "
+                               "events beyond it are only counted. 0 to record event streams as regular responses.", )
+
+    def running(self):
+        if ctx.options.har_sse_max_events > 0 and self.collector is None:
+            self.collector = ServerSentEvents.SseCollector(ctx.options.har_sse_max_events)
+
+    def responseheaders(self, flow: http.HTTPFlow):
+        """
+            Event streams are parsed as their chunks go through, rather than buffered until the response ends
+        """
+        if self.collector is None or flow.response.stream or \
+                not ServerSentEvents.is_event_stream(flow.response.headers.get("content-type", "")) or \
+                not ServerSentEvents.is_stream_encoding(flow.response.headers.get("content-encoding", "")) or \
+                util.get_flow_route(flow) != FlowRouter.ROUTE_RECORD:
+            return
+        util.log_debug("[SSE stream]: {}", flow.request.url)
+        stream = ServerSentEvents.SseStream(flow.server_conn.id, flow.request.url,
+                                            util.format_datetime(flow.response.timestamp_start))
+        self.streams.append(stream)
+        # The HTTP entry of the response records the size and the hash of the stream (see HttpHarDumper)
+        body = flow.metadata[STREAMED_RESPONSE_KEY] = StreamedBodies.StreamedBody()
+        capture_chunks = functools.partial(self.collector.capture_chunks, stream,
+                                           flow.response.headers.get("content-encoding", ""))
+        flow.response.stream = lambda chunks: StreamedBodies.hash_chunks(body, capture_chunks(chunks))
+
+    def request(self, flow: http.HTTPFlow):
+        if self.collector is not None and self.collector.pending_events:
+            self.add_pending_events()
+
+    def add_pending_events(self):
+        pending_events = self.collector.pending_events
+        while pending_events:
+            stream, (event_id, event_type, data, retry), receive_time = pending_events.popleft()
+            entry = collections.OrderedDict()
+            entry["_serverConnectionId"] = stream.server_connection_id
+            entry["id"] = event_id
+            entry["event"] = event_type
+            entry["data"] = data
+            if retry is not None:
+                entry["retry"] = retry
+            entry["startedDateTime"] = util.format_datetime(receive_time)
+            self.events.append(entry)
+            self.harWriter.add_event("_sseEntries", entry, "events")
+
+    def final(self):
+        if len(self.streams) == 0:
+            return
+        ctx.log.debug("Starting pushing Server-Sent Events entries to har")
+        self.add_pending_events()
+        entries = collections.OrderedDict()
+        entries["streams"] = [stream.to_har() for stream in self.streams]
+        entries["events"] = self.events
+        self.harWriter.add_entries("_sseEntries", entries)
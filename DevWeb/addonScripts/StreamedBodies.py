@@ -0,0 +1,100 @@
+"""
+Large bodies recorded while mitmproxy streams them, so they are never held in memory.
+
+A streamed body is seen as the chunks of the stream callable set on the request or the response (see mitmproxy's
+stream option), the chunks pass through unchanged while a rolling SHA-256 and the length are computed. Large request
+bodies (uploads) are also written to a sidecar file, <har path>.uploads/<hex digest>, so they can be replayed, large
+response bodies (downloads, media segments) are only hashed.
+The chunks are handled on the proxy connection threads, a StreamedBody is only read once finished.
+This module does not depend on mitmproxy.
+"""
+import collections
+import hashlib
+import os
+import tempfile
+import time
+
+SPOOL_TEMP_PREFIX = ".upload_"
+# _capture value of the response bodies recorded as their hash only
+CAPTURE_STREAMED = "streamed"
+
+
+def get_spool_path(har_file_path: str) -> str:
+    return har_file_path + ".uploads"
+
+
+class StreamedBody:
+    __slots__ = ("sha256", "size", "file_name", "complete", "finished", "end_time")
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        # Name of the sidecar file, relative to the HAR directory
+        self.file_name = None
+        self.complete = False
+        # Set once the stream is over, complete or not
+        self.finished = False
+        self.end_time = None
+
+    def to_har(self) -> collections.OrderedDict:
+        """
+        Returns the fields describing the body in the HAR (postData or content)
+        """
+        fields = collections.OrderedDict()
+        fields["_size"] = self.size
+        if self.complete:
+            fields["_sha256"] = self.sha256.hexdigest()
+            if self.file_name is not None:
+                fields["_bodyFile"] = self.file_name
+        else:
+            # The stream was interrupted, the size is the part that went through
+            fields["_streamed"] = "incomplete"
+        return fields
+
+    def finish(self):
+        self.end_time = time.time()
+        self.finished = True
+
+
+def hash_chunks(body: StreamedBody, chunks):
+    """
+    Stream callable hashing the chunks, nothing is kept
+    """
+    try:
+        for chunk in chunks:
+            body.sha256.update(chunk)
+            body.size += len(chunk)
+            yield chunk
+        body.complete = True
+    finally:
+        body.finish()
+
+
+class RequestSpool:
+    def __init__(self, spool_path: str):
+        self.spool_path = spool_path
+        os.makedirs(spool_path, exist_ok=True)
+
+    def spool_chunks(self, body: StreamedBody, chunks):
+        """
+        Stream callable writing the chunks to a sidecar file named after their SHA-256
+        """
+        spool_file = tempfile.NamedTemporaryFile(mode="wb", prefix=SPOOL_TEMP_PREFIX, dir=self.spool_path,
+                                                 delete=False)
+        try:
+            with spool_file:
+                for chunk in chunks:
+                    body.sha256.update(chunk)
+                    body.size += len(chunk)
+                    spool_file.write(chunk)
+                    yield chunk
+        except BaseException:
+            os.remove(spool_file.name)
+            body.finish()
+            raise
+        hex_digest = body.sha256.hexdigest()
+        # Identical uploads share their file
+        os.replace(spool_file.name, os.path.join(self.spool_path, hex_digest))
+        body.file_name = "%s/%s" % (os.path.basename(self.spool_path), hex_digest)
+        body.complete = True
+        body.finish()
@@ -2,6 +2,7 @@ import collections
 import time
 import typing
 
+import LazyLog
 import util
 from mitmproxy import tcp, ctx
 from mitmproxy.utils import strutils
@@ -35,55 +36,58 @@ class TcpHarDumper:
         """
             A TCP connection has started.
         """
-        ctx.log.debug(
-            "[Tcp connection has been established] from {} to {}\n".format(flow.client_conn.address,
-                                                                           flow.server_conn.address))
+        util.log_debug("[Tcp connection has been established] from {} to {}\n", flow.client_conn.address,
+                       flow.server_conn.address)
         entry = collections.OrderedDict()
         entry["_serverConnectionId"] = flow.server_conn.id
         entry["client_address"] = flow.client_conn.address
         entry["server_address"] = flow.server_conn.address
         self.connections.append(entry)
+        self.harWriter.add_event("_tcpEntries", entry, "connections")
 
     def tcp_end(self, flow: tcp.TCPFlow):
         """
             A TCP connection has started.
         """
-        ctx.log.debug(
-            "[Tcp connection has ended] from {} to {}\n".format(flow.client_conn.address,
-                                                                flow.server_conn.address))
+        util.log_debug("[Tcp connection has ended] from {} to {}\n", flow.client_conn.address,
+                       flow.server_conn.address)
         entry = collections.OrderedDict()
         entry["_serverConnectionId"] = flow.server_conn.id
 
         entry["startedDateTime"] = util.format_datetime(time.time())
         self.disconnections.append(entry)
+        self.harWriter.add_event("_tcpEntries", entry, "disconnections")
 
     def tcp_error(self, flow: tcp.TCPFlow):
         """
             A TCP connection has started.
         """
-        ctx.log.debug(
-            "[Error received on TCP connection] from {} to {}\n:{}".format(flow.client_conn.address,
-                                                                           flow.server_conn.address, flow.error))
+        util.log_debug("[Error received on TCP connection] from {} to {}\n:{}", flow.client_conn.address,
+                       flow.server_conn.address, flow.error)
         entry = collections.OrderedDict()
         entry["_serverConnectionId"] = flow.server_conn.id
         entry["message"] = flow.error.msg
         entry["startedDateTime"] = util.format_datetime(flow.error.timestamp)
         self.errors.append(entry)
+        self.harWriter.add_event("_tcpEntries", entry, "errors")
 
     def tcp_message(self, flow: tcp.TCPFlow):
         message = flow.messages[-1]
-        ctx.log.debug(
-            "[tcp_message{}] from {} to {}:\n{}".format(
+        if LazyLog.is_enabled("debug"):
+            # Escaping the content is the costly part, skipped when debug messages are not logged
+            util.log_debug(
+                "[tcp_message{}] from {} to {}:\n{}",
                 " (modified)",
                 "client" if message.from_client else "server",
                 "server" if message.from_client else "client",
-                strutils.bytes_to_escaped_str(message.content)))
+                strutils.bytes_to_escaped_str(message.content))
 
         entry = collections.OrderedDict()
         entry['source'] = util.get_message_source(message)
         entry['content'] = message.content
         entry['startedDateTime'] = util.format_datetime(message.timestamp)
         self.messages.append(entry)
+        self.harWriter.add_event("_tcpEntries", entry, "messages")
 
     def final(self):
         ctx.log.debug("Starting pushing TCP entries to har")
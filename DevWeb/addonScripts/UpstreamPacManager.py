@@ -1,6 +1,7 @@
 import re
 import typing
 
+import LazyLog
 from mitmproxy import addonmanager
 from mitmproxy import ctx
 from mitmproxy import http
@@ -36,7 +37,7 @@ class UpstreamPacManager:
         address = self.proxy_address(flow)
         if address[0] == 'Continue':  # No flow Host, resuming flow as before
             return
-        ctx.log.debug('[UpstreamPacManager] request_headers from {} to {}'.format(human.format_address(flow.client_conn.ip_address), flow.server_conn.address))
+        LazyLog.debug('[UpstreamPacManager] request_headers from {} to {}', human.format_address(flow.client_conn.ip_address), flow.server_conn.address)
         if self.handle_direct_proxy(flow, address, 'request_headers'):  # DIRECT proxy
             return
         self.setUpstreamProxyIfNeedded(address, 'request_headers event')
@@ -46,7 +47,7 @@ class UpstreamPacManager:
         if self.pac is None:
             return
         address = self.proxy_address(flow)
-        ctx.log.debug('[UpstreamPacManager] http_connect from {} to {}'.format(human.format_address(flow.client_conn.ip_address), flow.server_conn.address))
+        LazyLog.debug('[UpstreamPacManager] http_connect from {} to {}', human.format_address(flow.client_conn.ip_address), flow.server_conn.address)
         if self.handle_direct_proxy(flow, address, 'http_connect'):
             return
         self.setUpstreamProxyIfNeedded(address, 'http_connect event')
@@ -54,17 +55,17 @@ class UpstreamPacManager:
 
     def proxy_address(self, flow: http.HTTPFlow) -> typing.Tuple[str, int]:
         if flow.request.host is None:
-            ctx.log.debug(
-                '[UpstreamPacManager] no available host for current flow {}, resuming flow'.format(flow.client_conn))
+            LazyLog.debug(
+                '[UpstreamPacManager] no available host for current flow {}, resuming flow', flow.client_conn)
             return 'Continue', 1
         if self.hosts_visited.__contains__(flow.request.host):
-            ctx.log.debug(
-                '[UpstreamPacManager] cached proxy "{}" for url "{}".'.format(self.hosts_visited[flow.request.host],
-                                                                              flow.request.url))
+            LazyLog.debug(
+                '[UpstreamPacManager] cached proxy "{}" for url "{}".', self.hosts_visited[flow.request.host],
+                flow.request.url)
             return self.hosts_visited[flow.request.host]
         proxies_string = self.pac.find_proxy_for_url(flow.request.url, flow.request.host)
-        ctx.log.debug('[UpstreamPacManager] Auto-proxy configuration selected "{}" for url "{}".'.format(proxies_string,
-                                                                                                         flow.request.url))
+        LazyLog.debug('[UpstreamPacManager] Auto-proxy configuration selected "{}" for url "{}".', proxies_string,
+                      flow.request.url)
         parsed_proxies = pac_parser.parse_pac_value(proxies_string)
         proxy_elements = re.split('://|:', parsed_proxies[0])
         if len(proxy_elements) == 1:  # DIRECT proxy
@@ -74,9 +75,9 @@ class UpstreamPacManager:
         return proxy_elements[1], int(proxy_elements[2])
 
     def handle_direct_proxy(self, flow: http.HTTPFlow, address: typing.Tuple[str, int], event):
-        ctx.log.debug(
-            '[UpstreamPacManager] handle direct proxy: current flow mode is {} and options mode is {}. event is {}'.format(
-                flow.live.mode, ctx.options.mode, event))
+        LazyLog.debug(
+            '[UpstreamPacManager] handle direct proxy: current flow mode is {} and options mode is {}. event is {}',
+            flow.live.mode, ctx.options.mode, event)
         if address[1] == 0:  # DIRECT proxy
             if flow.live.mode == HTTPMode.upstream:
                 flow.live.mode = HTTPMode.regular
@@ -84,21 +85,21 @@ class UpstreamPacManager:
             return True
 
     def handle_upstream_proxy(self, flow: http.HTTPFlow, address: typing.Tuple[str, int], event):
-        ctx.log.debug(
-            '[UpstreamPacManager] handle upstream proxy: current flow mode is {} and upstream is {}. event is {}'.format(
-                flow.live.mode, ctx.options.mode, event))
+        LazyLog.debug(
+            '[UpstreamPacManager] handle upstream proxy: current flow mode is {} and upstream is {}. event is {}',
+            flow.live.mode, ctx.options.mode, event)
         if flow.live.mode == HTTPMode.regular or (
                 flow.live.mode == HTTPMode.upstream and self.hosts_visited[flow.request.host] is not address):
             flow.mode = HTTPMode.upstream
             flow.live.mode = HTTPMode.upstream
             flow.live.change_upstream_proxy_server(address)
-            ctx.log.debug('[UpstreamPacManager] changed upstream proxy to: {}:{}'.format(address[0], address[1]))
+            LazyLog.debug('[UpstreamPacManager] changed upstream proxy to: {}:{}', address[0], address[1])
 
     def setUpstreamProxyIfNeedded(self, address, event):
         if not ctx.options.mode.__contains__('upstream'):
             # mode exists in the options, we just have to reset it.
             ctx.master.options.__setattr__("mode", "upstream:" + address[0] + ":" + str(address[1]))
-            ctx.log.debug('[UpstreamPacManager] set upstream proxy if needded: {}, event: {}'.format(address, event))
+            LazyLog.debug('[UpstreamPacManager] set upstream proxy if needded: {}, event: {}', address, event)
 
 
 addons = [
@@ -4,6 +4,7 @@ from mitmproxy import http
 from mitmproxy import ctx
 from mitmproxy import addonmanager
 import re
+import LazyLog
 
 
 class UpstreamProxyManager:
@@ -57,9 +58,8 @@ class UpstreamProxyManager:
         # handle http cases
         for current_excluded_host_pattern in self.excluded_host_compiled_pattern:
             if current_excluded_host_pattern.match(flow.request.host) and flow.live.mode == HTTPMode.upstream:
-                ctx.log.debug(
-                    "UpstreamProxyManager - host:{} ({}) change mode to regular".format(
-                        flow.request.host, flow.request.scheme))
+                LazyLog.debug("UpstreamProxyManager - host:{} ({}) change mode to regular",
+                              flow.request.host, flow.request.scheme)
                 flow.live.mode = HTTPMode.regular
 
 
@@ -33,21 +33,21 @@ class WebSocketHarDumper:
             handshake. The flow object is guaranteed to have a non-None request
             attribute.
         """
-        ctx.log.debug(
+        util.log_debug(
             "[Ws handshake]:\n "
-            "flow id: [{}]\n server id: [{}]\n client id: [{}]\n request:{}\n reply: {}\n response: {} \n  \n".format(
-                flow.id,
-                flow.server_conn.id,
-                flow.client_conn.id,
-                flow.request,
-                flow.reply,
-                flow.response))
+            "flow id: [{}]\n server id: [{}]\n client id: [{}]\n request:{}\n reply: {}\n response: {} \n  \n",
+            flow.id,
+            flow.server_conn.id,
+            flow.client_conn.id,
+            flow.request,
+            flow.reply,
+            flow.response)
 
     def websocket_start(self, flow: websocket.WebSocketFlow):
         """
             A websocket connection has commenced.
         """
-        ctx.log.debug("[Ws start]: {}".format(flow.id))
+        util.log_debug("[Ws start]: {}", flow.id)
         entry = collections.OrderedDict()
         entry["_serverConnectionId"] = flow.server_conn.id
         entry["clientAddress"] = flow.client_conn.address
@@ -57,6 +57,7 @@ class WebSocketHarDumper:
         entry['time'] = util.format_datetime(flow.client_conn.timestamp_start)
         entry["clientProtocol"] = flow.client_protocol
         self.connections.append(entry)
+        self.harWriter.add_event("_webSocketEntries", entry, "connections")
 
     def websocket_message(self, flow: websocket.WebSocketFlow):
         """
@@ -66,13 +67,12 @@ class WebSocketHarDumper:
             messages, corresponding to the BINARY and TEXT frame types.
         """
         message = flow.messages[-1]
-        ctx.log.debug("[ws message] from {} to {}:\n[{}]".format("client" if message.from_client else "server",
-                                                                 "server" if message.from_client else "client",
-                                                                 message.content))
-        ctx.log.debug("[ws message]:\n flow id: [{}]\n server id: [{}]\n client id: [{}]\n".format(
-            flow.id,
-            flow.server_conn.id,
-            flow.client_conn.id))
+        util.log_debug("[ws message] from {} to {}:\n[{}]", "client" if message.from_client else "server",
+                       "server" if message.from_client else "client", message.content)
+        util.log_debug("[ws message]:\n flow id: [{}]\n server id: [{}]\n client id: [{}]\n",
+                       flow.id,
+                       flow.server_conn.id,
+                       flow.client_conn.id)
 
         entry = collections.OrderedDict()
         entry["_serverConnectionId"] = flow.server_conn.id
@@ -87,19 +87,20 @@ class WebSocketHarDumper:
         # message.timestamp is in integer (casted from float) so, we took the time.time()
         entry['startedDateTime'] = util.format_datetime(time.time())
         self.messages.append(entry)
+        self.harWriter.add_event("_webSocketEntries", entry, "messages")
 
     def websocket_end(self, flow: websocket.WebSocketFlow):
         """
             A websocket connection has ended.
         """
 
-        ctx.log.debug(
-            "[ws connection has been disconnected] from {} to {} flow.id: {}\n server id: {}\n client id: {}\n".format(
-                flow.client_conn.address,
-                flow.server_conn.address,
-                flow.id,
-                flow.server_conn.id,
-                flow.client_conn.id))
+        util.log_debug(
+            "[ws connection has been disconnected] from {} to {} flow.id: {}\n server id: {}\n client id: {}\n",
+            flow.client_conn.address,
+            flow.server_conn.address,
+            flow.id,
+            flow.server_conn.id,
+            flow.client_conn.id)
         entry = collections.OrderedDict()
         entry["_serverConnectionId"] = flow.server_conn.id
 
@@ -113,20 +114,22 @@ class WebSocketHarDumper:
 
         entry["startedDateTime"] = util.format_datetime(flow.client_conn.timestamp_end)
         self.disconnections.append(entry)
+        self.harWriter.add_event("_webSocketEntries", entry, "disconnections")
 
     def websocket_error(self, flow: websocket.WebSocketFlow):
         """
             A websocket connection has ended.
         """
-        ctx.log.debug("[ws connection has received an error]: {}\n".format(flow.error.msg))
-        ctx.log.debug("[ws error]:\n flow id: [{}]\n server id: [{}]\n client id: [{}]\n".format(flow.id,
-                                                                                                 flow.server_conn.id,
-                                                                                                 flow.client_conn.id))
+        util.log_debug("[ws connection has received an error]: {}\n", flow.error.msg)
+        util.log_debug("[ws error]:\n flow id: [{}]\n server id: [{}]\n client id: [{}]\n", flow.id,
+                       flow.server_conn.id,
+                       flow.client_conn.id)
         entry = collections.OrderedDict()
         entry["_serverConnectionId"] = flow.server_conn.id
         entry["message"] = flow.error.msg
         entry["startedDateTime"] = util.format_datetime(flow.error.timestamp)
         self.errors.append(entry)
+        self.harWriter.add_event("_webSocketEntries", entry, "errors")
 
     def final(self):
         ctx.log.debug("Starting pushing websocket entries to har")
@@ -0,0 +1,77 @@
+"""
+CPU time per flow of the whole addon chain (NetworkDumper and the addons it loads), the hooks of a recorded HTTP flow
+and a WebSocket message triggered the way mitmproxy does, at a given log level. Needs mitmproxy.
+
+The logging cost depends on the level (debug messages are formatted and logged only at the debug level), run it once
+per level. --addon-scripts measures another checkout of the addon scripts, e.g. a git worktree of an older commit:
+    python addon_chain_bench.py [--level info] [--flows 1000] [--repeat 5] [--addon-scripts DIR]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from mitmproxy.test import taddons
+from mitmproxy.test import tflow
+
+LOG_LEVELS = ("error", "warn", "info", "debug")
+VERBOSITY_OPTION = "termlog_verbosity"
+BODY = ("<html>" + "hello world, some text é " * 400 + "</html>").encode()
+FLOW_HOOKS = ("requestheaders", "request", "responseheaders", "response")
+
+
+def create_flow():
+    flow = tflow.tflow(resp=True)
+    flow.response.headers["content-type"] = "text/html; charset=utf-8"
+    flow.response.content = BODY
+    return flow
+
+
+def run_flows(context, websocket_flow, flows_count: int) -> float:
+    flows = [create_flow() for _ in range(flows_count)]
+    start_time = time.process_time()
+    for flow in flows:
+        for hook in FLOW_HOOKS:
+            context.master.addons.trigger(hook, flow)
+        context.master.addons.trigger("websocket_message", websocket_flow)
+    return time.process_time() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--level", default="info", choices=LOG_LEVELS, help="termlog_verbosity of the run")
+    parser.add_argument("--flows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5, help="runs of --flows flows, the best one is reported")
+    parser.add_argument("--addon-scripts", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="directory of the addon scripts measured")
+    arguments = parser.parse_args()
+
+    # The addon scripts import each other as top level modules
+    sys.path.insert(0, os.path.abspath(arguments.addon_scripts))
+    with taddons.context() as context, tempfile.TemporaryDirectory() as directory:
+        # Declared by the termlog addon in mitmdump, the test context has no such addon
+        if VERBOSITY_OPTION not in context.options:
+            context.options.add_option(VERBOSITY_OPTION, str, "info", "Log verbosity.")
+        context.options.update(**{VERBOSITY_OPTION: arguments.level})
+        import NetworkDumper
+        network_dumper = NetworkDumper.NetworkDumper()
+        network_dumper.init_addons()
+        for addon in network_dumper.ScriptAddons + [network_dumper]:
+            context.master.addons.add(addon)
+        context.configure(network_dumper.har_writer, har_dump_file_path=os.path.join(directory, "bench.har"))
+        for addon in network_dumper.ScriptAddons:
+            if hasattr(addon, "running"):
+                addon.running()
+
+        websocket_flow = tflow.twebsocketflow()
+        # Warm up (imports, caches, first allocations)
+        run_flows(context, websocket_flow, min(arguments.flows, 200))
+        best_time = min(run_flows(context, websocket_flow, arguments.flows) for _ in range(arguments.repeat))
+        print("%s level: %.1f us CPU per flow (%s flows, best of %s)" %
+              (arguments.level, best_time / arguments.flows * 1e6, arguments.flows, arguments.repeat))
+        network_dumper.done()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Decoding time of text bodies holding undecodable bytes, util.convert_to_utf_x against its original implementation
+(which decoded the whole body again after every bad byte). Needs mitmproxy (util imports it).
+
+UTF-8 pages with 0xe9 bytes spread through them, then a windows-1252 page taken for UTF-8 where every accented letter
+is undecodable (the original implementation only runs on a slice of it), the outputs are checked to be identical:
+    python convert_text_bench.py [--page-size-mb 1,5] [--bad-bytes 0,100,1000,5000]
+"""
+import argparse
+import os
+import sys
+import time
+
+# The original implementation is the oracle of the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+
+import text_corpus
+
+from mitmproxy.test import taddons
+
+DETECTED_UTF_8 = {"encoding": "utf-8", "confidence": 0.87}
+PAGE_LINE = "<p>Grüße aus Köln, naïve café</p>\n"
+CP1252_SENTENCE = "Grüße aus Köln, naïve café. "
+# Bytes of the windows-1252 page decoded by the original implementation
+CP1252_ORIGINAL_SIZE = 64 * 1024
+INVALID_BYTE = 0xe9
+
+
+def measure(convert, data: bytes):
+    start_time = time.perf_counter()
+    result = convert(data, DETECTED_UTF_8)
+    return time.perf_counter() - start_time, result
+
+
+def create_page(size: int, bad_bytes: int) -> bytes:
+    page = bytearray((PAGE_LINE * (size // len(PAGE_LINE) + 1)).encode()[:size])
+    for index in range(bad_bytes):
+        # Off the multibyte characters of the line
+        page[index * (size // bad_bytes) + 7] = INVALID_BYTE
+    return bytes(page)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size-mb", default="1,5", help="comma separated page sizes (MB)")
+    parser.add_argument("--bad-bytes", default="0,100,1000,5000", help="comma separated undecodable bytes per page")
+    arguments = parser.parse_args()
+
+    with taddons.context() as context:
+        # Declared by the termlog addon in mitmdump, the bodies are not logged at the info level
+        context.options.add_option("termlog_verbosity", str, "info", "Log verbosity.")
+        import util
+        for size in [int(value) << 20 for value in arguments.page_size_mb.split(",")]:
+            for bad_bytes in [int(value) for value in arguments.bad_bytes.split(",")]:
+                page = create_page(size, bad_bytes)
+                new_time, new_result = measure(util.convert_to_utf_x, page)
+                old_time, old_result = measure(text_corpus.old_convert_to_utf_x, page)
+                assert new_result == old_result, "output differs from the original implementation"
+                print("%2s MB UTF-8, %5s bad bytes: original %8.3f s, single pass %8.4f s" %
+                      (size >> 20, bad_bytes, old_time, new_time))
+
+        page = b"x" * 1024 + (CP1252_SENTENCE * (1 << 20)).encode("cp1252")[:1 << 20]
+        new_time, new_result = measure(util.convert_to_utf_x, page)
+        print("1 MB windows-1252 as UTF-8 (%s bad bytes): single pass %.4f s" %
+              (sum(byte > 127 for byte in page), new_time))
+        page = page[:CP1252_ORIGINAL_SIZE]
+        new_time, new_result = measure(util.convert_to_utf_x, page)
+        old_time, old_result = measure(text_corpus.old_convert_to_utf_x, page)
+        assert new_result == old_result, "output differs from the original implementation"
+        print("%s KB of it (%s bad bytes): original %.3f s, single pass %.5f s" %
+              (CP1252_ORIGINAL_SIZE >> 10, sum(byte > 127 for byte in page), old_time, new_time))
+
+
+if __name__ == "__main__":
+    main()
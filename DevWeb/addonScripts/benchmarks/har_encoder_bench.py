@@ -0,0 +1,71 @@
+"""
+HAR encoders (HarEncoder) against the original encoder, json.JSONEncoder(indent=2).iterencode of the whole HAR.
+
+Every encoder writes the same synthetic HAR to a file, the wall time and the file size are reported and the
+indented output is checked to be byte identical to the original one:
+    python har_encoder_bench.py [--entries 100000] [--directory DIR] [--verify]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import synthetic_har
+
+import HarEncoder
+
+
+def write_original(har: dict, file_path: str):
+    with open(file_path, mode="w", encoding="utf8") as har_file:
+        json_encoder = json.JSONEncoder(indent=2, default=str, ensure_ascii=False)
+        for chunk in json_encoder.iterencode(har):
+            har_file.write(chunk)
+
+
+def write_encoded(json_style: str, log: dict, file_path: str):
+    har_encoder = HarEncoder.create_har_encoder(json_style)
+    header = {key: value for key, value in log.items() if key in HarEncoder.HAR_HEADER_KEYS}
+    trailer = {key: value for key, value in log.items()
+               if key != "entries" and key not in HarEncoder.HAR_HEADER_KEYS}
+    with open(file_path, mode="wb") as har_file:
+        har_file.write(har_encoder.encode_header(header))
+        for index, entry in enumerate(log["entries"]):
+            har_file.write(har_encoder.encode_entry(entry, index))
+        har_file.write(har_encoder.encode_trailer(len(log["entries"]), trailer))
+
+
+def measure(write, file_path: str) -> float:
+    start_time = time.perf_counter()
+    write(file_path)
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--directory", help="where the HAR files are written (a temporary directory by default)")
+    parser.add_argument("--verify", action="store_true",
+                        help="also check that the compact layouts parse to the original HAR (loads both in memory)")
+    arguments = parser.parse_args()
+
+    log = synthetic_har.create_log([synthetic_har.create_entry(index) for index in range(arguments.entries)])
+    with tempfile.TemporaryDirectory(dir=arguments.directory) as directory:
+        original_path = os.path.join(directory, "original.har")
+        elapsed = measure(lambda file_path: write_original({"log": log}, file_path), original_path)
+        print("%-40s %8.2f s %8.1f MB" % ("json.JSONEncoder(indent=2) iterencode", elapsed,
+                                          os.path.getsize(original_path) / 1e6))
+        for json_style in HarEncoder.JSON_STYLES:
+            file_path = os.path.join(directory, json_style + ".har")
+            elapsed = measure(lambda path: write_encoded(json_style, log, path), file_path)
+            print("%-40s %8.2f s %8.1f MB" % (json_style, elapsed, os.path.getsize(file_path) / 1e6))
+            if json_style == HarEncoder.JSON_STYLE_INDENTED:
+                assert synthetic_har.files_equal(file_path, original_path), "indented output differs from the original"
+            elif arguments.verify:
+                with open(file_path, mode="rb") as har_file, open(original_path, mode="rb") as original_file:
+                    assert json.load(har_file) == json.load(original_file), \
+                        "%s output differs from the original" % json_style
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Memory and build rate of the buffered HTTP entries, HarEntry records against the OrderedDict trees
+HttpHarDumper built before them.
+
+The bodies are shared by all the entries, so the memory per entry is the memory of the entry structure:
+    python har_entry_bench.py [--entries 50000] [--repeat 3]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import synthetic_har
+
+
+def measure_memory(create, entries_count: int) -> float:
+    tracemalloc.start()
+    entries = [create(index) for index in range(entries_count)]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del entries
+    return memory / entries_count
+
+
+def measure_rate(create, entries_count: int, repeat: int) -> float:
+    best_time = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        entries = [create(index) for index in range(entries_count)]
+        elapsed = time.perf_counter() - start_time
+        del entries
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+    return entries_count / best_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3, help="build rate runs, the best one is reported")
+    arguments = parser.parse_args()
+
+    # Both records produce the same HAR entry
+    assert json.dumps(synthetic_har.create_har_entry(1).to_har()) == json.dumps(synthetic_har.create_entry(1))
+    for name, create in (("OrderedDict tree", synthetic_har.create_entry),
+                         ("HarEntry", synthetic_har.create_har_entry)):
+        print("%-20s %8.0f bytes/entry %10.0f entries/s" % (name, measure_memory(create, arguments.entries),
+                                                            measure_rate(create, arguments.entries,
+                                                                         arguments.repeat)))
+
+
+if __name__ == "__main__":
+    main()
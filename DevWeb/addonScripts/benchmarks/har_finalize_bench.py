@@ -0,0 +1,63 @@
+"""
+Wall time of writing a buffered HAR on final (HarWriter.write_file_to_disk), in the recorder process and with
+har_finalize_workers worker processes. Needs mitmproxy (the HarWriter addon runs in a test context).
+
+Every run writes the same HarEntry records, the outputs are checked to be byte identical to the serial one:
+    python har_finalize_bench.py [--entries 500000] [--workers 0,2,4] [--json-style indented] [--directory DIR]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import synthetic_har
+
+from mitmproxy.test import taddons
+
+import HarEncoder
+import HarWriter
+
+
+def write_har(entries: list, file_path: str, workers: int, json_style: str) -> float:
+    with taddons.context() as context:
+        har_writer = HarWriter.HarWriter()
+        context.master.addons.add(har_writer)
+        context.configure(har_writer, har_dump_file_path=file_path, har_finalize_workers=workers,
+                          har_dump_json_style=json_style)
+        har_writer.running()
+        for entry in entries:
+            har_writer.add_single_entry(entry)
+        start_time = time.perf_counter()
+        har_writer.final()
+        return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=500000)
+    parser.add_argument("--workers", default="0,%s" % os.cpu_count(),
+                        help="comma separated har_finalize_workers values, 0 is the recorder process")
+    parser.add_argument("--json-style", default=HarEncoder.JSON_STYLE_INDENTED, choices=HarEncoder.JSON_STYLES)
+    parser.add_argument("--directory", help="where the HAR files are written (a temporary directory by default)")
+    arguments = parser.parse_args()
+
+    print("%s entries, %s style, %s CPUs, parallel encoding %s" %
+          (arguments.entries, arguments.json_style, os.cpu_count(),
+           "available" if HarWriter.get_finalize_context() is not None else "not available (frozen or spawn only)"))
+    entries = [synthetic_har.create_har_entry(index) for index in range(arguments.entries)]
+    with tempfile.TemporaryDirectory(dir=arguments.directory) as directory:
+        serial_path = None
+        for workers in [int(value) for value in arguments.workers.split(",")]:
+            file_path = os.path.join(directory, "workers_%s.har" % workers)
+            elapsed = write_har(entries, file_path, workers, arguments.json_style)
+            print("%2s workers %8.2f s %10.0f entries/s %8.1f MB" % (workers, elapsed, len(entries) / elapsed,
+                                                                     os.path.getsize(file_path) / 1e6))
+            if serial_path is None:
+                serial_path = file_path
+            else:
+                assert synthetic_har.files_equal(file_path, serial_path), \
+                    "%s workers output differs from the first run" % workers
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Synthetic HAR entries and helpers shared by the benchmarks, shaped like the entries HttpHarDumper records.
+
+The benchmarks run from any directory with a plain python interpreter:
+    python DevWeb/addonScripts/benchmarks/<benchmark>.py [options]
+"""
+import collections
+import os
+import sys
+
+# The addon scripts import each other as top level modules
+ADDON_SCRIPTS_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ADDON_SCRIPTS_PATH not in sys.path:
+    sys.path.insert(0, ADDON_SCRIPTS_PATH)
+
+import HarEntry
+
+HEADERS = tuple(("X-Header-%s" % index, "v" * 30) for index in range(10))
+BODY_TEXT = '<p>café "quoted"</p>' * 130
+TIMINGS = (1, 2, 3, -1, -1)
+
+
+def create_entry(index: int, body_text: str = BODY_TEXT) -> collections.OrderedDict:
+    """
+    The entry as a tree of OrderedDict objects, the way HttpHarDumper.parse_response built it before HarEntry
+    """
+    entry = collections.OrderedDict()
+    entry["startedDateTime"] = "2022-01-01T00:00:00.000000+00:00"
+    entry["time"] = 6
+    entry["_serverConnectionId"] = "connection-%s" % index
+    request = entry["request"] = collections.OrderedDict()
+    request["method"] = "GET"
+    request["url"] = "http://example.com/path/%s?q=1" % index
+    request["httpVersion"] = "HTTP/1.1"
+    request["headers"] = [{"name": name, "value": value} for name, value in HEADERS]
+    request["queryString"] = [{"name": "q", "value": "1"}]
+    request["cookies"] = []
+    request["headersSize"] = 400
+    request["bodySize"] = 0
+    response = entry["response"] = collections.OrderedDict()
+    response["status"] = 200
+    response["statusText"] = "OK"
+    response["httpVersion"] = "HTTP/1.1"
+    response["headers"] = [{"name": name, "value": value} for name, value in HEADERS]
+    response["cookies"] = []
+    response["redirectURL"] = ""
+    response["headersSize"] = 400
+    response["bodySize"] = len(body_text)
+    content = response["content"] = collections.OrderedDict()
+    content["size"] = len(body_text)
+    content["mimeType"] = "text/html"
+    content["compression"] = 0
+    content["text"] = body_text
+    entry["cache"] = {}
+    entry["timings"] = dict(zip(HarEntry.HarEntry.TIMINGS_KEYS, TIMINGS))
+    entry["serverIPAddress"] = "192.0.2.1"
+    return entry
+
+
+def create_har_entry(index: int, body_text: str = BODY_TEXT) -> HarEntry.HarEntry:
+    """
+    The same entry as a HarEntry record, HarEntry.to_har returns create_entry(index)
+    """
+    entry = HarEntry.HarEntry()
+    entry.started_date_time = "2022-01-01T00:00:00.000000+00:00"
+    entry.time = 6
+    entry.server_connection_id = "connection-%s" % index
+    entry.request_method = "GET"
+    entry.request_url = "http://example.com/path/%s?q=1" % index
+    entry.request_http_version = "HTTP/1.1"
+    # Every flow has its own header pairs, as when they are copied out of the mitmproxy message
+    entry.request_headers = tuple((name, value) for name, value in HEADERS)
+    entry.request_query_string = (("q", "1"),)
+    entry.request_cookies = []
+    entry.request_headers_size = 400
+    entry.request_body_size = 0
+    entry.response_status = 200
+    entry.response_status_text = "OK"
+    entry.response_http_version = "HTTP/1.1"
+    entry.response_headers = tuple((name, value) for name, value in HEADERS)
+    entry.response_cookies = []
+    entry.response_redirect_url = ""
+    entry.response_headers_size = 400
+    entry.response_body_size = len(body_text)
+    entry.content_size = len(body_text)
+    entry.content_mime_type = "text/html"
+    entry.content_compression = 0
+    entry.content_text = body_text
+    entry.timings = tuple(timing for timing in TIMINGS)
+    entry.server_ip_address = "192.0.2.1"
+    return entry
+
+
+def create_log(entries: list) -> collections.OrderedDict:
+    """
+    The 'log' object of a HAR holding the entries, with the header and trailing sections HarWriter writes
+    """
+    log = collections.OrderedDict()
+    log["version"] = "1.2"
+    log["creator"] = {"name": "DevWeb", "version": "benchmark"}
+    log["pages"] = []
+    log["entries"] = entries
+    log["_transactions"] = [{"name": "transaction", "type": "start",
+                             "startedDateTime": "2022-01-01T00:00:00.000000+00:00"}]
+    log["_settings"] = collections.OrderedDict([("_proxy", {"mode": "regular"})])
+    return log
+
+
+def files_equal(first_path: str, second_path: str) -> bool:
+    with open(first_path, mode="rb") as first_file, open(second_path, mode="rb") as second_file:
+        while True:
+            first_chunk, second_chunk = first_file.read(1 << 20), second_file.read(1 << 20)
+            if first_chunk != second_chunk:
+                return False
+            if not first_chunk:
+                return True
@@ -0,0 +1,99 @@
+"""
+Tests of util.convert_to_utf_x against its original implementation (text_corpus), they need mitmproxy:
+    python -m unittest discover DevWeb/addonScripts/tests
+"""
+import collections
+import unittest
+
+import text_corpus
+
+try:
+    from mitmproxy.test import taddons
+except ImportError:
+    taddons = None
+
+BODIES_PER_CHARSET = 400
+UTF_16_CHARSETS = ("utf-16", "utf-16le")
+
+util = None
+test_context = None
+
+
+def setUpModule():
+    global util, test_context
+    if taddons is None:
+        raise unittest.SkipTest("util imports mitmproxy, which is not installed")
+    # util reads the options when imported
+    test_context = taddons.context()
+    test_context.__enter__()
+    # Declared by the termlog addon in mitmdump, the bodies are not logged at the info level
+    test_context.options.add_option("termlog_verbosity", str, "info", "Log verbosity.")
+    import util
+
+
+def tearDownModule():
+    test_context.__exit__(None, None, None)
+
+
+class ConvertToUtfXTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.results = [(charset, data) + text_corpus.compare(util.convert_to_utf_x, data, detected_encoding)
+                       for charset, data, detected_encoding in text_corpus.generate_corpus(BODIES_PER_CHARSET)]
+        cls.outcomes = collections.Counter(result[2] for result in cls.results)
+
+    def get_results(self, outcome: str) -> list:
+        return [result for result in self.results if result[2] == outcome]
+
+    def test_corpus_outcomes(self):
+        # The counts of the seeded corpus, a change means the decoding changed
+        self.assertEqual(self.outcomes, {text_corpus.OUTCOME_IDENTICAL: 5029,
+                                         text_corpus.OUTCOME_OLD_CRASHED: 1723,
+                                         text_corpus.OUTCOME_DIFFERENT: 306,
+                                         text_corpus.OUTCOME_BOTH_RAISE: 142})
+
+    def test_old_crash_now_decodes(self):
+        for charset, data, _, old_error, new_result in self.get_results(text_corpus.OUTCOME_OLD_CRASHED):
+            # chr(byte) had no encoding in the charset
+            self.assertIsInstance(old_error, UnicodeEncodeError, charset)
+            self.assertIsInstance(new_result, str, charset)
+
+    def test_both_raise_only_on_the_ascii_fast_path(self):
+        for charset, data, _, old_error, new_error in self.get_results(text_corpus.OUTCOME_BOTH_RAISE):
+            self.assertEqual(charset, "ascii")
+            self.assertEqual(type(old_error), type(new_error))
+
+    def test_known_differences(self):
+        for charset, data, _, old_result, new_result in self.get_results(text_corpus.OUTCOME_DIFFERENT):
+            if charset == "EUC-JP":
+                # The old round trip turned the 0xa5 byte into '\' (its EUC-JP encoding is 0x5c), not U+00A5
+                self.assertEqual(new_result.replace("¥", "\\"), old_result)
+            elif charset in UTF_16_CHARSETS:
+                # chr(byte).encode("utf-16") inserted a BOM mid-text, or a patched odd byte shifted the code units
+                # after it: both decode the same up to the first undecodable byte
+                if old_result.replace("﻿", "") != new_result:
+                    try:
+                        data.decode(charset)
+                    except UnicodeDecodeError as error:
+                        valid_text = data[:error.start].decode(charset)
+                    self.assertTrue(old_result.startswith(valid_text) and new_result.startswith(valid_text))
+            else:
+                self.fail("%s output differs from the original implementation: %r" % (charset, data))
+
+    def test_repaired_bytes_read_as_latin1(self):
+        self.assertEqual(util.convert_to_utf_x("café ".encode("cp1252") * 2, {"encoding": "utf-8", "confidence": 0.5}),
+                         "café café ")
+        # 0x81 has no character in windows-1252, the original implementation crashed on it
+        self.assertEqual(util.convert_to_utf_x(b"a\x81b", {"encoding": "windows-1252", "confidence": 0.8}), "a\x81b")
+        with self.assertRaises(UnicodeEncodeError):
+            text_corpus.old_convert_to_utf_x(b"a\x81b", {"encoding": "windows-1252", "confidence": 0.8})
+
+    def test_ascii_fast_path(self):
+        self.assertEqual(util.convert_to_utf_x(b"plain", {"encoding": "ascii", "confidence": 1.0}), "plain")
+        with self.assertRaises(UnicodeDecodeError):
+            util.convert_to_utf_x(b"caf\xe9", {"encoding": "ascii", "confidence": 1.0})
+        self.assertEqual(util.convert_to_utf_x(b"caf\xe9", {"encoding": "ascii", "confidence": 0.5}), "café")
+
+
+if __name__ == "__main__":
+    unittest.main()
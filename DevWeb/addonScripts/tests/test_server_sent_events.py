@@ -0,0 +1,119 @@
+"""
+Tests of the event stream parser and collector (ServerSentEvents), they need no mitmproxy:
+    python -m unittest discover DevWeb/addonScripts/tests
+"""
+import os
+import sys
+import unittest
+import zlib
+
+# The addon scripts import each other as top level modules
+ADDON_SCRIPTS_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ADDON_SCRIPTS_PATH not in sys.path:
+    sys.path.insert(0, ADDON_SCRIPTS_PATH)
+
+import ServerSentEvents
+
+
+def parse(*chunks) -> list:
+    parser = ServerSentEvents.SseParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events + parser.flush()
+
+
+def capture(collector: ServerSentEvents.SseCollector, chunks, content_encoding: str = ""):
+    stream = ServerSentEvents.SseStream("connection", "http://example.com/events", "2022-01-01T00:00:00.000000Z")
+    passed_chunks = list(collector.capture_chunks(stream, content_encoding, iter(chunks)))
+    return stream, passed_chunks
+
+
+class SseParserTest(unittest.TestCase):
+    def test_fields(self):
+        self.assertEqual(parse(b"id: 7\nevent: update\nretry: 3000\ndata: a\ndata:b\n\n"),
+                         [("7", "update", "a\nb", 3000)])
+
+    def test_last_event_id_is_kept(self):
+        self.assertEqual(parse(b"id: 1\ndata: a\n\ndata: b\n\n"), [("1", "message", "a", None),
+                                                                  ("1", "message", "b", None)])
+
+    def test_line_endings(self):
+        expected = [("", "message", "a", None), ("", "message", "b", None)]
+        self.assertEqual(parse(b"data: a\r\n\r\ndata: b\r\n\r\n"), expected)
+        self.assertEqual(parse(b"data: a\r\rdata: b\r\r"), expected)
+        self.assertEqual(parse(b"data: a\n\ndata: b\n\n"), expected)
+
+    def test_crlf_split_between_chunks(self):
+        # The CR ending a chunk must not be taken for a line end followed by an empty line
+        self.assertEqual(parse(b"data: a\r", b"\ndata: b\r", b"\n\r", b"\n"), [("", "message", "a\nb", None)])
+
+    def test_chunks_split_anywhere(self):
+        stream = b"event: tick\r\ndata: one\r\n\r\n: keep-alive\r\ndata: two\r\n\r\n"
+        expected = parse(stream)
+        for split in range(1, len(stream)):
+            self.assertEqual(parse(stream[:split], stream[split:]), expected, "split at %s" % split)
+
+    def test_held_cr_at_stream_end(self):
+        self.assertEqual(parse(b"data: z\r\r"), [("", "message", "z", None)])
+        self.assertEqual(parse(b"data: z\r", b"\r"), [("", "message", "z", None)])
+
+    def test_unterminated_event_is_discarded(self):
+        self.assertEqual(parse(b"data: a\n\ndata: b\n"), [("", "message", "a", None)])
+
+    def test_comments(self):
+        self.assertEqual(parse(b": keep-alive\n\n:\ndata: a\n: between\n\n"), [("", "message", "a", None)])
+
+    def test_event_without_data_is_not_dispatched(self):
+        self.assertEqual(parse(b"event: empty\n\ndata: a\n\n"), [("", "message", "a", None)])
+
+    def test_max_event_size_truncates_the_data(self):
+        size = ServerSentEvents.MAX_EVENT_SIZE
+        events = parse(b"data: " + b"a" * (size - 10) + b"\ndata: " + b"b" * 100 + b"\ndata: c\n\n")
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0][2], "a" * (size - 10) + "\n" + "b" * 10)
+
+    def test_max_event_size_truncates_a_line_that_never_ends(self):
+        parser = ServerSentEvents.SseParser()
+        for _ in range(3):
+            parser.feed(b"data: " + b"a" * ServerSentEvents.MAX_EVENT_SIZE)
+        self.assertEqual(len(parser.buffer), ServerSentEvents.MAX_EVENT_SIZE)
+        # The stream goes on after the line
+        self.assertEqual(parser.feed(b"\n\ndata: b\n\n")[1], ("", "message", "b", None))
+
+
+class SseCollectorTest(unittest.TestCase):
+    def test_chunks_pass_unchanged(self):
+        collector = ServerSentEvents.SseCollector(10)
+        chunks = [b"data: a\r", b"\n\r\n", b"data: z\r\r"]
+        stream, passed_chunks = capture(collector, chunks)
+        self.assertEqual(passed_chunks, chunks)
+        self.assertEqual([event for _, event, _ in collector.pending_events],
+                         [("", "message", "a", None), ("", "message", "z", None)])
+        self.assertTrue(stream.closed)
+
+    def test_event_cap(self):
+        collector = ServerSentEvents.SseCollector(3)
+        first_stream, _ = capture(collector, [b"data: %d\n\n" % index for index in range(2)])
+        second_stream, _ = capture(collector, [b"data: 1\n\ndata: 2\n\n", b"data: 3\n\n"])
+        self.assertEqual(len(collector.pending_events), 3)
+        self.assertEqual((first_stream.events_counter, first_stream.dropped_counter), (2, 0))
+        self.assertEqual((second_stream.events_counter, second_stream.dropped_counter), (3, 2))
+
+    def test_compressed_stream(self):
+        compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+        compressed = compressor.compress(b"data: a\n\ndata: b\n\n") + compressor.flush()
+        collector = ServerSentEvents.SseCollector(10)
+        capture(collector, [compressed[:5], compressed[5:]], "gzip")
+        self.assertEqual([event[2] for _, event, _ in collector.pending_events], ["a", "b"])
+
+    def test_undecodable_stream_goes_through(self):
+        collector = ServerSentEvents.SseCollector(10)
+        stream, passed_chunks = capture(collector, [b"not gzip", b"data: a\n\n"], "gzip")
+        self.assertEqual(passed_chunks, [b"not gzip", b"data: a\n\n"])
+        self.assertEqual(len(collector.pending_events), 0)
+        self.assertTrue(stream.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+Corpus of damaged text bodies and the original implementation of util.convert_to_utf_x, the oracle the single pass
+decoding is checked against (test_convert_to_utf_x) and measured against (benchmarks/convert_text_bench.py).
+
+The bodies are samples of many charsets, truncated at a random point and with random bytes overwritten, so they hold
+the undecodable bytes (and truncated multibyte sequences) the charset detection lets through. Run it to compare the
+two implementations on the whole corpus (needs mitmproxy, util imports it):
+    python text_corpus.py [--bodies 400] [--seed 25]
+"""
+import argparse
+import collections
+import os
+import random
+import re
+import sys
+
+# The addon scripts import each other as top level modules
+ADDON_SCRIPTS_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ADDON_SCRIPTS_PATH not in sys.path:
+    sys.path.insert(0, ADDON_SCRIPTS_PATH)
+
+SAMPLE_TEXTS = collections.OrderedDict((
+    ("utf-8", "Grüße, naïve café — 日本語テキスト 😀 Ελληνικά русский "),
+    ("windows-1252", "Grüße naïve café “quoted” – €100 "),
+    ("ISO-8859-1", "Grüße naïve café ñ ¿qué? "),
+    ("ISO-8859-7", "Ελληνικά κείμενο "),
+    ("windows-1251", "русский текст пример "),
+    ("KOI8-R", "русский текст пример "),
+    ("SHIFT_JIS", "日本語テキストのサンプル "),
+    ("EUC-JP", "日本語テキストのサンプル "),
+    ("GB2312", "中文文本示例 "),
+    ("Big5", "中文文本範例 "),
+    ("EUC-KR", "한국어 텍스트 "),
+    ("TIS-620", "ภาษาไทย "),
+    ("windows-1255", "עברית טקסט "),
+    ("MacCyrillic", "русский текст "),
+    ("IBM866", "русский текст "),
+    ("ascii", "plain ascii text "),
+    ("utf-16", "utf sixteen text é "),
+    ("utf-16le", "utf sixteen text é "),
+))
+SAMPLE_REPEAT = 30
+# Overwritten bytes per body, drawn from this list
+DAMAGE_COUNTS = (0, 1, 1, 2, 3, 8, 30)
+
+OUTCOME_IDENTICAL = "identical"
+OUTCOME_DIFFERENT = "different"
+OUTCOME_OLD_CRASHED = "old crashed, new decodes"
+OUTCOME_BOTH_RAISE = "both raise"
+
+INVALID_BYTE_PATTERN = re.compile("in position (\\d+)(?:-(\\d+):|:)")
+
+
+def old_convert_to_utf_x(data: bytes, detected_encoding: dict) -> str:
+    """
+    util.convert_to_utf_x as it was: decodes, patches the bytes named by the UnicodeDecodeError with
+    chr(byte).encode(charset) and decodes the whole body again, until it decodes
+    """
+    if detected_encoding['confidence'] > 0.9 and detected_encoding['encoding'] == 'ascii':
+        return data.decode('ascii')
+    charset = detected_encoding['encoding']
+    data = bytearray(data)
+    while True:
+        try:
+            return data.decode(charset, 'strict')
+        except UnicodeDecodeError as decode_error:
+            locations = INVALID_BYTE_PATTERN.findall(str(decode_error))
+            if len(locations) > 0:
+                indexes = [int(item) for item in filter(lambda text: text, locations[0])]
+                indexes.reverse()
+                for index in indexes:
+                    invalid_byte = data[index]
+                    data[index:index + 1] = chr(invalid_byte).encode(charset)
+                continue
+            break
+    return data.decode('utf8', 'backslashreplace')
+
+
+def generate_corpus(bodies_per_charset: int, seed: int = 25):
+    """
+    Yields (charset, body, detected encoding) tuples, the same ones for the same seed
+    """
+    generator = random.Random(seed)
+    for charset, text in SAMPLE_TEXTS.items():
+        encoded_text = (text * SAMPLE_REPEAT).encode(charset)
+        for _ in range(bodies_per_charset):
+            body = bytearray(encoded_text[:generator.randrange(1, len(encoded_text) + 1)])
+            for _ in range(generator.choice(DAMAGE_COUNTS)):
+                body[generator.randrange(len(body))] = generator.randrange(256)
+            yield charset, bytes(body), {"encoding": charset, "confidence": generator.choice([0.5, 0.99])}
+
+
+def compare(convert, data: bytes, detected_encoding: dict):
+    """
+    Runs both implementations on a body
+    :return: the outcome and the old and new results (the exceptions they raised)
+    """
+    try:
+        old_result = old_convert_to_utf_x(data, detected_encoding)
+    except (UnicodeDecodeError, UnicodeEncodeError) as error:
+        old_result = error
+    try:
+        new_result = convert(data, detected_encoding)
+    except UnicodeDecodeError as error:
+        new_result = error
+    if isinstance(old_result, Exception):
+        if isinstance(new_result, Exception):
+            return OUTCOME_BOTH_RAISE, old_result, new_result
+        return OUTCOME_OLD_CRASHED, old_result, new_result
+    return OUTCOME_IDENTICAL if old_result == new_result else OUTCOME_DIFFERENT, old_result, new_result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bodies", type=int, default=400, help="bodies per charset")
+    parser.add_argument("--seed", type=int, default=25)
+    arguments = parser.parse_args()
+
+    from mitmproxy.test import taddons
+    with taddons.context() as context:
+        # Declared by the termlog addon in mitmdump, the bodies are not logged at the info level
+        context.options.add_option("termlog_verbosity", str, "info", "Log verbosity.")
+        import util
+        outcomes = collections.Counter()
+        differences = collections.Counter()
+        for charset, data, detected_encoding in generate_corpus(arguments.bodies, arguments.seed):
+            outcome, _, _ = compare(util.convert_to_utf_x, data, detected_encoding)
+            outcomes[outcome] += 1
+            if outcome == OUTCOME_DIFFERENT:
+                differences[charset] += 1
+    for outcome, count in outcomes.most_common():
+        print("%-30s %6s" % (outcome, count))
+    print("different output by charset: %s" % dict(differences))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,31 @@
-import re
 import sys
 import base64
+import codecs
 import chardet
+import FlowRouter
+import LazyLog
 from datetime import datetime
 from mitmproxy import ctx
 from mitmproxy.net.http import Message
+from mitmproxy.net.http import encoding
 
-# The pattern will handle the next two messages
-# "'utf-X' codec can't decode byte 0xaa in position 4: invalid start byte"
-# "'utf-X' codec can't decode bytes in position 313-314: invalid continuation byte"
-invalid_byte_pattern = re.compile("in position (\\d+)(?:-(\\d+):|:)")
+# Codec error handler of convert_to_utf_x, the bytes the detected charset cannot decode are read as Latin-1
+LATIN1_REPAIR_ERRORS = "devweb_latin1_repair"
 
 # Mostly Based on binaryornot (ver 0.4.4) 3rt party https://github.com/audreyr/binaryornot
 _control_chars = b'\n\r\t\f\b'
 _printable_ascii = _control_chars + bytes(range(32, 127))
 _printable_high_ascii = bytes(range(127, 256))
 
-HOSTS_TO_IGNORE = {re.compile(x, re.IGNORECASE) for x in ctx.options.ignore_hosts} if ctx.options.ignore_hosts else None
+FLOW_ROUTER = FlowRouter.FlowRouter(ctx.options.ignore_hosts)
+
+# Logging goes through the level gated LazyLog facade, the text is formatted with the arguments only when logged
+log = LazyLog.log
+log_debug = LazyLog.debug
+log_warning = LazyLog.warn
+log_error = LazyLog.error
+report_pending_log_messages = LazyLog.report_pending_log_messages
+
 
 def detect_bytes(origin_data: bytes, length: int = 1024) -> dict:
     if not origin_data:
@@ -27,21 +36,21 @@ def detect_bytes(origin_data: bytes, length: int = 1024) -> dict:
     # Binary if control chars are > 30% of the string
     low_chars = data.translate(None, _printable_ascii)
     nontext_ratio1 = float(len(low_chars)) / float(len(data))
-    ctx.log.debug('nontext_ratio1: '.format(nontext_ratio1))
+    log_debug('nontext_ratio1: {}', nontext_ratio1)
 
     high_chars = data.translate(None, _printable_high_ascii)
     nontext_ratio2 = float(len(high_chars)) / float(len(data))
-    ctx.log.debug('nontext_ratio2: {}'.format(nontext_ratio2))
+    log_debug('nontext_ratio2: {}', nontext_ratio2)
 
     is_likely_binary = (
             (nontext_ratio1 > 0.3 and nontext_ratio2 < 0.05) or
             (nontext_ratio1 > 0.8 and nontext_ratio2 > 0.8)
     )
-    ctx.log.debug('is_likely_binary: {}'.format(is_likely_binary))
+    log_debug('is_likely_binary: {}', is_likely_binary)
 
     # then check for binary for possible encoding detection with chardet
     detected_encoding = chardet.detect(data)
-    ctx.log.debug('detected_encoding: {}'.format(detected_encoding))
+    log_debug('detected_encoding: {}', detected_encoding)
 
     # finally use all the check to decide binary or text
     decodable_as_unicode = False
@@ -49,14 +58,14 @@ def detect_bytes(origin_data: bytes, length: int = 1024) -> dict:
         try:
             data.decode(encoding=detected_encoding['encoding'])
             decodable_as_unicode = True
-            ctx.log.debug('success: decodable_as_unicode: {}'.format(decodable_as_unicode))
+            log_debug('success: decodable_as_unicode: {}', decodable_as_unicode)
         except LookupError:
-            ctx.log.debug('failure: LookupError trying to encode with {}'.format(detected_encoding['encoding']))
+            log_debug('failure: LookupError trying to encode with {}', detected_encoding['encoding'])
         except UnicodeDecodeError:
-            ctx.log.debug('failure: UnicodeDecodeError trying to encode with {}'.format(detected_encoding['encoding']))
+            log_debug('failure: UnicodeDecodeError trying to encode with {}', detected_encoding['encoding'])
 
     if not decodable_as_unicode and not is_likely_binary:
-        ctx.log.debug('failure: decodable_as_unicode: {}, fallback to utf8'.format(decodable_as_unicode))
+        log_debug('failure: decodable_as_unicode: {}, fallback to utf8', decodable_as_unicode)
         detected_encoding['encoding'] = "utf8"
 
     if is_likely_binary:
@@ -70,7 +79,7 @@ def detect_bytes(origin_data: bytes, length: int = 1024) -> dict:
         else:
             if b'\x00' in data or b'\xff' in data:
                 # Check for NULL bytes last
-                ctx.log.debug('has nulls:' + repr(b'\x00' in data))
+                log_debug('has nulls:{!r}', b'\x00' in data)
                 return {'is_binary': True}
         return {'is_binary': False, 'detected_encoding': detected_encoding}
 
@@ -78,6 +87,19 @@ def detect_bytes(origin_data: bytes, length: int = 1024) -> dict:
 # End of binaryornot 3rt party https://github.com/audreyr/binaryornot
 
 
+def latin1_repair_errors(error: UnicodeError) -> tuple:
+    """
+    Codec error handler (see codecs.register_error) replacing the undecodable bytes by their Latin-1 characters
+    :return: the replacement and the position the decoding resumes from
+    """
+    if not isinstance(error, UnicodeDecodeError):
+        raise error
+    return error.object[error.start:error.end].decode('latin1'), error.end
+
+
+codecs.register_error(LATIN1_REPAIR_ERRORS, latin1_repair_errors)
+
+
 def convert_to_utf_x(data: bytes, detected_encoding: dict) -> str:
     """
     Will convert the bytes to text using the detected encoding
@@ -85,35 +107,12 @@ def convert_to_utf_x(data: bytes, detected_encoding: dict) -> str:
     :param detected_encoding: a dictionary with the keys 'confidence' and 'encoding'
     :return: string representation of bytes
     """
-    ctx.log.debug("detected encoding details are {} for data: {}".format(detected_encoding, str(data)))
+    log_debug("detected encoding details are {} for data: {}", detected_encoding, data)
     if detected_encoding['confidence'] > 0.9 and detected_encoding['encoding'] == 'ascii':
         return data.decode('ascii')
 
-    charset = detected_encoding['encoding']
-    data = bytearray(data)
-    while True:
-        try:
-            return data.decode(charset, 'strict')
-        except UnicodeDecodeError as decode_error:
-            decode_error_text = str(decode_error)
-            locations = invalid_byte_pattern.findall(decode_error_text)
-            if len(locations) > 0:
-                # Filter empty string
-                indexes = list(filter(lambda text: text, locations[0]))
-                # Convert numbers in type string to type integer
-                indexes = [int(item) for item in indexes]
-                # we change data byte array so it will better to change from the end
-                indexes.reverse()
-                for index in indexes:
-                    invalid_byte = data[index]
-                    # ctx.log.debug("replacing (invalid {} byte) {}".format(charset, str(hex(invalid_byte))))
-                    character_in_charset_representation = chr(invalid_byte).encode(charset)
-                    data[index:index + 1] = character_in_charset_representation
-                continue  # will go back to decoding
-
-            ctx.log.error("internal error ({} decoding): {}".format(charset, decode_error_text))
-            break
-    return data.decode('utf8', 'backslashreplace')
+    # A single pass, every undecodable byte becomes the character of the same code point (0xe9 -> 'é')
+    return data.decode(detected_encoding['encoding'], LATIN1_REPAIR_ERRORS)
 
 
 def get_content_as_string(content: bytes) -> dict:
@@ -132,14 +131,14 @@ def get_content_as_string(content: bytes) -> dict:
         }
     content_details = detect_bytes(content)
     if content_details['is_binary']:
-        ctx.log.debug('Content is binary, decoding as base64')
+        log_debug('Content is binary, decoding as base64')
         return {
             'is_binary': True,
             'detected_encoding': {'encoding': 'base64'},
             'content': base64.b64encode(content).decode()}
     else:
         detected_encoding = content_details['detected_encoding']
-        ctx.log.debug('Content is text, detected encoding details {}'.format(detected_encoding))
+        log_debug('Content is text, detected encoding details {}', detected_encoding)
         return {
             'is_binary': False,
             'detected_encoding': detected_encoding,
@@ -150,10 +149,40 @@ def get_content_safely(message: Message) -> bytes:
     try:
         return message.get_content(strict=True)
     except ValueError as value_error:
-        ctx.log.debug("Cannot decode content: {}, data will be presented as-is".format(value_error.__str__()))
+        log_debug("Cannot decode content: {}, data will be presented as-is", value_error)
         return message.raw_content
 
 
+def decode_content(raw_content: bytes, content_encoding: str) -> bytes:
+    """
+    Same as get_content_safely, on the raw content and Content-Encoding header copied out of a message
+    """
+    if raw_content is None:
+        return b""
+    if not content_encoding:
+        return raw_content
+    try:
+        content = encoding.decode(raw_content, content_encoding)
+        # A client may illegally specify a byte -> str encoding here (e.g. utf8)
+        if isinstance(content, str):
+            raise ValueError("Invalid Content-Encoding: {}".format(content_encoding))
+        return content
+    except ValueError as value_error:
+        log_debug("Cannot decode content: {}, data will be presented as-is", value_error)
+        return raw_content
+
+
+def get_headers_size(headers) -> int:
+    """
+    Returns the size in bytes of the header fields as sent ("name: value\\r\\n" each), computed from the raw fields
+    without building the header block.
+    """
+    fields = getattr(headers, "fields", None)
+    if fields is None:
+        return len(str(headers))
+    return sum(len(name) + len(value) for name, value in fields) + 4 * len(fields)
+
+
 def format_datetime(date):
     """
 
@@ -164,7 +193,7 @@ def format_datetime(date):
 
     """
     new_date_text = str(date)
-    ctx.log.debug("util.format_datetime: date class type: " + str(type(date)) + " with value: " + str(date))
+    log_debug("util.format_datetime: date class type: {} with value: {}", type(date), date)
     try:
         if isinstance(date, int):
             # Convert date to float from int
@@ -176,7 +205,7 @@ def format_datetime(date):
         elif isinstance(date, float):
             new_date = datetime.fromtimestamp(date)
         else:
-            ctx.log.error(
+            log_error(
                 "Error: expiry date provided in the cookie is not in the correct format " + str(type(date)))
             pass
 
@@ -184,14 +213,14 @@ def format_datetime(date):
         if new_date.tzname() is None:
             new_date_text = new_date_text + 'Z'
     except Exception:
-        ctx.log.error("Unexpected error " + sys.exc_info()[0])
+        log_error("Unexpected error " + sys.exc_info()[0])
         pass
     finally:
         return new_date_text
 
 
 def format_unix_timestamp(timestamp):
-    ctx.log.debug(f'format unix timestamp {str(timestamp)} of type {str(type(timestamp))}')
+    log_debug('format unix timestamp {} of type {}', timestamp, type(timestamp))
     new_date_text = timestamp
     try:
         timestamp = float(timestamp)/1000
@@ -200,7 +229,7 @@ def format_unix_timestamp(timestamp):
         if new_date.tzname() is None:
             new_date_text = new_date_text + 'Z'
     except Exception:
-        ctx.log.warning(f'could not format unix timestamp {timestamp}')
+        log_warning(f'could not format unix timestamp {timestamp}')
         pass
     finally:
         return new_date_text
@@ -317,9 +346,9 @@ def dev_web_parse_qsl(qs, keep_blank_values=False, strict_parsing=False,
 
 def is_ignore_hosts(host) -> bool:
     """ this function checking for matches between hosts and ignore_hosts list """
-    if not HOSTS_TO_IGNORE: # HOSTS_TO_IGNORE is None
-        return False
-    for rex in HOSTS_TO_IGNORE:
-        if rex.match(host):
-            return True
-    return False
+    return FLOW_ROUTER.get_host_route(host) == FlowRouter.ROUTE_IGNORED
+
+
+def get_flow_route(flow) -> str:
+    """ the route of an HTTP flow (control, ignored or record), see FlowRouter """
+    return FLOW_ROUTER.get_route(flow)